@@ -0,0 +1,35 @@
+"""Add point coordinates
+
+Revision ID: 2c4e8a7d915b
+Revises: f1b6c0e93a52
+Create Date: 2026-10-19 23:26:51.730164
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c4e8a7d915b'
+down_revision: Union[str, None] = 'f1b6c0e93a52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # The table is created by the bot with all its columns on a fresh database
+    if 'points' not in inspector.get_table_names():
+        return
+    columns = [column['name'] for column in inspector.get_columns('points')]
+    if 'latitude' in columns:
+        return
+    op.add_column('points', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('points', sa.Column('longitude', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('points', 'longitude')
+    op.drop_column('points', 'latitude')
@@ -0,0 +1,39 @@
+"""Add daily statistics rollups
+
+Revision ID: 3b9e0f6c27d1
+Revises: 7d4a5132a520
+Create Date: 2026-10-19 17:40:12.204716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9e0f6c27d1'
+down_revision: Union[str, None] = '7d4a5132a520'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if 'stats_daily' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'stats_daily',
+        sa.Column('entity_type', sa.String(), primary_key=True),
+        sa.Column('entity_id', sa.Integer(), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('views', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('new_visitors', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('likes', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('dislikes', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_index('ix_stats_daily_day', 'stats_daily', ['day'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stats_daily_day', table_name='stats_daily')
+    op.drop_table('stats_daily')
@@ -0,0 +1,39 @@
+"""Add interaction events
+
+Revision ID: 5e7a19c3d820
+Revises: c52d8e1f0a94
+Create Date: 2026-10-19 20:31:09.655120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e7a19c3d820'
+down_revision: Union[str, None] = 'c52d8e1f0a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if 'interaction_events' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.execute("""
+        CREATE TABLE interaction_events (
+            created_at timestamptz NOT NULL,
+            event_type smallint NOT NULL,
+            user_id bigint NOT NULL,
+            excursion_id integer,
+            entity_id integer,
+            value smallint
+        ) PARTITION BY RANGE (created_at)
+    """)
+    # The monthly partitions are created by the bot ahead of time, the default one keeps the events if it did not
+    op.execute("CREATE TABLE interaction_events_default PARTITION OF interaction_events DEFAULT")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE interaction_events")
@@ -0,0 +1,33 @@
+"""Add media objects
+
+Revision ID: 7d4a5132a520
+Revises: 800e93f25d19
+Create Date: 2026-10-19 15:12:40.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d4a5132a520'
+down_revision: Union[str, None] = '800e93f25d19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if 'media_objects' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'media_objects',
+        sa.Column('key', sa.String(), primary_key=True),
+        sa.Column('refcount', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('size', sa.BigInteger(), nullable=False, server_default='0'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('media_objects')
@@ -0,0 +1,33 @@
+"""Add catalogue version
+
+Revision ID: 800e93f25d19
+Revises: c7f35aa47db7
+Create Date: 2026-10-19 13:05:52.140377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '800e93f25d19'
+down_revision: Union[str, None] = 'c7f35aa47db7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if 'catalogue_meta' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'catalogue_meta',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('version', sa.BigInteger(), nullable=False, server_default='0'),
+    )
+    op.execute("INSERT INTO catalogue_meta (id, version) VALUES (1, 0)")
+
+
+def downgrade() -> None:
+    op.drop_table('catalogue_meta')
@@ -0,0 +1,33 @@
+"""Add media upload state
+
+Revision ID: 9f2b7e4c1d60
+Revises: 2c4e8a7d915b
+Create Date: 2026-10-20 10:41:09.362817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f2b7e4c1d60'
+down_revision: Union[str, None] = '2c4e8a7d915b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'media_objects' not in inspector.get_table_names():
+        return
+    columns = [column['name'] for column in inspector.get_columns('media_objects')]
+    if 'is_uploaded' in columns:
+        return
+    # The objects counted so far were registered by the uploads that completed
+    op.add_column('media_objects', sa.Column('is_uploaded', sa.Boolean(), nullable=False, server_default=sa.true()))
+
+
+def downgrade() -> None:
+    op.drop_column('media_objects', 'is_uploaded')
@@ -0,0 +1,43 @@
+"""Add parent and chat indexes
+
+Revision ID: a8d3f26b41e7
+Revises: 5e7a19c3d820
+Create Date: 2026-10-19 21:12:40.208531
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8d3f26b41e7'
+down_revision: Union[str, None] = '5e7a19c3d820'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Loads of the points and information parts by parent, the foreign key checks of the deletes
+# of the excursions and points, the lookups of the users by chat
+INDEXES = (
+    ('ix_points_parent_id', 'points', 'parent_id'),
+    ('ix_information_parts_parent_id', 'information_parts', 'parent_id'),
+    ('ix_user_states_chat_id', 'user_states', 'chat_id'),
+)
+
+
+def upgrade() -> None:
+    # The tables missing on a fresh database are created by the bot together with their indexes
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    # Built concurrently outside of the migration transaction, so the bot keeps writing to the tables meanwhile
+    with op.get_context().autocommit_block():
+        for index_name, table_name, column_name in INDEXES:
+            if table_name not in existing_tables:
+                continue
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table_name} ({column_name})')
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for index_name, _, _ in INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')
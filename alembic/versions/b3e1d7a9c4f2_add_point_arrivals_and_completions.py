@@ -0,0 +1,55 @@
+"""Add point arrivals and excursion completions
+
+Revision ID: b3e1d7a9c4f2
+Revises: 9f2b7e4c1d60
+Create Date: 2026-10-20 14:12:36.527904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e1d7a9c4f2'
+down_revision: Union[str, None] = '9f2b7e4c1d60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'point_arrivals' not in existing_tables:
+        op.create_table(
+            'point_arrivals',
+            sa.Column('excursion_id', sa.Integer(), primary_key=True),
+            sa.Column('point_id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.BigInteger(), primary_key=True),
+        )
+        # The users who reached the points before the arrivals were recorded are the visitors of the points
+        if 'points' in existing_tables:
+            op.execute("""
+                INSERT INTO point_arrivals (excursion_id, point_id, user_id)
+                SELECT DISTINCT parent_id, id, visitor::bigint
+                FROM points, jsonb_array_elements_text(visitors) AS visitor
+                WHERE parent_id IS NOT NULL AND jsonb_typeof(visitors) = 'array'
+            """)
+    if 'excursion_completions' not in existing_tables:
+        op.create_table(
+            'excursion_completions',
+            sa.Column('excursion_id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.BigInteger(), primary_key=True),
+        )
+        # The visitors of an excursion are the users who completed it
+        if 'excursions' in existing_tables:
+            op.execute("""
+                INSERT INTO excursion_completions (excursion_id, user_id)
+                SELECT DISTINCT id, visitor::bigint FROM excursions, jsonb_array_elements_text(visitors) AS visitor
+                WHERE jsonb_typeof(visitors) = 'array'
+            """)
+
+
+def downgrade() -> None:
+    op.drop_table('excursion_completions')
+    op.drop_table('point_arrivals')
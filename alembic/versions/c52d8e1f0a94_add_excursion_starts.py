@@ -0,0 +1,45 @@
+"""Add excursion starts
+
+Revision ID: c52d8e1f0a94
+Revises: 3b9e0f6c27d1
+Create Date: 2026-10-19 19:05:47.913384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52d8e1f0a94'
+down_revision: Union[str, None] = '3b9e0f6c27d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'excursion_starts' in existing_tables:
+        return
+    op.create_table(
+        'excursion_starts',
+        sa.Column('excursion_id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.BigInteger(), primary_key=True),
+    )
+    # The catalogue tables are created by the bot after the migrations on a fresh database, nothing to backfill
+    if 'points' not in existing_tables or 'excursions' not in existing_tables:
+        return
+    # The users who walked the excursions before the starts were recorded are the visitors of their points
+    op.execute("""
+        INSERT INTO excursion_starts (excursion_id, user_id)
+        SELECT parent_id, visitor::bigint FROM points, jsonb_array_elements_text(visitors) AS visitor
+        WHERE parent_id IS NOT NULL AND jsonb_typeof(visitors) = 'array'
+        UNION
+        SELECT id, visitor::bigint FROM excursions, jsonb_array_elements_text(visitors) AS visitor
+        WHERE jsonb_typeof(visitors) = 'array'
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('excursion_starts')
@@ -0,0 +1,43 @@
+"""Allocate ids in blocks
+
+Revision ID: c7f35aa47db7
+Revises: ea16b49d2f9a
+Create Date: 2026-10-19 12:41:05.774012
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7f35aa47db7'
+down_revision: Union[str, None] = 'ea16b49d2f9a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match ID_BLOCK_SIZE of src.database.models at the time of the migration
+ID_BLOCK_SIZE = 50
+TABLES = ('excursions', 'points', 'information_parts')
+
+
+def upgrade() -> None:
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    for table_name in TABLES:
+        if table_name not in existing_tables:
+            continue
+        sequence_name = f"{table_name}_id_seq"
+        op.execute(f"CREATE SEQUENCE IF NOT EXISTS {sequence_name}")
+        # Start the first block after every id that was already used
+        op.execute(f"SELECT setval('{sequence_name}', GREATEST("
+                   f"(SELECT COALESCE(MAX(id), 0) FROM {table_name}), "
+                   f"(SELECT last_value FROM {sequence_name})) + 1, false)")
+        op.execute(f"ALTER SEQUENCE {sequence_name} INCREMENT BY {ID_BLOCK_SIZE}")
+
+
+def downgrade() -> None:
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    for table_name in TABLES:
+        if table_name in existing_tables:
+            op.execute(f"ALTER SEQUENCE {table_name}_id_seq INCREMENT BY 1")
@@ -0,0 +1,33 @@
+"""Add media duration
+
+Revision ID: d5c8a1e7f340
+Revises: b3e1d7a9c4f2
+Create Date: 2026-10-20 15:27:51.604218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5c8a1e7f340'
+down_revision: Union[str, None] = 'b3e1d7a9c4f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'media_objects' not in inspector.get_table_names():
+        return
+    columns = [column['name'] for column in inspector.get_columns('media_objects')]
+    if 'duration' in columns:
+        return
+    # The tracks stored so far keep the duration in the S3 metadata only, it is sent with their uploads
+    op.add_column('media_objects', sa.Column('duration', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('media_objects', 'duration')
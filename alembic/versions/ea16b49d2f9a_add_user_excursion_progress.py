@@ -0,0 +1,43 @@
+"""Add user excursion progress
+
+Revision ID: ea16b49d2f9a
+Revises: 964d1c9c3695
+Create Date: 2026-10-19 10:12:41.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ea16b49d2f9a'
+down_revision: Union[str, None] = '964d1c9c3695'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _get_columns(table_name: str) -> set[str] | None:
+    """Returns the column names of the table or None if the table was not created yet."""
+    inspector = sa.inspect(op.get_bind())
+    if table_name not in inspector.get_table_names():
+        return None
+    return {column['name'] for column in inspector.get_columns(table_name)}
+
+
+def upgrade() -> None:
+    # Tables missing on a fresh database are created by the bot with the full schema
+    columns = _get_columns('user_states')
+    if columns is None:
+        return
+    if 'current_excursion_id' not in columns:
+        op.add_column('user_states', sa.Column('current_excursion_id', sa.Integer(), nullable=True))
+    if 'current_excursion_step' not in columns:
+        op.add_column('user_states', sa.Column('current_excursion_step', sa.Integer(), nullable=True,
+                                               server_default='-1'))
+
+
+def downgrade() -> None:
+    op.drop_column('user_states', 'current_excursion_step')
+    op.drop_column('user_states', 'current_excursion_id')
@@ -0,0 +1,39 @@
+"""Add point position
+
+Revision ID: f1b6c0e93a52
+Revises: a8d3f26b41e7
+Create Date: 2026-10-19 22:03:18.417952
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b6c0e93a52'
+down_revision: Union[str, None] = 'a8d3f26b41e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # The table is created by the bot with all its columns on a fresh database
+    if 'points' not in inspector.get_table_names():
+        return
+    columns = [column['name'] for column in inspector.get_columns('points')]
+    if 'position' in columns:
+        return
+    op.add_column('points', sa.Column('position', sa.Integer(), nullable=False, server_default='0'))
+    # The points were loaded in the order of their ids, which is the order of their creation
+    op.execute("""
+        UPDATE points SET position = numbered.position
+        FROM (SELECT id, row_number() OVER (PARTITION BY parent_id ORDER BY id) - 1 AS position FROM points) AS numbered
+        WHERE points.id = numbered.id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('points', 'position')
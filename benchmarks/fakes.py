@@ -0,0 +1,187 @@
+"""
+Local stand-ins of the external services used by the benchmarks: a recording Telegram transport,
+an in-memory S3 bucket and a counter of the executed SQL statements.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+from io import BytesIO
+
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import EndpointConnectionError
+from botocore.response import StreamingBody
+from sqlalchemy import event
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+
+import src.data.s3bucket as s3bucket
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "VolkAround", "username": "volkaround_bot"}
+# Telegram API methods returning several messages or a plain boolean instead of a message
+MESSAGES_LIST_METHODS = {"sendMediaGroup"}
+BOOLEAN_METHODS = {"answerCallbackQuery", "deleteMessage", "setMyCommands", "deleteWebhook"}
+
+
+class RecordingRequest(BaseRequest):
+    """Telegram transport that answers every API call locally and counts the calls by method."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls = Counter()
+        self.message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        parameters = request_data.parameters if request_data else {}
+        return HTTPStatus.OK, json.dumps({"ok": True, "result": self._build_result(api_method, parameters)}).encode()
+
+    def _build_result(self, api_method: str, parameters: dict):
+        if api_method == "getMe":
+            return BOT_USER
+        if api_method in BOOLEAN_METHODS:
+            return True
+        chat_id = parameters.get("chat_id", 1)
+        if api_method in MESSAGES_LIST_METHODS:
+            return [self._build_message(chat_id) for _ in parameters.get("media", [])]
+        return self._build_message(chat_id)
+
+    def _build_message(self, chat_id: int) -> dict:
+        return {"message_id": next(self.message_ids), "date": int(time.time()), "from": BOT_USER,
+                "chat": {"id": chat_id, "type": "private"}}
+
+
+class UpdateFactory:
+    """Builds the synthetic updates the way Telegram sends them to the bot."""
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+
+    @staticmethod
+    def build_user(user_id: int, username: str) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": username, "username": username}
+
+    def _build_message(self, user: dict, text: str, **extra) -> dict:
+        return {"message_id": next(self.message_ids), "date": int(time.time()), "from": user,
+                "chat": {"id": user["id"], "type": "private"}, "text": text, **extra}
+
+    def command(self, user: dict, command: str) -> Update:
+        text = f"/{command}"
+        message = self._build_message(user, text, entities=[{"type": "bot_command", "offset": 0,
+                                                             "length": len(text)}])
+        return Update.de_json({"update_id": next(self.update_ids), "message": message}, self.bot)
+
+    def text(self, user: dict, text: str) -> Update:
+        return Update.de_json({"update_id": next(self.update_ids), "message": self._build_message(user, text)},
+                              self.bot)
+
+    def callback(self, user: dict, data: str) -> Update:
+        message = self._build_message(BOT_USER, "Previous message") | {"chat": {"id": user["id"], "type": "private"}}
+        callback_query = {"id": str(next(self.update_ids)), "from": user, "chat_instance": str(user["id"]),
+                          "data": data, "message": message}
+        return Update.de_json({"update_id": next(self.update_ids), "callback_query": callback_query}, self.bot)
+
+
+class InMemoryS3:
+    """
+    Serves the S3 calls of the boto3 clients from memory. The calls go through the whole botocore
+    pipeline and are answered right before the HTTP request would be sent.
+    """
+
+    def __init__(self, latency: float = 0.0, endpoint_url: str | None = None) -> None:
+        self.latency = latency
+        # Serves only the clients of this endpoint if it is set, e.g. to stand in for a primary and an edge
+        self.endpoint_url = endpoint_url
+        self.is_available = True
+        self.objects = dict()
+        self.objects_metadata = dict()
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def install(self) -> None:
+        """Attaches the stand-in to every S3 client created by the application."""
+        create_client = s3bucket.get_s3_client
+
+        def get_s3_client_with_stand_in(*args, **kwargs):
+            client = create_client(*args, **kwargs)
+            if self.endpoint_url is None or client.meta.endpoint_url.rstrip("/") == self.endpoint_url.rstrip("/"):
+                self.attach(client)
+            return client
+
+        s3bucket.get_s3_client = get_s3_client_with_stand_in
+
+    def attach(self, client) -> None:
+        client.meta.events.register("before-parameter-build.s3", self._capture_params)
+        client.meta.events.register("before-call.s3", self._handle_call)
+
+    def put(self, key: str, data: bytes) -> None:
+        self.objects[key] = data
+
+    @staticmethod
+    def _capture_params(params, context, **kwargs) -> None:
+        context["in_memory_s3_params"] = dict(params)
+
+    def _handle_call(self, model, context, **kwargs):
+        operation = model.name
+        params = context["in_memory_s3_params"]
+        key = params.get("Key")
+        with self.lock:
+            self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.is_available:
+            raise EndpointConnectionError(endpoint_url=self.endpoint_url)
+        if operation == "PutObject":
+            body = params.get("Body", b"")
+            self.objects[key] = body.read() if hasattr(body, "read") else bytes(body)
+            self.objects_metadata[key] = params.get("Metadata", dict())
+            return self._response(HTTPStatus.OK, {"ETag": '"in-memory"'})
+        if operation == "DeleteObject":
+            self.objects.pop(key, None)
+            self.objects_metadata.pop(key, None)
+            return self._response(HTTPStatus.NO_CONTENT, {})
+        if operation in ("HeadObject", "GetObject"):
+            data = self.objects.get(key)
+            if data is None:
+                return self._response(HTTPStatus.NOT_FOUND, {"Error": {"Code": "404", "Message": "Not Found"}})
+            parsed = {"ContentLength": len(data), "Metadata": self.objects_metadata.get(key, dict())}
+            if operation == "GetObject":
+                parsed["Body"] = StreamingBody(BytesIO(data), len(data))
+            return self._response(HTTPStatus.OK, parsed)
+        return self._response(HTTPStatus.OK, {})
+
+    @staticmethod
+    def _response(status_code: int, parsed: dict):
+        parsed["ResponseMetadata"] = {"HTTPStatusCode": status_code, "HTTPHeaders": {}}
+        return AWSResponse("", status_code, {}, None), parsed
+
+
+class StatementCounter:
+    """Counts the SQL statements executed by the engine."""
+
+    def __init__(self, engine) -> None:
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args, **kwargs) -> None:
+        self.count += 1
@@ -0,0 +1,263 @@
+"""
+End-to-end benchmark of the bot handlers.
+
+Drives the handlers through the application with synthetic updates: the full tour of the users
+and the excursion editing of an admin. Telegram is replaced with a recording transport and S3 with
+an in-memory bucket, the database is the one of DATABASE_URL (use a local one). A synthetic excursion
+is created for the run and deleted afterwards.
+
+For every handler reports the latency and the numbers of S3 calls, SQL statements and Telegram API calls,
+and stores the results as JSON to compare the commits:
+    python -m benchmarks.handler_benchmark --output before.json
+    python -m benchmarks.handler_benchmark --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import tuple_
+
+os.environ.setdefault("BUCKET_NAME", "volkaround-benchmark")
+
+from benchmarks.fakes import InMemoryS3, RecordingRequest, StatementCounter, UpdateFactory
+from src.components.excursion.excursion import Excursion
+from src.components.excursion.point.information_part import InformationPart
+from src.components.excursion.point.point import Point
+from src.components.messages.bot import Bot
+from src.constants import *
+from src.data.catalogue_snapshot import CatalogueSnapshot
+from src.data.id_allocator import IdAllocator
+from src.data.postgres_data_loader import PostgresLoadManager
+from src.database.models import UserStateModel, StatsDailyModel, ExcursionStartModel, InteractionEventModel, \
+    MediaObjectModel, PointArrivalModel, ExcursionCompletionModel
+from src.database.session import create_session
+
+BENCHMARK_TOKEN = "1:benchmark"
+BENCHMARK_EXCURSION_NAME = "Benchmark excursion"
+ADMIN_USERNAME = sorted(ADMINS_LIST)[0]
+FIRST_USER_ID = 10 ** 9
+FILE_SIZE = 200 * 1024
+BENCHMARK_MEDIA_DIRECTORY = "benchmark/"
+
+
+def file_url(key: str) -> str:
+    return f"https://volkaround-benchmark.s3.amazonaws.com/{key}"
+
+
+def seed_catalogue(session, s3: InMemoryS3, points_num: int) -> Excursion:
+    """Creates a published excursion with the media of every point stored in the in-memory bucket."""
+    id_allocator = IdAllocator(session)
+    excursion = Excursion(id_allocator.next_excursion_id(), BENCHMARK_EXCURSION_NAME, is_draft=False)
+    for point_index in range(points_num):
+        point_id = id_allocator.next_point_id()
+        media = {name: f"{BENCHMARK_MEDIA_DIRECTORY}{point_id}/{name}" for name in ("location.jpg", "photo.jpg", "audio.mp3")}
+        for key in media.values():
+            s3.put(key, os.urandom(FILE_SIZE))
+        extra_part = InformationPart(id_allocator.next_information_part_id(), parent_id=point_id,
+                                     part_name=f"Extra {point_index + 1}", text="Дополнительный текст. " * 30)
+        excursion.points.append(Point(point_id, excursion.get_id(), part_name=f"Point {point_index + 1}",
+                                      location_photo=file_url(media["location.jpg"]),
+                                      photos=[file_url(media["photo.jpg"])], audio=[file_url(media["audio.mp3"])],
+                                      text="Текст точки (с разметкой)! " * 50, extra_information_points=[extra_part]))
+    data_loader = PostgresLoadManager(session)
+    data_loader.save_excursion(excursion)
+    for point in excursion.get_points():
+        data_loader.save_point(point)
+        for extra_part in point.get_extra_information_points():
+            data_loader.save_information_part(extra_part)
+    return excursion
+
+
+def remove_catalogue(session, excursion: Excursion) -> None:
+    data_loader = PostgresLoadManager(session)
+    for point in excursion.get_points():
+        for extra_part in point.get_extra_information_points():
+            data_loader.delete_information_part(extra_part.get_id())
+        data_loader.delete_point(point.get_id())
+    data_loader.delete_excursion(excursion.get_id())
+
+
+def remove_benchmark_data(session, excursion: Excursion, users_num: int) -> None:
+    """Deletes the synthetic catalogue, the users including the admin and every row the bot wrote for them."""
+    stats_entities = [(excursion.stats_entity_type, excursion.get_id())]
+    for point in excursion.get_points():
+        stats_entities.append((point.stats_entity_type, point.get_id()))
+        stats_entities.extend((extra_part.stats_entity_type, extra_part.get_id())
+                              for extra_part in point.get_extra_information_points())
+    remove_catalogue(session, excursion)
+    user_ids = (FIRST_USER_ID - 1, FIRST_USER_ID + users_num)
+    session.query(StatsDailyModel).filter(
+        tuple_(StatsDailyModel.entity_type, StatsDailyModel.entity_id).in_(stats_entities)
+    ).delete(synchronize_session=False)
+    for model in (ExcursionStartModel, PointArrivalModel, ExcursionCompletionModel):
+        session.query(model).filter_by(excursion_id=excursion.get_id()).delete(synchronize_session=False)
+    session.query(InteractionEventModel).filter(
+        InteractionEventModel.user_id.between(*user_ids)).delete(synchronize_session=False)
+    session.query(UserStateModel).filter(UserStateModel.user_id.between(*user_ids)).delete(synchronize_session=False)
+    session.query(MediaObjectModel).filter(
+        MediaObjectModel.key.startswith(BENCHMARK_MEDIA_DIRECTORY)).delete(synchronize_session=False)
+    session.commit()
+
+
+class HandlerRecorder:
+    """Runs the updates through the application and accumulates the costs per handler."""
+
+    def __init__(self, bot: Bot, request: RecordingRequest, s3: InMemoryS3, statements: StatementCounter) -> None:
+        self.bot = bot
+        self.request = request
+        self.s3 = s3
+        self.statements = statements
+        self.samples = defaultdict(lambda: defaultdict(list))
+        self.telegram_methods = defaultdict(lambda: defaultdict(int))
+
+    async def process(self, handler_name: str, update) -> None:
+        telegram_calls = self.request.calls.copy()
+        s3_calls = sum(self.s3.calls.values())
+        statements = self.statements.count
+        started_at = time.perf_counter()
+        await self.bot.application.process_update(update)
+        latency = time.perf_counter() - started_at
+        telegram_calls = self.request.calls - telegram_calls
+        samples = self.samples[handler_name]
+        samples["latency"].append(latency)
+        samples["telegram_calls"].append(sum(telegram_calls.values()))
+        samples["s3_calls"].append(sum(self.s3.calls.values()) - s3_calls)
+        samples["db_statements"].append(self.statements.count - statements)
+        for method, calls_num in telegram_calls.items():
+            self.telegram_methods[handler_name][method] += calls_num
+
+    def get_results(self) -> dict:
+        results = dict()
+        for handler_name, samples in self.samples.items():
+            latencies = sorted(samples["latency"])
+            calls_num = len(latencies)
+            results[handler_name] = {
+                "calls": calls_num,
+                "latency_ms": {
+                    "mean": statistics.fmean(latencies) * 1000,
+                    "p50": latencies[calls_num // 2] * 1000,
+                    "p95": latencies[min(calls_num - 1, int(calls_num * 0.95))] * 1000,
+                    "max": latencies[-1] * 1000,
+                },
+                "telegram_calls": statistics.fmean(samples["telegram_calls"]),
+                "s3_calls": statistics.fmean(samples["s3_calls"]),
+                "db_statements": statistics.fmean(samples["db_statements"]),
+                "telegram_methods": {method: calls_num_by_method / calls_num for method, calls_num_by_method
+                                     in sorted(self.telegram_methods[handler_name].items())},
+            }
+        return results
+
+
+async def run_tour(recorder: HandlerRecorder, factory: UpdateFactory, user: dict, excursion: Excursion) -> None:
+    """A user goes through the whole excursion, reading every extra part."""
+    await recorder.process("_start", factory.command(user, START_COMMAND))
+    await recorder.process("_show_excursions", factory.callback(user, SHOW_EXCURSIONS_CALLBACK))
+    await recorder.process("_start_excursion", factory.callback(user, f"{CHOOSE_CALLBACK}{excursion.get_id()}"))
+    for point in excursion.get_points():
+        await recorder.process("_handle_move_on", factory.callback(user, NEXT_POINT_CALLBACK))
+        await recorder.process("_handle_arrival", factory.callback(user, ARRIVED_CALLBACK))
+        for extra_part in point.get_extra_information_points():
+            await recorder.process("_handle_extra_part",
+                                   factory.callback(user, f"{EXTRA_PART_CALLBACK}{extra_part.get_id()}"))
+    await recorder.process("_complete_excursion", factory.callback(user, FINISH_CALLBACK))
+    await recorder.process("_give_feedback", factory.callback(user, FEEDBACK_POSITIVE_CALLBACK))
+
+
+async def run_admin_editing(recorder: HandlerRecorder, factory: UpdateFactory, admin: dict,
+                            excursion: Excursion) -> None:
+    """An admin opens the excursion, looks at its statistics and edits its fields."""
+    await recorder.process("_show_excursions", factory.callback(admin, SHOW_EXCURSIONS_CALLBACK))
+    await recorder.process("_start_excursion", factory.callback(admin, f"{CHOOSE_CALLBACK}{excursion.get_id()}"))
+    await recorder.process("_send_stats", factory.callback(admin, f"{EXCURSION_STATS_CALLBACK}{excursion.get_id()}"))
+    await recorder.process("_edit_excursion", factory.callback(admin, f"{EDIT_EXCURSION_CALLBACK}{excursion.get_id()}"))
+    await recorder.process("_handle_messages", factory.text(admin, BENCHMARK_EXCURSION_NAME))
+    await recorder.process("_handle_next_field", factory.callback(admin, f"{BOOLEAN_FIELD_CALLBACK}no"))
+    await recorder.process("_handle_messages", factory.text(admin, "90"))
+
+
+async def run_benchmark(points_num: int, users_num: int, telegram_latency: float, s3_latency: float) -> dict:
+    s3 = InMemoryS3(latency=s3_latency)
+    s3.install()
+    session = create_session()
+    excursion = seed_catalogue(session, s3, points_num)
+    request = RecordingRequest(latency=telegram_latency)
+    with tempfile.TemporaryDirectory() as snapshot_directory:
+        catalogue_snapshot = CatalogueSnapshot(os.path.join(snapshot_directory, "catalogue.snapshot"))
+        bot = Bot(BENCHMARK_TOKEN, session, catalogue_snapshot, request=request)
+        bot.register_handlers()
+        recorder = HandlerRecorder(bot, request, s3, StatementCounter(session.get_bind()))
+        factory = UpdateFactory(bot.application.bot)
+        await bot.application.initialize()
+        # The hooks of run_polling, they start and stop the background flushing and the events partitioning
+        await bot.application.post_init(bot.application)
+        try:
+            excursion = bot.get_excursion_by_id(excursion.get_id())
+            for user_index in range(users_num):
+                user = factory.build_user(FIRST_USER_ID + user_index, f"benchmark_user_{user_index}")
+                await run_tour(recorder, factory, user, excursion)
+            await run_admin_editing(recorder, factory, factory.build_user(FIRST_USER_ID - 1, ADMIN_USERNAME),
+                                    excursion)
+        finally:
+            await bot.application.shutdown()
+            await bot.application.post_shutdown(bot.application)
+            catalogue_snapshot.close()
+            remove_benchmark_data(session, excursion, users_num)
+    return recorder.get_results()
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: dict, baseline: dict | None) -> None:
+    print(f"{'handler':<22}{'calls':>6}{'mean, ms':>10}{'p95, ms':>10}{'telegram':>10}{'s3':>8}{'sql':>8}"
+          + (f"{'mean vs base':>14}" if baseline else ""))
+    for handler_name, result in results.items():
+        line = (f"{handler_name:<22}{result['calls']:>6}{result['latency_ms']['mean']:>10.2f}"
+                f"{result['latency_ms']['p95']:>10.2f}{result['telegram_calls']:>10.1f}{result['s3_calls']:>8.1f}"
+                f"{result['db_statements']:>8.1f}")
+        if baseline:
+            baseline_result = baseline.get(handler_name)
+            if baseline_result:
+                change = result['latency_ms']['mean'] / baseline_result['latency_ms']['mean'] - 1
+                line += f"{change:>+14.0%}"
+            else:
+                line += f"{'new':>14}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=10, help="Points of the synthetic excursion")
+    parser.add_argument("--users", type=int, default=20, help="Users going through the whole excursion")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="Seconds per Telegram API call")
+    parser.add_argument("--s3-latency", type=float, default=0.0, help="Seconds per S3 call")
+    parser.add_argument("--output", help="Path of the JSON file to store the results to")
+    parser.add_argument("--compare", help="Path of the JSON results of a previous run")
+    args = parser.parse_args()
+
+    handler_results = asyncio.run(run_benchmark(args.points, args.users, args.telegram_latency, args.s3_latency))
+    baseline_results = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline_results = json.load(baseline_file)["handlers"]
+    print_results(handler_results, baseline_results)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({
+                "commit": get_commit(),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "parameters": vars(args),
+                "handlers": handler_results,
+            }, output_file, indent=2)
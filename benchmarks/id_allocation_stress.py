@@ -0,0 +1,54 @@
+"""
+Multi-process stress check of IdAllocator: every worker allocates ids from its own database session,
+the check fails if any id was handed out twice.
+
+Run from the repository root against a disposable database:
+    DATABASE_URL=postgresql://... python -m benchmarks.id_allocation_stress --workers 8 --ids 5000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:benchmark")
+
+
+def allocate_ids(ids_number: int) -> dict[str, list[int]]:
+    from src.data.id_allocator import IdAllocator
+    from src.database.session import create_session
+
+    session = create_session()
+    allocator = IdAllocator(session)
+    allocated = {"excursions": [], "points": [], "information_parts": []}
+    for _ in range(ids_number):
+        allocated["excursions"].append(allocator.next_excursion_id())
+        allocated["points"].append(allocator.next_point_id())
+        allocated["information_parts"].append(allocator.next_information_part_id())
+    session.close()
+    return allocated
+
+
+def run_check(workers: int, ids_number: int) -> bool:
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.map(allocate_ids, [ids_number] * workers)
+    elapsed = time.perf_counter() - start
+
+    is_valid = True
+    for table_name in ("excursions", "points", "information_parts"):
+        all_ids = [allocated_id for result in results for allocated_id in result[table_name]]
+        duplicates = len(all_ids) - len(set(all_ids))
+        print(f"{table_name}: {len(all_ids)} ids, {duplicates} duplicates")
+        is_valid = is_valid and duplicates == 0
+    total = workers * ids_number * 3
+    print(f"Allocated {total} ids in {elapsed:.2f}s ({total / elapsed:.0f} ids/s)")
+    return is_valid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--ids", type=int, default=5000, help="Ids of every kind allocated by each worker")
+    args = parser.parse_args()
+    sys.exit(0 if run_check(args.workers, args.ids) else 1)
@@ -0,0 +1,210 @@
+"""
+Load generator simulating many users walking the excursion at the same time.
+
+The users arrive at the given rate and go through the whole excursion with think time between the steps,
+opening the extra parts and switching the text/audio mode on the way. The updates are processed by the
+application's update processor, so its concurrency limit applies as in production. Telegram and S3 are the
+stand-ins of the benchmarks with the configured latencies, the database is the one of DATABASE_URL.
+
+Reports the throughput, the p50/p95/p99 latency per step type, the event loop lag and the peak RSS:
+    python -m benchmarks.load_generator --users 1000 --arrival-rate 50 --think-time 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+os.environ.setdefault("BUCKET_NAME", "volkaround-benchmark")
+
+from benchmarks.fakes import InMemoryS3, RecordingRequest, UpdateFactory
+from benchmarks.handler_benchmark import FIRST_USER_ID, BENCHMARK_TOKEN, seed_catalogue, remove_benchmark_data
+from src.components.excursion.excursion import Excursion
+from src.components.messages.bot import Bot
+from src.constants import *
+from src.data.catalogue_snapshot import CatalogueSnapshot
+from src.database.session import create_session
+
+LAG_PROBE_INTERVAL = 0.05  # Seconds
+
+
+def percentile(sorted_values: list[float], share: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * share))]
+
+
+class LoadRecorder:
+    """Processes the updates like the application does and keeps the latencies per step type."""
+
+    def __init__(self, bot: Bot) -> None:
+        self.bot = bot
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.current_step = dict()
+        self.active_walkers = 0
+        self.peak_walkers = 0
+
+    async def on_error(self, update, context) -> None:
+        step_type = self.current_step.get(update.effective_user.id, "unknown") if update else "unknown"
+        self.errors[f"{step_type}: {type(context.error).__name__}"] += 1
+
+    async def process(self, step_type: str, update) -> None:
+        application = self.bot.application
+        self.current_step[update.effective_user.id] = step_type
+        started_at = time.perf_counter()
+        await application.update_processor.process_update(update, application.process_update(update))
+        self.latencies[step_type].append(time.perf_counter() - started_at)
+
+
+class LagMonitor:
+    """Measures how late the event loop wakes up a sleeping task."""
+
+    def __init__(self) -> None:
+        self.lags = list()
+        self.task = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._probe())
+
+    async def stop(self) -> None:
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    async def _probe(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected_at = loop.time() + LAG_PROBE_INTERVAL
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self.lags.append(max(0.0, loop.time() - expected_at))
+
+
+async def walk(recorder: LoadRecorder, factory: UpdateFactory, user: dict, excursion: Excursion,
+               randomizer: random.Random, args) -> None:
+    """A single user going through the whole excursion."""
+
+    async def step(step_type: str, update) -> None:
+        await recorder.process(step_type, update)
+        if args.think_time:
+            await asyncio.sleep(randomizer.expovariate(1 / args.think_time))
+
+    recorder.active_walkers += 1
+    recorder.peak_walkers = max(recorder.peak_walkers, recorder.active_walkers)
+    try:
+        await step("start", factory.command(user, START_COMMAND))
+        await step("show_excursions", factory.callback(user, SHOW_EXCURSIONS_CALLBACK))
+        await step("choose_excursion", factory.callback(user, f"{CHOOSE_CALLBACK}{excursion.get_id()}"))
+        for point in excursion.get_points():
+            await step("move_on", factory.callback(user, NEXT_POINT_CALLBACK))
+            await step("arrival", factory.callback(user, ARRIVED_CALLBACK))
+            if randomizer.random() < args.mode_switch_probability:
+                await step("change_mode", factory.command(user, CHANGE_MODE_COMMAND))
+            for extra_part in point.get_extra_information_points():
+                if randomizer.random() < args.extra_part_probability:
+                    await step("extra_part", factory.callback(user, f"{EXTRA_PART_CALLBACK}{extra_part.get_id()}"))
+        await step("complete", factory.callback(user, FINISH_CALLBACK))
+        await step("feedback", factory.callback(user, FEEDBACK_POSITIVE_CALLBACK))
+    finally:
+        recorder.active_walkers -= 1
+
+
+async def run_load(args) -> dict:
+    s3 = InMemoryS3(latency=args.s3_latency)
+    s3.install()
+    session = create_session()
+    excursion = seed_catalogue(session, s3, args.points)
+    request = RecordingRequest(latency=args.telegram_latency)
+    randomizer = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as snapshot_directory:
+        catalogue_snapshot = CatalogueSnapshot(os.path.join(snapshot_directory, "catalogue.snapshot"))
+        bot = Bot(BENCHMARK_TOKEN, session, catalogue_snapshot, request=request)
+        bot.register_handlers()
+        recorder = LoadRecorder(bot)
+        bot.application.add_error_handler(recorder.on_error)
+        factory = UpdateFactory(bot.application.bot)
+        lag_monitor = LagMonitor()
+        await bot.application.initialize()
+        await bot.application.post_init(bot.application)
+        try:
+            excursion = bot.get_excursion_by_id(excursion.get_id())
+            lag_monitor.start()
+            started_at = time.perf_counter()
+            walkers = []
+            for user_index in range(args.users):
+                user = factory.build_user(FIRST_USER_ID + user_index, f"load_user_{user_index}")
+                walkers.append(asyncio.create_task(walk(recorder, factory, user, excursion, randomizer, args)))
+                await asyncio.sleep(randomizer.expovariate(args.arrival_rate))
+            await asyncio.gather(*walkers)
+            duration = time.perf_counter() - started_at
+            await lag_monitor.stop()
+        finally:
+            await bot.application.shutdown()
+            await bot.application.post_shutdown(bot.application)
+            catalogue_snapshot.close()
+            remove_benchmark_data(session, excursion, args.users)
+
+    steps_num = sum(len(latencies) for latencies in recorder.latencies.values())
+    lags = sorted(lag_monitor.lags)
+    return {
+        "parameters": vars(args),
+        "duration_s": duration,
+        "steps": steps_num,
+        "throughput_steps_per_s": steps_num / duration,
+        "peak_concurrent_users": recorder.peak_walkers,
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "event_loop_lag_ms": {"p50": percentile(lags, 0.5) * 1000, "p99": percentile(lags, 0.99) * 1000,
+                              "max": (lags[-1] if lags else 0.0) * 1000},
+        "telegram_calls": sum(request.calls.values()),
+        "s3_calls": sum(s3.calls.values()),
+        "errors": dict(recorder.errors),
+        "steps_latency_ms": {
+            step_type: {"count": len(latencies),
+                        "p50": percentile(sorted(latencies), 0.5) * 1000,
+                        "p95": percentile(sorted(latencies), 0.95) * 1000,
+                        "p99": percentile(sorted(latencies), 0.99) * 1000}
+            for step_type, latencies in recorder.latencies.items()
+        },
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"Duration: {report['duration_s']:.1f} s, steps: {report['steps']}, "
+          f"throughput: {report['throughput_steps_per_s']:.1f} steps/s")
+    print(f"Peak concurrent users: {report['peak_concurrent_users']}, peak RSS: {report['peak_rss_mib']:.0f} MiB")
+    lag = report["event_loop_lag_ms"]
+    print(f"Event loop lag: p50 {lag['p50']:.1f} ms, p99 {lag['p99']:.1f} ms, max {lag['max']:.1f} ms")
+    print(f"Telegram calls: {report['telegram_calls']}, S3 calls: {report['s3_calls']}")
+    print(f"{'step':<18}{'count':>8}{'p50, ms':>10}{'p95, ms':>10}{'p99, ms':>10}")
+    for step_type, latency in report["steps_latency_ms"].items():
+        print(f"{step_type:<18}{latency['count']:>8}{latency['p50']:>10.1f}{latency['p95']:>10.1f}"
+              f"{latency['p99']:>10.1f}")
+    for error, errors_num in report["errors"].items():
+        print(f"Error {error}: {errors_num}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="Users walking the excursion")
+    parser.add_argument("--arrival-rate", type=float, default=20, help="New users per second")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds between the steps of a user")
+    parser.add_argument("--points", type=int, default=10, help="Points of the synthetic excursion")
+    parser.add_argument("--extra-part-probability", type=float, default=0.5)
+    parser.add_argument("--mode-switch-probability", type=float, default=0.05)
+    parser.add_argument("--telegram-latency", type=float, default=0.05, help="Seconds per Telegram API call")
+    parser.add_argument("--s3-latency", type=float, default=0.02, help="Seconds per S3 call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Path of the JSON file to store the report to")
+    arguments = parser.parse_args()
+
+    load_report = asyncio.run(run_load(arguments))
+    print_report(load_report)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(load_report, output_file, indent=2)
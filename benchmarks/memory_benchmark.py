@@ -0,0 +1,89 @@
+"""
+Memory benchmark of the in-memory domain model for large user bases.
+
+Builds the user states and a catalogue whose points were visited by a share of the users,
+and reports the allocated bytes per user and per point.
+
+Run from the repository root:
+    python -m benchmarks.memory_benchmark --users 10000 100000 1000000
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+
+from src.components.excursion.excursion import Excursion
+from src.components.excursion.point.information_part import InformationPart
+from src.components.excursion.point.point import Point
+from src.components.user.user_state import UserState
+
+EXCURSIONS_NUM = 20
+POINTS_PER_EXCURSION = 15
+EXTRA_PARTS_PER_POINT = 2
+PAID_SHARE = 0.1
+ADMINS_NUM = 5
+
+
+def build_user_states(users_num: int) -> list[UserState]:
+    user_states = []
+    for user_id in range(1, users_num + 1):
+        paid_excursions = [user_id % EXCURSIONS_NUM + 1] if user_id % int(1 / PAID_SHARE) == 0 else None
+        user_state = UserState(username=f"user{user_id}", user_id=user_id, chat_id=user_id,
+                               paid_excursions=paid_excursions, is_admin=user_id <= ADMINS_NUM)
+        if user_state.does_have_admin_access():
+            user_state.user_editor.enable_order_changing()
+        user_states.append(user_state)
+    return user_states
+
+
+def build_catalogue(users_num: int, visitors_share: float) -> list[Excursion]:
+    randomizer = random.Random(users_num)
+    visitors_num = int(users_num * visitors_share)
+    excursions = []
+    point_id = 0
+    for excursion_id in range(1, EXCURSIONS_NUM + 1):
+        points = []
+        for _ in range(POINTS_PER_EXCURSION):
+            point_id += 1
+            extra_parts = [
+                InformationPart(information_point_id=point_id * EXTRA_PARTS_PER_POINT + index, parent_id=point_id,
+                                text="Текст " * 100, photos=[f"https://bucket/images/{point_id}_{index}.jpg"])
+                for index in range(EXTRA_PARTS_PER_POINT)
+            ]
+            points.append(Point(point_id=point_id, parent_id=excursion_id, text="Текст " * 200,
+                                photos=[f"https://bucket/images/{point_id}.jpg"], extra_information_points=extra_parts,
+                                visitors=randomizer.sample(range(1, users_num + 1), visitors_num)))
+        excursions.append(Excursion(excursion_id=excursion_id, name=f"Excursion {excursion_id}", points=points,
+                                    visitors=randomizer.sample(range(1, users_num + 1), visitors_num)))
+    return excursions
+
+
+def measure(builder, *args) -> tuple[object, int]:
+    """Returns the built objects and the number of bytes they keep allocated."""
+    gc.collect()
+    tracemalloc.start()
+    result = builder(*args)
+    gc.collect()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, allocated
+
+
+def run_benchmark(users_nums: list[int], visitors_share: float) -> None:
+    points_num = EXCURSIONS_NUM * POINTS_PER_EXCURSION
+    print(f"{'users':>10}{'user states, MiB':>18}{'bytes/user':>12}{'catalogue, MiB':>16}{'bytes/point':>13}")
+    for users_num in users_nums:
+        user_states, users_allocated = measure(build_user_states, users_num)
+        catalogue, catalogue_allocated = measure(build_catalogue, users_num, visitors_share)
+        print(f"{users_num:>10}{users_allocated / 2 ** 20:>18.1f}{users_allocated / users_num:>12.0f}"
+              f"{catalogue_allocated / 2 ** 20:>16.1f}{catalogue_allocated / points_num:>13.0f}")
+        del user_states, catalogue
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--visitors-share", type=float, default=0.05,
+                        help="Share of the users that visited every point")
+    args = parser.parse_args()
+    run_benchmark(args.users, args.visitors_share)
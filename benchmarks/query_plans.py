@@ -0,0 +1,171 @@
+"""
+Query plan regression check of the hot database lookups.
+
+Seeds a large synthetic catalogue and user base into the database of DATABASE_URL, runs EXPLAIN ANALYZE
+on the lookups of PostgresLoadManager, the foreign key checks of the deletes and the funnel report,
+and fails if any of them scans its table sequentially or runs over the latency budget.
+The seeded rows are written in one transaction, which is rolled back at the end.
+
+Run from the repository root against a local database migrated to the head:
+    python -m benchmarks.query_plans --excursions 2000 --users 200000 --budget-ms 5
+"""
+import argparse
+import json
+import os
+import sys
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:benchmark")
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+
+from src.data.funnel import EXCURSION_FUNNEL_QUERY, STARTED_STEP, POINT_STEP, COMPLETED_STEP
+from src.database.models import PointModel, InformationPartModel, UserStateModel
+from src.database.session import create_session
+
+POINTS_PER_EXCURSION = 20
+PARTS_PER_POINT = 2
+INDEX_SCANS = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+SEED_QUERIES = (
+    text("""
+        INSERT INTO excursions (id, name, is_draft, visitors)
+        SELECT :excursion_base + excursion, 'Excursion ' || excursion, false, '[]'::jsonb
+        FROM generate_series(1, :excursions_num) AS excursion
+    """),
+    text("""
+        INSERT INTO points (id, parent_id, name, text, photos, audio, visitors)
+        SELECT :point_base + (excursion - 1) * :points_per_excursion + point, :excursion_base + excursion,
+               'Point ' || point, repeat('Текст точки. ', 50), '[]'::jsonb, '[]'::jsonb, '[]'::jsonb
+        FROM generate_series(1, :excursions_num) AS excursion, generate_series(1, :points_per_excursion) AS point
+    """),
+    text("""
+        INSERT INTO information_parts (id, parent_id, name, text, photos, audio, visitors)
+        SELECT :part_base + (point - 1) * :parts_per_point + part, :point_base + point,
+               'Part ' || part, repeat('Дополнительный текст. ', 30), '[]'::jsonb, '[]'::jsonb, '[]'::jsonb
+        FROM generate_series(1, :excursions_num * :points_per_excursion) AS point,
+             generate_series(1, :parts_per_point) AS part
+    """),
+    # Deleted by the checks of the foreign keys, the excursion has no points and the point has no parts
+    text("INSERT INTO excursions (id, name) VALUES (:excursion_base, 'Empty excursion')"),
+    text("INSERT INTO points (id, parent_id, name) VALUES (:point_base, :excursion_base + 1, 'Empty point')"),
+    text("""
+        INSERT INTO user_states (user_id, chat_id, username, paid_excursions)
+        SELECT :user_base + user_number, :user_base + user_number, 'user' || user_number, '[]'::jsonb
+        FROM generate_series(1, :users_num) AS user_number
+    """),
+    text("ANALYZE excursions, points, information_parts, user_states"),
+)
+
+
+def get_id_base(session, table) -> int:
+    """First id of the seeded rows, above the existing ones."""
+    return (session.execute(text(f"SELECT coalesce(max(id), 0) FROM {table}")).scalar() // 1000 + 1) * 1000
+
+
+def seed(session, excursions_num: int, users_num: int) -> dict:
+    parameters = {
+        "excursion_base": get_id_base(session, "excursions"),
+        "point_base": get_id_base(session, "points"),
+        "part_base": get_id_base(session, "information_parts"),
+        "user_base": (session.execute(text("SELECT coalesce(max(user_id), 0) FROM user_states")).scalar()
+                      // 1000 + 1) * 1000,
+        "excursions_num": excursions_num,
+        "points_per_excursion": POINTS_PER_EXCURSION,
+        "parts_per_point": PARTS_PER_POINT,
+        "users_num": users_num,
+    }
+    for query in SEED_QUERIES:
+        session.execute(query, parameters)
+    return parameters
+
+
+def to_sql(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def get_checks(parameters: dict) -> list[tuple[str, str, dict, str | None]]:
+    """Name, SQL, parameters and the table which has to be read by an index of every check."""
+    middle_excursion_id = parameters["excursion_base"] + parameters["excursions_num"] // 2
+    middle_point_id = parameters["point_base"] + parameters["excursions_num"] * POINTS_PER_EXCURSION // 2
+    middle_user_id = parameters["user_base"] + parameters["users_num"] // 2
+    return [
+        # The lookups of PostgresLoadManager
+        ("load_points", to_sql(select(PointModel).filter_by(parent_id=middle_excursion_id)
+                               .order_by(PointModel.position, PointModel.id)), {}, "points"),
+        ("load_information_part", to_sql(select(InformationPartModel).filter_by(parent_id=middle_point_id)), {},
+         "information_parts"),
+        ("load_user_state", to_sql(select(UserStateModel).filter_by(user_id=middle_user_id).limit(1)), {},
+         "user_states"),
+        ("iter_user_states", to_sql(select(UserStateModel).filter(UserStateModel.user_id > middle_user_id)
+                                    .order_by(UserStateModel.user_id).limit(1000)), {}, "user_states"),
+        ("iter_chat_ids", to_sql(select(UserStateModel.user_id, UserStateModel.chat_id)
+                                 .filter(UserStateModel.chat_id.isnot(None), UserStateModel.user_id > middle_user_id)
+                                 .order_by(UserStateModel.user_id).limit(1000)), {}, "user_states"),
+        ("user_state_by_chat", to_sql(select(UserStateModel).filter_by(chat_id=middle_user_id)), {}, "user_states"),
+        # The lookups of the referencing rows run by the foreign key triggers on the deletes
+        ("delete_excursion_check", f"SELECT 1 FROM ONLY points WHERE parent_id = {parameters['excursion_base']} "
+                                   f"FOR KEY SHARE", {}, "points"),
+        ("delete_point_check", f"SELECT 1 FROM ONLY information_parts WHERE parent_id = {parameters['point_base']} "
+                               f"FOR KEY SHARE", {}, "information_parts"),
+        ("delete_excursion", f"DELETE FROM excursions WHERE id = {parameters['excursion_base']}", {}, None),
+        ("delete_point", f"DELETE FROM points WHERE id = {parameters['point_base']}", {}, None),
+        ("excursion_funnel", EXCURSION_FUNNEL_QUERY.text, {
+            "excursion_id": middle_excursion_id, "started_step": STARTED_STEP, "point_step": POINT_STEP,
+            "completed_step": COMPLETED_STEP,
+        }, "point_arrivals"),
+    ]
+
+
+def iter_plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from iter_plan_nodes(child)
+
+
+def explain(session, sql: str, parameters: dict) -> tuple[dict, float]:
+    """Runs the statement under EXPLAIN ANALYZE in a savepoint, returns the plan and the time with the triggers."""
+    with session.begin_nested() as savepoint:
+        result = session.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"), parameters).scalar()
+        savepoint.rollback()
+    explained = (json.loads(result) if isinstance(result, str) else result)[0]
+    elapsed = explained["Execution Time"] + sum(trigger["Time"] for trigger in explained.get("Triggers", ()))
+    return explained["Plan"], elapsed
+
+
+def run_checks(excursions_num: int, users_num: int, budget_ms: float) -> bool:
+    session = create_session(check_schema=False)
+    try:
+        parameters = seed(session, excursions_num, users_num)
+        print(f"Seeded {excursions_num} excursions, {excursions_num * POINTS_PER_EXCURSION} points, "
+              f"{excursions_num * POINTS_PER_EXCURSION * PARTS_PER_POINT} information parts and {users_num} users")
+        is_passed = True
+        print(f"{'check':<26}{'time, ms':>10}  access")
+        for name, sql, check_parameters, table_name in get_checks(parameters):
+            plan, elapsed = explain(session, sql, check_parameters)
+            scans = [(node["Node Type"], node.get("Index Name")) for node in iter_plan_nodes(plan)
+                     if ("Relation Name" in node or "Index Name" in node)
+                     and (table_name is None or node.get("Relation Name", table_name) == table_name)]
+            errors = []
+            if table_name and not any(node_type in INDEX_SCANS for node_type, _ in scans):
+                errors.append(f"no index scan of {table_name}")
+            if any(node_type == "Seq Scan" for node_type, _ in scans):
+                errors.append("sequential scan")
+            if elapsed > budget_ms:
+                errors.append(f"over the budget of {budget_ms} ms")
+            access = ", ".join(f"{node_type} {index_name or ''}".strip() for node_type, index_name in scans)
+            print(f"{name:<26}{elapsed:>10.3f}  {access or '-'}" + (f"  FAILED: {'; '.join(errors)}" if errors else ""))
+            is_passed = is_passed and not errors
+        return is_passed
+    finally:
+        session.rollback()
+        session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--excursions", type=int, default=2000, help="Seeded excursions")
+    parser.add_argument("--users", type=int, default=200000, help="Seeded user states")
+    parser.add_argument("--budget-ms", type=float, default=5.0, help="Latency budget of every lookup")
+    args = parser.parse_args()
+    sys.exit(0 if run_checks(args.excursions, args.users, args.budget_ms) else 1)
@@ -0,0 +1,69 @@
+"""
+Routing of the S3 reads between an edge and the primary endpoint, both served by the in-memory stand-ins.
+
+Goes through the phases: both endpoints healthy with the edge faster, the edge down, the edge back after
+the cooldown, and objects missing on the edge as on a lagging replica. Reports where the reads of every phase
+were served and their mean latency:
+    python -m benchmarks.read_routing --reads 200 --edge-latency 0.002 --primary-latency 0.02
+"""
+import argparse
+import os
+import time
+
+PRIMARY_ENDPOINT_URL = "http://primary.s3.local"
+EDGE_ENDPOINT_URL = "http://edge.s3.local"
+os.environ.setdefault("BUCKET_NAME", "volkaround-benchmark")
+os.environ["ENDPOINT_URL"] = PRIMARY_ENDPOINT_URL
+os.environ["READ_ENDPOINT_URLS"] = EDGE_ENDPOINT_URL
+os.environ.setdefault("READ_ENDPOINT_COOLDOWN", "1")
+
+from benchmarks.fakes import InMemoryS3
+from src.data import s3bucket
+from src.settings import READ_ENDPOINT_COOLDOWN
+
+OBJECTS_NUM = 20
+
+
+def run_phase(name: str, edge: InMemoryS3, primary: InMemoryS3, reads_num: int, keys: list[str]) -> None:
+    edge.calls.clear()
+    primary.calls.clear()
+    missing_num = 0
+    started_at = time.perf_counter()
+    for read_index in range(reads_num):
+        if s3bucket.s3_fetch_file(s3bucket.get_s3_url(keys[read_index % len(keys)])) is None:
+            missing_num += 1
+    duration = time.perf_counter() - started_at
+    print(f"{name:<22}{sum(edge.calls.values()):>8}{sum(primary.calls.values()):>10}{missing_num:>9}"
+          f"{duration / reads_num * 1000:>12.2f}")
+
+
+def run_benchmark(args) -> None:
+    primary = InMemoryS3(latency=args.primary_latency, endpoint_url=PRIMARY_ENDPOINT_URL)
+    edge = InMemoryS3(latency=args.edge_latency, endpoint_url=EDGE_ENDPOINT_URL)
+    primary.install()
+    edge.install()
+    keys = [f"images/{index}.jpg" for index in range(OBJECTS_NUM)]
+    for key in keys:
+        primary.put(key, os.urandom(args.object_size))
+        edge.put(key, primary.objects[key])
+
+    print(f"{'phase':<22}{'edge':>8}{'primary':>10}{'missing':>9}{'mean, ms':>12}")
+    run_phase("healthy", edge, primary, args.reads, keys)
+    edge.is_available = False
+    run_phase("edge down", edge, primary, args.reads, keys)
+    edge.is_available = True
+    time.sleep(READ_ENDPOINT_COOLDOWN)
+    run_phase("edge back", edge, primary, args.reads, keys)
+    lagging_keys = [f"images/new-{index}.jpg" for index in range(OBJECTS_NUM)]
+    for key in lagging_keys:
+        primary.put(key, os.urandom(args.object_size))
+    run_phase("missing on the edge", edge, primary, args.reads, lagging_keys)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reads", type=int, default=200, help="Reads per phase")
+    parser.add_argument("--edge-latency", type=float, default=0.002, help="Seconds per edge call")
+    parser.add_argument("--primary-latency", type=float, default=0.02, help="Seconds per primary call")
+    parser.add_argument("--object-size", type=int, default=64 * 1024, help="Bytes per object")
+    run_benchmark(parser.parse_args())
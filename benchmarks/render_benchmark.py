@@ -0,0 +1,49 @@
+"""
+Microbenchmark of the per-delivery render cost of points and information parts.
+
+Run from the repository root:
+    python -m benchmarks.render_benchmark --iterations 100000
+"""
+import argparse
+import timeit
+
+from src.components.excursion.point.information_part import InformationPart
+from src.components.excursion.point.point import Point
+from src.components.messages.render_cache import RenderCache, render_part_text, render_location_caption
+
+SAMPLE_TEXT = ("Старый город (Old Town) — это 3.5 км узких улочек, арок и лестниц! "
+               "Здесь #каждый дом_хранит свою историю: (1492-1917) [см. карту]. ") * 20
+
+
+def build_point() -> Point:
+    point = Point(point_id=1, parent_id=1, part_name="Башня (XV век)", address="ул. Главная, 1-3",
+                  text=SAMPLE_TEXT, link="https://example.com/tower?id=1")
+    point.add_extra_information_point(
+        InformationPart(information_point_id=1, parent_id=1, part_name="Легенда о башне", text=SAMPLE_TEXT))
+    return point
+
+
+def run_benchmark(iterations: int) -> None:
+    point = build_point()
+    extra_part = point.get_extra_information_points()[0]
+    cache = RenderCache()
+
+    cases = {
+        "part text (point)": (lambda: render_part_text(point), lambda: cache.get_part_text(point)),
+        "part text (extra part)": (lambda: render_part_text(extra_part), lambda: cache.get_part_text(extra_part)),
+        "location caption": (lambda: render_location_caption(point, 12),
+                             lambda: cache.get_location_caption(point, 12)),
+    }
+    print(f"{'render':<24}{'uncached, us':>14}{'cached, us':>14}{'speedup':>10}")
+    for name, (uncached, cached) in cases.items():
+        uncached_time = timeit.timeit(uncached, number=iterations) / iterations * 1e6
+        cached_time = timeit.timeit(cached, number=iterations) / iterations * 1e6
+        print(f"{name:<24}{uncached_time:>14.2f}{cached_time:>14.2f}{uncached_time / cached_time:>9.1f}x")
+    print(f"Cache hits: {cache.hits}, misses: {cache.misses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+    run_benchmark(args.iterations)
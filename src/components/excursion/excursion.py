@@ -5,12 +5,14 @@ from src.components.field import Field
 from src.constants import *
 from src.data.s3bucket import s3_file_exists
 from src.database.models import ExcursionModel
+from src.monitoring.tracing import traced
 
 
 class Excursion(StatsObject):
-    excursion_id = 0
+    __slots__ = ("id", "is_draft", "points", "name", "is_paid", "duration")
+    stats_entity_type = "excursion"
 
-    def __init__(self, excursion_id: int, name: str = f"{DEFAULT_EXCURSION_NAME} {excursion_id}",
+    def __init__(self, excursion_id: int, name: str = DEFAULT_EXCURSION_NAME,
                  points: List[Point] = None,
                  is_draft: bool = True, is_paid: bool = False,
                  likes_num: int = 0,
@@ -32,6 +34,7 @@ class Excursion(StatsObject):
     def get_duration(self) -> int:
         return self.duration
 
+    @traced("excursion.get_point")
     def get_point(self, step) -> Point | None:
         if step < len(self.points):
             Excursion._validate_location_info(self.points[step])
@@ -90,18 +93,18 @@ class Excursion(StatsObject):
     def to_model(self) -> ExcursionModel:
         """
         Converts the Excursion object into an ExcursionModel instance for saving to the database.
+        The statistics are left out, they are increased in place by StatsRecorder.
         """
+        points = [point.to_model() for point in self.points]  # Assuming Point has a to_model method
+        for position, point_model in enumerate(points):
+            point_model.position = position
         return ExcursionModel(
             id=self.id,
             name=self.name,
             is_draft=self.is_draft,
             is_paid=self.is_paid,
             duration=self.duration,
-            points=[point.to_model() for point in self.points],  # Assuming Point has a to_model method
-            likes_num=self.likes_num,
-            dislikes_num=self.dislikes_num,
-            views_num=self.views_num,
-            visitors=self.visitors,
+            points=points,
         )
 
     @staticmethod
@@ -10,7 +10,8 @@ class InformationPart(StatsObject):
     """
     Information part is a general class for the information that contains text and/or audio and optionally photos.
     """
-    information_part_id = 0
+    __slots__ = ("id", "parent_id", "part_name", "photos", "audio", "text", "link", "content_version")
+    stats_entity_type = "information_part"
 
     def __init__(self, information_point_id: int, parent_id: int, part_name: str = DEFAULT_INFORMATION_PART_NAME,
                  photos: List[str] = None,
@@ -28,6 +29,8 @@ class InformationPart(StatsObject):
         self.audio = audio if audio is not None else []
         self.text = text
         self.link = link
+        # Increased on every content change, used to invalidate pre-rendered messages
+        self.content_version = 0
 
     def get_id(self):
         """Returns the unique point_id of the information part."""
@@ -57,7 +60,12 @@ class InformationPart(StatsObject):
         """Returns the text for the information part."""
         return self.text
 
+    def get_content_version(self) -> int:
+        """Returns the version of the information part content."""
+        return self.content_version
+
     def set_from_dict(self, data: Dict[str, Any]):
+        self.content_version += 1
         self.part_name = data.get(NAME_FIELD, self.part_name)
         self.link = data.get(INFORMATION_PART_LINK_FIELD, self.link)
         self.text = data.get(INFORMATION_PART_TEXT_FIELD, self.text)
@@ -92,6 +100,7 @@ class InformationPart(StatsObject):
     def to_model(self) -> InformationPartModel:
         """
         Converts the InformationPart object into an InformationPartModel instance for saving to the database.
+        The statistics are left out, they are increased in place by StatsRecorder.
         """
         return InformationPartModel(
             id=self.id,
@@ -101,8 +110,4 @@ class InformationPart(StatsObject):
             audio=self.audio,
             text=self.text,
             link=self.link,
-            views_num=self.views_num,
-            likes_num=self.likes_num,
-            dislikes_num=self.dislikes_num,
-            visitors=self.visitors,
         )
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 from src.components.field import Field
 from src.constants import *
@@ -7,14 +7,16 @@ from src.database.models import PointModel
 
 
 class Point(InformationPart):
-    point_id = 0
+    __slots__ = ("address", "location_photo", "location_link", "latitude", "longitude", "extra_information_points")
+    stats_entity_type = "point"
 
     def __init__(self, point_id: int, parent_id: int, address: str = DEFAULT_ADDRESS, location_photo: str = None,
                  photos: List[str] = None, audio: str = None, text: str = DEFAULT_TEXT,
                  part_name: str = DEFAULT_INFORMATION_PART_NAME,
                  link: str = None,
                  extra_information_points: List[InformationPart] = None, location_link: str = None,
-                 views_num: int = 0, likes_num: int = 0, dislikes_num: int = 0, visitors: List[str] = None):
+                 views_num: int = 0, likes_num: int = 0, dislikes_num: int = 0, visitors: List[str] = None,
+                 latitude: float = None, longitude: float = None):
         super().__init__(information_point_id=point_id, parent_id=parent_id, part_name=part_name, photos=photos,
                          audio=audio, text=text,
                          link=link,
@@ -23,6 +25,8 @@ class Point(InformationPart):
         self.address = address
         self.location_photo = location_photo
         self.location_link = location_link
+        self.latitude = latitude
+        self.longitude = longitude
 
         # Optional information
         self.extra_information_points = extra_information_points if extra_information_points else []
@@ -51,6 +55,12 @@ class Point(InformationPart):
         """Returns the location link of the part."""
         return self.location_link
 
+    def get_coordinates(self) -> Tuple[float, float] | None:
+        """Returns the latitude and longitude of the part, None if they are not set."""
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
     def add_extra_information_point(self, extra_information_point: InformationPart) -> None:
         """Adds a new extra information point."""
         self.extra_information_points.append(extra_information_point)
@@ -60,12 +70,15 @@ class Point(InformationPart):
         self.address = data.get(POINT_ADDRESS_FIELD, self.address)
         self.location_photo = data.get(POINT_LOCATION_PHOTO_FIELD, self.location_photo)
         self.location_link = data.get(POINT_LOCATION_LINK_FIELD, self.location_link)
+        if POINT_LOCATION_FIELD in data:
+            self.latitude, self.longitude = data[POINT_LOCATION_FIELD] or (None, None)
 
     def get_fields(self) -> List[Field]:
         fields = super().get_fields()
         fields.append(Field(POINT_ADDRESS_FIELD_MESSAGE, POINT_ADDRESS_FIELD, str))
         fields.append(Field(POINT_LOCATION_PHOTO_FIELD_MESSAGE, POINT_LOCATION_PHOTO_FIELD, ONE_PHOTO_TYPE))
         fields.append(Field(POINT_LOCATION_LINK_FIELD_MESSAGE, POINT_LOCATION_LINK_FIELD, URL_TYPE))
+        fields.append(Field(POINT_LOCATION_FIELD_MESSAGE, POINT_LOCATION_FIELD, LOCATION_TYPE))
         return fields
 
     def update_extra_information_points(self, extra_information_point: InformationPart) -> None:
@@ -84,6 +97,7 @@ class Point(InformationPart):
         point_to_dictionary[POINT_ADDRESS_FIELD] = self.address
         point_to_dictionary[POINT_LOCATION_PHOTO_FIELD] = self.location_photo
         point_to_dictionary[POINT_LOCATION_LINK_FIELD] = self.location_link
+        point_to_dictionary[POINT_LOCATION_FIELD] = self.get_coordinates()
         if self.extra_information_points:
             point_to_dictionary["extra_information_points"] = [elem.to_dict() for elem in self.extra_information_points]
         else:
@@ -93,6 +107,7 @@ class Point(InformationPart):
     def to_model(self) -> PointModel:
         """
         Converts the Point object into a PointModel instance for saving to the database.
+        The statistics are left out, they are increased in place by StatsRecorder.
         """
         return PointModel(
             id=self.id,
@@ -105,9 +120,7 @@ class Point(InformationPart):
             name=self.part_name,
             link=self.link,
             location_link=self.location_link,
-            views_num=self.views_num,
-            likes_num=self.likes_num,
-            dislikes_num=self.dislikes_num,
-            visitors=self.visitors,
+            latitude=self.latitude,
+            longitude=self.longitude,
             extra_information_points=[info_point.to_model() for info_point in self.extra_information_points]
         )
@@ -0,0 +1,134 @@
+import math
+from typing import Dict, Iterable, List, Tuple
+
+from src.components.excursion.excursion import Excursion
+from src.components.excursion.point.point import Point
+
+EARTH_RADIUS = 6371000  # Meters
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+Cell = Tuple[int, int]
+
+
+def get_distance(latitude: float, longitude: float, other_latitude: float, other_longitude: float) -> float:
+    """Great-circle distance in meters."""
+    latitude, longitude, other_latitude, other_longitude = map(
+        math.radians, (latitude, longitude, other_latitude, other_longitude))
+    haversine = (math.sin((other_latitude - latitude) / 2) ** 2
+                 + math.cos(latitude) * math.cos(other_latitude) * math.sin((other_longitude - longitude) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(haversine)))
+
+
+class NearbyPoint:
+    __slots__ = ("point", "excursion", "distance")
+
+    def __init__(self, point: Point, excursion: Excursion, distance: float) -> None:
+        self.point = point
+        self.excursion = excursion
+        self.distance = distance  # Meters
+
+
+class PointsIndex:
+    """
+    Grid of the points with coordinates in cells of the fixed size in degrees. The nearest points are looked up
+    in the rings of cells around the location, so a lookup reads only the cells within the found distance.
+    The points of an excursion are reindexed on its edits, the drafts are skipped by the lookups.
+    """
+
+    def __init__(self, cell_size: float) -> None:
+        self.cell_size = cell_size  # Degrees
+        self.longitude_cells_num = round(360 / cell_size)
+        self.cells: Dict[Cell, Dict[int, Tuple[float, float, Point, Excursion]]] = dict()
+        # Cells of the points of every excursion, to remove them on the edits
+        self.excursions_cells: Dict[int, List[Tuple[Cell, int]]] = dict()
+
+    def __len__(self) -> int:
+        return sum(len(points) for points in self.excursions_cells.values())
+
+    def get_cell(self, latitude: float, longitude: float) -> Cell:
+        return math.floor(latitude / self.cell_size), self._wrap(math.floor(longitude / self.cell_size))
+
+    def _wrap(self, longitude_index: int) -> int:
+        """Wraps the longitude index around the antimeridian."""
+        return ((longitude_index + self.longitude_cells_num // 2) % self.longitude_cells_num
+                - self.longitude_cells_num // 2)
+
+    def _get_ring(self, center: Cell, cell: Cell) -> int:
+        """Ring of the cell around the center one."""
+        longitude_difference = abs(cell[1] - center[1]) % self.longitude_cells_num
+        return max(abs(cell[0] - center[0]), min(longitude_difference, self.longitude_cells_num - longitude_difference))
+
+    def rebuild(self, excursions: Iterable[Excursion]) -> None:
+        self.cells = dict()
+        self.excursions_cells = dict()
+        for excursion in excursions:
+            self.update_excursion(excursion)
+
+    def update_excursion(self, excursion: Excursion) -> None:
+        """Reindexes the points of the excursion."""
+        self.remove_excursion(excursion.get_id())
+        excursion_cells = []
+        for point in excursion.get_points():
+            coordinates = point.get_coordinates()
+            if coordinates is None:
+                continue
+            cell = self.get_cell(*coordinates)
+            self.cells.setdefault(cell, dict())[point.get_id()] = (*coordinates, point, excursion)
+            excursion_cells.append((cell, point.get_id()))
+        if excursion_cells:
+            self.excursions_cells[excursion.get_id()] = excursion_cells
+
+    def remove_excursion(self, excursion_id: int) -> None:
+        for cell, point_id in self.excursions_cells.pop(excursion_id, ()):
+            cell_points = self.cells[cell]
+            del cell_points[point_id]
+            if not cell_points:
+                del self.cells[cell]
+
+    def _iter_ring(self, center: Cell, ring: int) -> Iterable[Cell]:
+        """Cells of the ring around the center one."""
+        center_latitude, center_longitude = center
+        if ring == 0:
+            yield center
+            return
+        for longitude in range(center_longitude - ring, center_longitude + ring + 1):
+            yield center_latitude - ring, self._wrap(longitude)
+            yield center_latitude + ring, self._wrap(longitude)
+        for latitude in range(center_latitude - ring + 1, center_latitude + ring):
+            yield latitude, self._wrap(center_longitude - ring)
+            yield latitude, self._wrap(center_longitude + ring)
+
+    def _get_ring_distance(self, latitude: float, ring: int) -> float:
+        """Lower bound of the distance to the points of the ring, the cells narrow towards the poles."""
+        if ring <= 1:
+            return 0.0
+        farthest_latitude = min(90.0, abs(latitude) + ring * self.cell_size)
+        return (ring - 1) * self.cell_size * METERS_PER_DEGREE * math.cos(math.radians(farthest_latitude))
+
+    def find_nearest(self, latitude: float, longitude: float, limit: int, max_distance: float) -> List[NearbyPoint]:
+        """Returns up to the limit of the nearest points of the published excursions within the distance."""
+        center = self.get_cell(latitude, longitude)
+        nearest: List[NearbyPoint] = []
+        ring = 0
+        while True:
+            ring_distance = self._get_ring_distance(latitude, ring)
+            if ring_distance > max_distance or (len(nearest) >= limit and ring_distance > nearest[-1].distance):
+                break
+            # Once the rings are larger than the grid is populated, e.g. far from all the points,
+            # the rest of the populated cells are read directly instead of the empty ones
+            is_last_ring = 8 * ring > len(self.cells)
+            cells = ([cell for cell in self.cells if self._get_ring(center, cell) >= ring] if is_last_ring
+                     else self._iter_ring(center, ring))
+            for cell in cells:
+                for point_latitude, point_longitude, point, excursion in self.cells.get(cell, dict()).values():
+                    if excursion.is_draft_excursion():
+                        continue
+                    distance = get_distance(latitude, longitude, point_latitude, point_longitude)
+                    if distance <= max_distance:
+                        nearest.append(NearbyPoint(point, excursion, distance))
+            nearest.sort(key=lambda nearby_point: nearby_point.distance)
+            del nearest[limit:]
+            if is_last_ring:
+                break
+            ring += 1
+        return nearest
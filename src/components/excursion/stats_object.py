@@ -1,13 +1,20 @@
-from typing import Any, Dict, List
+from array import array
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable
 
 
 class StatsObject:
+    __slots__ = ("views_num", "likes_num", "dislikes_num", "visitors")
+    # Entity type of the daily statistics rollups
+    stats_entity_type = ""
+
     def __init__(self, views_num: int = 0, likes_num: int = 0, dislikes_num: int = 0,
-                 visitors: List[int] = None) -> None:
+                 visitors: Iterable[int] = None) -> None:
         self.views_num = views_num
         self.likes_num = likes_num
         self.dislikes_num = dislikes_num
-        self.visitors = list() if visitors is None else visitors
+        # Sorted array of the visitors' IDs, 8 bytes per visitor and a binary search for the membership checks
+        self.visitors = array("q", sorted(set(visitors)) if visitors else ())
 
     def get_views_num(self) -> int:
         return self.views_num
@@ -18,11 +25,12 @@ class StatsObject:
     def get_dislikes_num(self) -> int:
         return self.dislikes_num
 
-    def get_visitors(self) -> List[int]:
+    def get_visitors(self) -> array:
         return self.visitors
 
     def is_completed(self, user_id: int) -> bool:
-        return user_id in self.visitors
+        index = bisect_left(self.visitors, user_id)
+        return index < len(self.visitors) and self.visitors[index] == user_id
 
     def get_unique_visitors_num(self) -> int:
         return len(self.visitors)
@@ -30,9 +38,18 @@ class StatsObject:
     def increase_views_num(self) -> None:
         self.views_num += 1
 
-    def add_new_visitor(self, user_id: int) -> None:
-        if user_id not in self.visitors:
-            self.visitors.append(user_id)
+    def add_new_visitor(self, user_id: int) -> bool:
+        """Returns whether the user visits the object for the first time."""
+        if self.is_completed(user_id):
+            return False
+        insort(self.visitors, user_id)
+        return True
+
+    def set_statistics(self, views_num: int, likes_num: int, dislikes_num: int, visitors: Iterable[int]) -> None:
+        self.views_num = views_num
+        self.likes_num = likes_num
+        self.dislikes_num = dislikes_num
+        self.visitors = array("q", sorted(set(visitors)) if visitors else ())
 
     def increase_likes_num(self) -> None:
         self.likes_num += 1
@@ -45,5 +62,5 @@ class StatsObject:
             "views_num": self.views_num,
             "likes_num": self.likes_num,
             "dislikes_num": self.dislikes_num,
-            "visitors": self.visitors,
+            "visitors": self.visitors.tolist(),
         }
@@ -2,6 +2,8 @@ from typing import Any
 
 
 class Field:
+    __slots__ = ("field_message", "field_name", "field_type")
+
     def __init__(self, field_message: str, field_name: str, field_type: Any):
         self.field_message = field_message
         self.field_name = field_name
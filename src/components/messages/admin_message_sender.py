@@ -1,3 +1,5 @@
+import logging
+
 from telegram import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Update
 from typing import List, Union
 
@@ -6,8 +8,11 @@ from src.components.excursion.point.information_part import InformationPart
 from src.components.excursion.point.point import Point
 from src.components.excursion.stats_object import StatsObject
 from src.components.messages.message_sender import MessageSender
+from src.data.funnel import FunnelStep
+from src.data.stats_recorder import StatsWindow
 from src.constants import *
-from src.data.s3bucket import s3_fetch_file
+
+logger = logging.getLogger(__name__)
 
 
 class AdminMessageSender:
@@ -23,7 +28,6 @@ class AdminMessageSender:
     async def send_success_message(update: Update, return_button: InlineKeyboardButton = None,
                                    previous_menu_button: InlineKeyboardButton = None) -> None:
         keyboard = list()
-        print("Return button: ", return_button)
         if return_button:
             keyboard.append([return_button])
         if previous_menu_button:
@@ -36,7 +40,7 @@ class AdminMessageSender:
         elif update.message:
             await update.message.reply_text(ACTION_COMPLETED_SUCCESSFULLY_MESSAGE, reply_markup=reply_markup)
         else:
-            print("Error: query is None")
+            logger.error("Error: query is None")
 
     @staticmethod
     async def send_current_state(update: Update, field_current_state: str,
@@ -48,11 +52,7 @@ class AdminMessageSender:
             if not one_photo:
                 await MessageSender.send_media_group(sender, photos, is_photo=True)
             else:
-                s3_file_obj = s3_fetch_file(photos)
-                if s3_file_obj:
-                    # Read the file content into a BytesIO object
-                    s3_file_obj.seek(0)
-                    await sender.message.reply_photo(s3_file_obj)
+                await MessageSender.reply_photo(sender.message, photos)
         elif audio_paths:
             await MessageSender.send_media_group(sender, audio_paths, is_photo=False)
 
@@ -96,7 +96,7 @@ class AdminMessageSender:
             await sender.message.reply_text(message, reply_markup=reply_markup)
 
     @staticmethod
-    async def send_object_stats(update: Update, element: StatsObject,
+    async def send_object_stats(update: Update, element: StatsObject, windows: List[StatsWindow],
                                 previous_menu_button: InlineKeyboardButton) -> None:
         sender = AdminMessageSender.get_message_sender(update)
         if element and sender:
@@ -106,11 +106,31 @@ class AdminMessageSender:
                        f" {element.get_unique_visitors_num()}\n"
                        f"{LIKE_EMOJI} Количество лайков: {element.get_likes_num()}\n"
                        f"{DISLIKE_EMOJI} Количество дизлайков: {element.get_dislikes_num()}\n")
+            window_titles = dict(STATS_WINDOWS)
+            for window in windows:
+                message += (f"\n{window_titles[window.days]}:\n"
+                            f"Просмотры: {window.views}, {PERSON_EMOJI} новые пользователи: {window.new_visitors}, "
+                            f"{LIKE_EMOJI} {window.likes}, {DISLIKE_EMOJI} {window.dislikes}\n")
             keyboard = [[previous_menu_button],
                         [InlineKeyboardButton(BACK_TO_EXCURSIONS_BUTTON, callback_data=SHOW_EXCURSIONS_CALLBACK)]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             await sender.message.reply_text(message, reply_markup=reply_markup)
 
+    @staticmethod
+    async def send_excursion_funnel(update: Update, excursion: Excursion, steps: List[FunnelStep]) -> None:
+        sender = AdminMessageSender.get_message_sender(update)
+        if excursion and sender:
+            message = FUNNEL_MESSAGE.format(excursion_name=excursion.get_name())
+            for step in steps:
+                step_conversion = f"{step.step_conversion:.0%}" if step.step_conversion is not None else "—"
+                total_conversion = f"{step.total_conversion:.0%}" if step.total_conversion is not None else "—"
+                message += f"{step.title}: {step.users_num} ({step_conversion}, {total_conversion})\n"
+            keyboard = [[InlineKeyboardButton(f"{BACK_ARROW_EMOJI}{EXCURSION_EMOJI}{excursion.get_name()}",
+                                              callback_data=f"{CHOOSE_CALLBACK}{excursion.get_id()}")],
+                        [InlineKeyboardButton(BACK_TO_EXCURSIONS_BUTTON, callback_data=SHOW_EXCURSIONS_CALLBACK)]]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            await sender.message.reply_text(message, reply_markup=reply_markup)
+
     @staticmethod
     async def approve_message(update: Update, message: str, callback: str, approve_button_text: str) -> None:
         sender = AdminMessageSender.get_message_sender(update)
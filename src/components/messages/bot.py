@@ -1,22 +1,60 @@
+import asyncio
+import gc
+import os
+import time
 from typing import List, Union
 from urllib.parse import urlparse
 
 import telegram
 from telegram import Update, InlineKeyboardButton
 from telegram.error import TelegramError
+from telegram.request import BaseRequest, HTTPXRequest
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, filters, \
     MessageHandler
+from sqlalchemy.orm import sessionmaker
+from src.data.catalogue_snapshot import CatalogueSnapshot
+from src.data.event_log import EventLog, create_partitions, EXCURSION_STARTED_EVENT, POINT_ARRIVED_EVENT, \
+    EXTRA_PART_OPENED_EVENT, MODE_CHANGED_EVENT, EXCURSION_COMPLETED_EVENT, FEEDBACK_GIVEN_EVENT, \
+    POSITIVE_FEEDBACK_VALUE, NEGATIVE_FEEDBACK_VALUE, AUDIO_MODE_VALUE, TEXT_MODE_VALUE
+from src.data.funnel import load_excursion_funnel
+from src.data.audio_pipeline import AudioPipeline, AUDIO_S3_DIRECTORY, ORIGINAL_AUDIO_S3_DIRECTORY, \
+    DURATION_METADATA_KEY, TRANSCODED_AUDIO_EXTENSION, get_original_audio_url
+from src.data.id_allocator import IdAllocator
+from src.data.media_store import MediaStore
+from src.data.image_pipeline import ImagePipeline, IMAGES_S3_DIRECTORY, THUMBNAILS_S3_DIRECTORY, \
+    get_thumbnail_url
 from src.data.postgres_data_loader import PostgresLoadManager
 from src.data.s3bucket import save_file_to_s3, s3_delete_file
+from src.data.progress_writer import ProgressWriter
+from src.data.stats_recorder import StatsRecorder, compact_stats
+from src.data.user_state_store import UserStateStore
 
 from src.components.excursion.point.information_part import InformationPart
+from src.components.excursion.stats_object import StatsObject
 from src.components.messages.admin_message_sender import AdminMessageSender
-from src.components.messages.message_sender import MessageSender, escape_markdown
+from src.components.messages.message_sender import MessageSender
+from src.components.messages.render_cache import render_cache, escape_markdown
+from src.components.messages.send_scheduler import SendScheduler, BULK_PRIORITY
 from src.components.excursion.excursion import Excursion
 from src.components.excursion.point.point import Point
+from src.components.excursion.points_index import PointsIndex
 from src.components.user.user_state import UserState
+from src.monitoring.metrics import metrics, instrument_handlers, get_summary
+from src.monitoring.profiling import HandlerProfiler, MemoryProfiler
+from src.monitoring.telegram_request import InstrumentedRequest
+from src.monitoring.tracing import trace_handlers
 import logging
 from src.constants import *
+from src.settings import USER_STATES_CACHE_SIZE, USER_STATE_IDLE_TIMEOUT, PROGRESS_FLUSH_INTERVAL, \
+    TELEGRAM_CONNECTION_POOL_SIZE, PROFILE_OUTPUT_DIR, PROFILE_DEFAULT_CALLS, PROFILE_MAX_CALLS, PROFILE_MAX_TIME, \
+    PROFILE_TIMEOUT, MEMDIFF_DEFAULT_WINDOW, MEMDIFF_MAX_WINDOW, TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, \
+    TELEGRAM_CHAT_BURST, TELEGRAM_GROUP_RATE, TELEGRAM_BULK_RESERVE, TELEGRAM_MAX_RETRIES, IMAGE_MAX_SIDE, \
+    IMAGE_THUMBNAIL_SIDE, IMAGE_JPEG_QUALITY, IMAGE_WORKERS, MAX_PHOTO_FILE_SIZE, AUDIO_TRANSCODING, AUDIO_BITRATE, \
+    AUDIO_WORKERS, AUDIO_KEEP_ORIGINAL, FFMPEG_PATH, FFPROBE_PATH, STATS_RETENTION_DAYS, STATS_COMPACTION_INTERVAL, \
+    EVENTS_FLUSH_INTERVAL, EVENTS_FLUSH_SIZE, EVENTS_MAX_BUFFERED, EVENTS_PARTITIONS_AHEAD, NEARBY_POINTS_LIMIT, \
+    NEARBY_POINTS_MAX_DISTANCE, POINTS_INDEX_CELL_SIZE
+
+logger = logging.getLogger(__name__)
 
 
 def get_user_id_by_update(update: Update) -> int:
@@ -26,42 +64,215 @@ def get_user_id_by_update(update: Update) -> int:
 class Bot:
     """The main bot class coordinating everything."""
 
-    def __init__(self, token, session):
-        logging.info("Initializing bot...")
-        self.application = Application.builder().token(token).build()
+    def __init__(self, token, session, catalogue_snapshot: CatalogueSnapshot, restored_catalogue=None,
+                 request: BaseRequest | None = None):
+        logger.info("Initializing bot...")
+        # Custom transport for the Telegram API calls can be passed, e.g. the recording one of the benchmarks
+        if request is None:
+            request = HTTPXRequest(connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE)
+        self.application = (Application.builder().token(token)
+                            .request(InstrumentedRequest(request))
+                            .rate_limiter(SendScheduler(TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST,
+                                                        TELEGRAM_GROUP_RATE, TELEGRAM_BULK_RESERVE,
+                                                        TELEGRAM_MAX_RETRIES))
+                            .post_init(self._on_startup)
+                            .post_shutdown(self._on_shutdown)
+                            .build())
         self.session = session
-        self.bot = telegram.Bot(token=token)
+        self.bot = self.application.bot
         self.data_loader = PostgresLoadManager(session)
-        self.user_states = self.data_loader.load_user_states()  # Keeps track of UserState objects for each user
-        self.excursions = self.data_loader.load_excursions()  # Dictionary of all available excursions
+        self.id_allocator = IdAllocator(session)
+        self.media_store = MediaStore(session)
+        self.media_store.load_durations()
+        self.progress_writer = ProgressWriter(self.data_loader, PROGRESS_FLUSH_INTERVAL)
+        # Keeps track of UserState objects of the recently active users
+        self.user_states = UserStateStore(self.data_loader, self.progress_writer, USER_STATES_CACHE_SIZE,
+                                          USER_STATE_IDLE_TIMEOUT)
+        self.stats_recorder = StatsRecorder(session)
+        self.event_log = EventLog(session, EVENTS_FLUSH_SIZE, EVENTS_FLUSH_INTERVAL, EVENTS_MAX_BUFFERED)
+        self.flush_task = None
+        self.events_task = None
+        self.last_stats_compaction = 0.0
+        self.reconcile_task = None
+        self.catalogue_snapshot = catalogue_snapshot
+        self.points_index = PointsIndex(POINTS_INDEX_CELL_SIZE)
+        if restored_catalogue is not None:
+            # Serve the snapshot right away, it is checked against the database after the start.
+            # The snapshot has no statistics, they are read from the database before any update is handled
+            self.data_loader.catalogue_version, self.excursions = restored_catalogue
+            self.data_loader.load_statistics(self.excursions)
+            self.catalogue_snapshot.set_written_version(self.data_loader.catalogue_version)
+        else:
+            self.excursions = self.data_loader.load_excursions()  # Dictionary of all available excursions
+            self.save_catalogue_snapshot()
+        self.is_catalogue_reconciled = restored_catalogue is None
+        self.points_index.rebuild(self.excursions.values())
+        render_cache.clear()
+        self.handler_profiler = HandlerProfiler(PROFILE_OUTPUT_DIR, PROFILE_MAX_CALLS, PROFILE_MAX_TIME, PROFILE_TIMEOUT)
+        self.memory_profiler = MemoryProfiler(PROFILE_OUTPUT_DIR, MEMDIFF_MAX_WINDOW)
+        self.image_pipeline = ImagePipeline(IMAGE_WORKERS, IMAGE_MAX_SIDE, IMAGE_THUMBNAIL_SIDE, IMAGE_JPEG_QUALITY)
+        self.audio_pipeline = AudioPipeline(AUDIO_WORKERS, AUDIO_BITRATE, FFMPEG_PATH, FFPROBE_PATH)
+        self.freeze_catalogue()
+        self._register_gauges()
+
+    def _register_gauges(self) -> None:
+        metrics.gauge("volkaround_render_cache_hits", "Hits of the rendered messages cache", lambda: render_cache.hits)
+        metrics.gauge("volkaround_render_cache_misses", "Misses of the rendered messages cache", lambda: render_cache.misses)
+        metrics.gauge("volkaround_user_states_cached", "User states kept in memory", lambda: len(self.user_states))
+        metrics.gauge("volkaround_excursions", "Loaded excursions", lambda: len(self.excursions))
+        metrics.gauge("volkaround_indexed_points", "Points in the nearest points index", lambda: len(self.points_index))
 
     def get_user_state(self, update: Update) -> UserState:
         """Gets or creates the user state for the given user."""
         user_id = update.callback_query.from_user.id if update.callback_query else update.message.from_user.id
         username = update.callback_query.from_user.username if update.callback_query else update.message.from_user.username
         chat_id = update.effective_chat.id
-        print(chat_id)
-        logging.info(f"Getting user state for user {username} with id {user_id}")
-        if user_id not in self.user_states:
-            logging.info(f"User state for username: {username}, user ID {user_id} not found. Creating new user state.")
+        logger.debug("Getting user state for user %s with id %s", username, user_id)
+        user_state = self.user_states.get(user_id)
+        if user_state is None:
+            logger.info("User state for username: %s, user ID %s not found. Creating new user state.",
+                        username, user_id)
             is_admin = True if (username is not None and username.lower() in ADMINS_LIST) else False
-            self.user_states[user_id] = UserState(username=username, user_id=user_id, chat_id=chat_id,
-                                                  is_admin=is_admin)
-            self.data_loader.save_user_state(self.user_states[user_id])
-        if not self.user_states[user_id].chat_id:
-            self.user_states[user_id].chat_id = chat_id
-        return self.user_states[user_id]
+            user_state = UserState(username=username, user_id=user_id, chat_id=chat_id, is_admin=is_admin)
+            self.user_states.add(user_state)
+        if not user_state.get_chat_id():
+            user_state.set_chat_id(chat_id)
+        restored_excursion_id = user_state.get_restored_excursion_id()
+        if restored_excursion_id is not None:
+            logger.info("Restoring excursion %s progress for user %s", restored_excursion_id, user_id)
+            user_state.restore_excursion(self.get_excursion_by_id(restored_excursion_id))
+        return user_state
+
+    def get_excursion_by_id(self, excursion_id: int) -> Excursion | None:
+        for excursion in self.excursions.values():
+            if excursion.get_id() == excursion_id:
+                return excursion
+        return None
 
     def sync_data(self) -> None:
-        logging.info("Syncing data")
-        self.user_states = self.data_loader.load_user_states()  # Keeps track of UserState objects for each user
+        logger.info("Syncing data")
+        self.progress_writer.flush()
+        self.stats_recorder.flush()
+        self.user_states.clear()
         self.excursions = self.data_loader.load_excursions()
+        self.points_index.rebuild(self.excursions.values())
+        # The reloaded elements start their content versions over, the renders of the old ones are stale
+        render_cache.clear()
+        self.save_catalogue_snapshot()
+
+    def save_catalogue_snapshot(self) -> None:
+        self.catalogue_snapshot.write(self.excursions, self.data_loader.catalogue_version)
+
+    @staticmethod
+    def freeze_catalogue() -> None:
+        """
+        Moves the loaded catalogue out of the garbage collector's reach, so the full collections
+        do not traverse the long-living excursion graph. Done once on the start, before any user state or
+        buffer is created, so only the catalogue and the bot itself are frozen. The catalogues loaded later
+        are left to the collector, a full collection on the event loop would stall the updates, and the
+        replaced frozen catalogue is freed by the reference counting since it has no cycles.
+        """
+        gc.collect()
+        gc.freeze()
+
+    async def _on_startup(self, application: Application) -> None:
+        """Starts the background flushing of the users' progress and events and the catalogue reconciliation."""
+        await self._create_events_partitions()
+        self.flush_task = asyncio.create_task(self._flush_periodically())
+        self.events_task = asyncio.create_task(self._flush_events_periodically())
+        if not self.is_catalogue_reconciled:
+            self.reconcile_task = asyncio.create_task(self._reconcile_catalogue())
+
+    async def _reconcile_catalogue(self) -> None:
+        """Reloads the catalogue if the database changed since the restored snapshot was taken."""
+        # A separate session, so the handlers can keep using the main one while the catalogue is loading
+        background_loader = PostgresLoadManager(sessionmaker(bind=self.session.get_bind())())
+        try:
+            database_version = await asyncio.to_thread(background_loader.get_catalogue_version)
+            if database_version == self.data_loader.catalogue_version:
+                logger.info("Catalogue snapshot of version %s is up to date", database_version)
+                return
+            logger.info("Catalogue snapshot is outdated (%s != %s), reloading excursions",
+                        self.data_loader.catalogue_version, database_version)
+            excursions = await asyncio.to_thread(background_loader.load_excursions)
+            self.progress_writer.flush()
+            self.stats_recorder.flush()
+            self.user_states.clear()
+            self.excursions = excursions
+            self.points_index.rebuild(self.excursions.values())
+            render_cache.clear()
+            self.data_loader.catalogue_version = background_loader.catalogue_version
+            self.save_catalogue_snapshot()
+        except Exception as e:
+            logger.error("Failed to reconcile the catalogue snapshot: %s", e)
+        finally:
+            self.is_catalogue_reconciled = True
+            background_loader.session.close()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(PROGRESS_FLUSH_INTERVAL)
+            try:
+                self.progress_writer.flush_due()
+                self.stats_recorder.flush()
+                self.user_states.evict_idle()
+                # The admins' edits are written to the snapshot in batches
+                if self.is_catalogue_reconciled:
+                    self.catalogue_snapshot.write_if_changed(self.excursions, self.data_loader.catalogue_version)
+            except Exception as e:
+                logger.error("Failed to flush user states: %s", e)
+            if time.monotonic() - self.last_stats_compaction >= STATS_COMPACTION_INTERVAL:
+                self.last_stats_compaction = time.monotonic()
+                await self._compact_stats()
+                await self._create_events_partitions()
+
+    async def _flush_events_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(EVENTS_FLUSH_INTERVAL)
+            try:
+                self.event_log.flush_due()
+            except Exception as e:
+                logger.error("Failed to flush interaction events: %s", e)
+
+    async def _create_events_partitions(self) -> None:
+        session = sessionmaker(bind=self.session.get_bind())()
+        try:
+            await asyncio.to_thread(create_partitions, session, EVENTS_PARTITIONS_AHEAD)
+        finally:
+            session.close()
+
+    async def _compact_stats(self) -> None:
+        """Compacts the statistics rollups in a separate session, so the handlers are not blocked meanwhile."""
+        session = sessionmaker(bind=self.session.get_bind())()
+        try:
+            await asyncio.to_thread(compact_stats, session, STATS_RETENTION_DAYS)
+        finally:
+            session.close()
+
+    async def _on_shutdown(self, application: Application) -> None:
+        """Writes the in-memory state back to the database when the bot stops."""
+        logger.info("Shutting down bot, flushing user states")
+        if self.flush_task:
+            self.flush_task.cancel()
+        if self.events_task:
+            self.events_task.cancel()
+        if self.reconcile_task:
+            self.reconcile_task.cancel()
+        self.progress_writer.flush()
+        self.stats_recorder.flush()
+        self.event_log.flush()
+        self.user_states.flush()
+        if self.is_catalogue_reconciled:
+            self.catalogue_snapshot.write_if_changed(self.excursions, self.data_loader.catalogue_version)
+        self.catalogue_snapshot.close()
+        self.image_pipeline.shutdown()
 
     async def _start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handles the /start command."""
         user_state = self.get_user_state(update)
         user_state.reset_current_excursion()  # Reset any ongoing current_excursion for a fresh start
-        logging.info(f"Starting bot by user {user_state.get_username()}")
+        self.progress_writer.schedule(user_state)
+        logger.info("Starting bot by user %s", user_state.get_username())
 
         # Explain the available versions
         await MessageSender.send_intro_message(update)
@@ -73,13 +284,12 @@ class Bot:
             self.sync_data()
         user_state = self.get_user_state(update)
         user_state.reset_current_excursion()
-        user_state.user_editor.disable_editing_mode()
-        user_state.user_editor.disable_order_changing()
+        self.progress_writer.schedule(user_state)
+        user_state.release_user_editor()
         await MessageSender.delete_previous_buttons(query)
-        logging.info(
-            f"Sending excursions list for user {user_state.username}\n"
-            f"Admin status: {user_state.does_have_admin_access()}")
-        logging.info(f"Available excursions: {list(self.excursions.keys())}")
+        logger.debug("Sending excursions list for user %s, admin status: %s",
+                     user_state.username, user_state.does_have_admin_access())
+        logger.debug("Available excursions: %s", list(self.excursions.keys()))
         await MessageSender.send_excursions_list(query, user_state, self.excursions)
         await query.answer()  # Acknowledge the callback_data query to avoid "loading" state.
 
@@ -87,13 +297,13 @@ class Bot:
     async def _disabled_button_handler(update, context):
         """Handles clicks on disabled buttons."""
         query = update.callback_query
-        logging.info(f"Handling click on disabled button for user {query.from_user.username}")
+        logger.debug("Handling click on disabled button for user %s", query.from_user.username)
         await MessageSender.send_error_message(query, ACCESS_ERROR, is_alert=True)
 
     async def choose_excursion(self, update: Update):
         """Handles the selection of a components."""
         query = update.callback_query
-        logging.info(f"Handling selection for user {query.from_user.username}")
+        logger.debug("Handling selection for user %s", query.from_user.username)
         await MessageSender.delete_previous_buttons(query)
 
         user_state = self.get_user_state(update)
@@ -112,10 +322,10 @@ class Bot:
         chosen_excursion = next(
             ((name, excursion) for name, excursion in self.excursions.items() if
              excursion.get_id() == int(excursion_id)), None)
-        logging.info("Chosen components: " + chosen_excursion[0])
         if chosen_excursion is None:
             await MessageSender.send_error_message(query, EXCURSION_DOES_NOT_EXISTS_ERROR)
             return
+        logger.debug("Chosen excursion: %s", chosen_excursion[0])
 
         # If it's a paid current_excursion and the user doesn't have paid access
         if chosen_excursion[1].is_paid_excursion() and not user_state.does_have_access(chosen_excursion[1]):
@@ -124,6 +334,7 @@ class Bot:
 
         # Set the user's current current_excursion and start it
         user_state.set_excursion(chosen_excursion[1])
+        self.progress_writer.schedule(user_state)
         return chosen_excursion[1]
         # await self.start_excursion(update, chosen_excursion[1])
 
@@ -135,7 +346,7 @@ class Bot:
         excursion = await self.choose_excursion(update)
         user_state = self.get_user_state(update)
 
-        logging.info(f"Starting excursion {excursion.get_name()} for user {user_state.username}")
+        logger.info("Starting excursion %s for user %s", excursion.get_name(), user_state.username)
 
         # point = user_state.get_point()  # Get the information for the current part
 
@@ -163,8 +374,10 @@ class Bot:
 
         # Stats changes
         point.increase_views_num()
-        point.add_new_visitor(user_state.get_user_id())
-        self.data_loader.save_point(point)
+        self.stats_recorder.record_view(point, user_state.get_user_id())
+        self.stats_recorder.record_arrival(user_state.get_current_excursion(), point, user_state.get_user_id())
+        self.event_log.record(POINT_ARRIVED_EVENT, user_state.get_user_id(), user_state.get_current_excursion_id(),
+                              point.get_id())
 
         # Check if the user is in text or audio mode
         await MessageSender.send_part(query, point, user_state.mode)
@@ -179,6 +392,11 @@ class Bot:
 
         user_state = self.get_user_state(update)
         user_state.excursion_next_step()
+        self.progress_writer.schedule(user_state)
+        if user_state.get_current_excursion_step() == 0:
+            self.stats_recorder.record_start(user_state.get_current_excursion(), user_state.get_user_id())
+            self.event_log.record(EXCURSION_STARTED_EVENT, user_state.get_user_id(),
+                                  user_state.get_current_excursion_id())
 
         # Move to the next part in the components
         next_point = user_state.get_point()  # Get the next part
@@ -203,8 +421,9 @@ class Bot:
         for extra_part in extra_parts:
             if extra_part_id == extra_part.get_id():
                 extra_part.increase_views_num()
-                extra_part.add_new_visitor(user_state.get_user_id())
-                self.data_loader.save_information_part(extra_part)
+                self.stats_recorder.record_view(extra_part, user_state.get_user_id())
+                self.event_log.record(EXTRA_PART_OPENED_EVENT, user_state.get_user_id(),
+                                      user_state.get_current_excursion_id(), extra_part.get_id())
                 await MessageSender.send_part(query, extra_part, user_state.mode)
                 await MessageSender.send_move_on_request(query, current_point, user_state.get_user_id())
                 return
@@ -216,12 +435,18 @@ class Bot:
 
         # Toggle the mode between 'audio' and 'text'
         user_state.change_mode()
+        self.progress_writer.schedule(user_state)
+        self.event_log.record(MODE_CHANGED_EVENT, user_state.get_user_id(), user_state.get_current_excursion_id(),
+                              value=AUDIO_MODE_VALUE if user_state.mode == AUDIO_MODE else TEXT_MODE_VALUE)
         await update.message.reply_text(
             f"Режим изменен на {user_state.get_mode()}.")
 
-        # Send the current part's information in the new mode
+        # Send the current part's information in the new mode, if the user is at a point of an excursion
+        if user_state.get_current_excursion() is None or user_state.get_current_excursion_step() < 0:
+            return
         point = user_state.get_point()  # Get the part info for the current part
-        await MessageSender.send_part(update.callback_query, point, user_state.mode)
+        if point is not None:
+            await MessageSender.send_part(update, point, user_state.mode)
 
     async def _complete_excursion(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handles the completion of the current_excursion."""
@@ -236,9 +461,10 @@ class Bot:
 
         # Stats changes
         current_excursion.increase_views_num()
-        current_excursion.add_new_visitor(user_state.get_user_id())
+        self.stats_recorder.record_view(current_excursion, user_state.get_user_id())
+        self.stats_recorder.record_completion(current_excursion, user_state.get_user_id())
+        self.event_log.record(EXCURSION_COMPLETED_EVENT, user_state.get_user_id(), current_excursion.get_id())
 
-        self.data_loader.save_excursion(current_excursion)
         self.data_loader.save_user_state(user_state)
         await query.message.reply_text(
             f"Поздравляю! Вы завершили {excursion_name}! {CONGRATULATIONS_EMOJI}")
@@ -257,10 +483,14 @@ class Bot:
         # Handle button presses
         if query.data == FEEDBACK_POSITIVE_CALLBACK:
             user_state.get_current_excursion().increase_likes_num()
+            self.stats_recorder.record(user_state.get_current_excursion(), likes=1)
+            feedback_value = POSITIVE_FEEDBACK_VALUE
         else:
             user_state.get_current_excursion().increase_dislikes_num()
-        # Save updated info
-        self.data_loader.save_excursion(user_state.get_current_excursion())
+            self.stats_recorder.record(user_state.get_current_excursion(), dislikes=1)
+            feedback_value = NEGATIVE_FEEDBACK_VALUE
+        self.event_log.record(FEEDBACK_GIVEN_EVENT, user_state.get_user_id(), user_state.get_current_excursion_id(),
+                              value=feedback_value)
         await MessageSender.send_feedback_response(query)
 
     async def _change_chosen_excursion_visibility(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -286,8 +516,7 @@ class Bot:
         query = update.callback_query
         user_state = self.get_user_state(update)
         await MessageSender.delete_previous_buttons(query)
-        Excursion.excursion_id += 1
-        new_id = Excursion.excursion_id
+        new_id = self.id_allocator.next_excursion_id()
 
         new_excursion = Excursion(new_id, f"{DEFAULT_EXCURSION_NAME} {new_id}")
         user_state.user_editor.enable_editing_mode(new_excursion)
@@ -297,8 +526,7 @@ class Bot:
         query = update.callback_query
         user_state = self.get_user_state(update)
         await MessageSender.delete_previous_buttons(query)
-        Point.point_id += 1
-        new_point = Point(Point.point_id, user_state.get_current_excursion().get_id())
+        new_point = Point(self.id_allocator.next_point_id(), user_state.get_current_excursion().get_id())
         user_state.user_editor.enable_editing_mode(new_point, return_callback=ADD_POINT_CALLBACK,
                                                    return_message=ADD_POINT_BUTTON,
                                                    return_to_previous_menu_callback=EDIT_POINTS_CALLBACK,
@@ -310,8 +538,7 @@ class Bot:
         user_state = self.get_user_state(update)
         point_id = int(query.data.split("_")[-1])
         await MessageSender.delete_previous_buttons(query)
-        InformationPart.information_part_id += 1
-        new_information_part = InformationPart(InformationPart.information_part_id, parent_id=point_id)
+        new_information_part = InformationPart(self.id_allocator.next_information_part_id(), parent_id=point_id)
         user_state.user_editor.enable_editing_mode(new_information_part, point_id=point_id,
                                                    return_callback=ADD_EXTRA_POINT_CALLBACK,
                                                    return_message=ADD_EXTRA_POINT_BUTTON,
@@ -320,11 +547,12 @@ class Bot:
                                                    )
         await self._handle_next_field(update, context)
 
-    def save_editing_item(self, update: Update):
+    def save_editing_item(self, update: Update, replaced_photos: List[str] = ()):
         user_state = self.get_user_state(update)
         if not user_state.user_editor.get_editing_mode():
             return  # Exit if not in editing mode
         editing_item = user_state.user_editor.get_editing_item()
+        render_cache.invalidate(editing_item)
         if editing_item.__class__ == Excursion:
             excursion_to_save = editing_item
             for excursion_name, excursion in self.excursions.items():
@@ -335,26 +563,32 @@ class Bot:
             else:
                 self.excursions[editing_item.get_name()] = editing_item
         else:
-            print("Jumped to points saving")
+            logger.debug("Saving the edited point")
             excursion_to_save = user_state.get_current_excursion()
             if editing_item.__class__ == Point:
                 excursion_to_save.update_excursions_points(editing_item)
             elif editing_item.__class__ == InformationPart:
-                print("Jumped to information_part saving")
+                logger.debug("Saving the edited information part")
                 current_point_id = user_state.user_editor.get_point_id()
                 for point in excursion_to_save.get_points():
-                    print(point.get_id(), current_point_id, type(current_point_id))
                     if point.get_id() == current_point_id:
-                        print("Found point")
+                        logger.debug("Found point %s of the information part", current_point_id)
                         point.update_extra_information_points(editing_item)
-                        print("Updated extra points")
+                        logger.debug("Updated extra points of point %s", current_point_id)
             self.excursions[excursion_to_save.get_name()] = excursion_to_save
-        self.data_loader.save_excursion(excursion_to_save)
+        if self.data_loader.save_excursion(excursion_to_save):
+            # The replaced photos are referenced by the stored item until it is saved
+            self._delete_files(replaced_photos)
+        self.points_index.update_excursion(excursion_to_save)
+        if self.is_catalogue_reconciled:
+            self.save_catalogue_snapshot()
 
     async def _handle_messages(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_state = self.get_user_state(update)
-        if user_state.user_editor.get_editing_mode() and user_state.user_editor.get_current_field_type() in [str, int,
-                                                                                                             URL_TYPE]:
+        if not user_state.has_user_editor():
+            return  # Only the admins who started editing or broadcasting send the free-form messages
+        if user_state.user_editor.get_editing_mode() and user_state.user_editor.get_current_field_type() in [
+                str, int, URL_TYPE, LOCATION_TYPE]:
             await self._handle_next_field(update, context)
         elif user_state.user_editor.get_order_changing():
             await self.handle_order_changing(update, context)
@@ -365,15 +599,14 @@ class Bot:
         """Handles the current field and moves to the next one."""
         user_state = self.get_user_state(update)
 
-        if not user_state.user_editor.get_editing_mode():
+        if not user_state.has_user_editor() or not user_state.user_editor.get_editing_mode():
             return  # Exit if not in editing mode
         # Handle the input for the current field
-        print(user_state.user_editor.current_field_counter)
+        logger.debug("Handling editor field %s", user_state.user_editor.current_field_counter)
 
         if user_state.user_editor.is_counting_started() and not (
                 update.callback_query and update.callback_query.data in FILES_CALLBACKS):
             field_type = user_state.user_editor.get_current_field_type()
-            print("Handling input")
             await self.handle_input(update, field_type, context)
 
         if update.callback_query and (update.callback_query.data in FILES_CALLBACKS
@@ -390,7 +623,8 @@ class Bot:
                     files_buffer.extend(current_data)
                 user_state.user_editor.add_editing_result(files_buffer)
             elif update.callback_query.data == DELETE_EXISTING_FILES_CALLBACK:
-                self._delete_files(current_data)
+                # The files uploaded meanwhile are dropped too, their references are released with the stored ones
+                self._delete_files([*(current_data or []), *files_buffer])
                 user_state.user_editor.add_editing_result([])
             user_state.user_editor.clear_files_buffer()
         elif user_state.user_editor.get_files_sending_mode():
@@ -403,10 +637,11 @@ class Bot:
             return
 
         # Move to the next field
-        print("Increasing field counter")
+        logger.debug("Increasing field counter")
         user_state.user_editor.increase_field_counter()
         if user_state.user_editor.is_form_finished():
             # All fields are processed; finalize
+            replaced_photos = user_state.user_editor.get_replaced_photos()
             user_state.user_editor.set_editing_result_to_item()
 
             return_button = user_state.user_editor.get_return_button()
@@ -414,7 +649,7 @@ class Bot:
 
             await AdminMessageSender.send_success_message(update, return_button=return_button,
                                                           previous_menu_button=previous_menu_button)
-            self.save_editing_item(update)
+            self.save_editing_item(update, replaced_photos)
             user_state.user_editor.disable_editing_mode()
             return
 
@@ -426,7 +661,7 @@ class Bot:
                 user_state.user_editor.enable_files_sending()
             current_state = user_state.user_editor.get_current_field_state()
             photos = current_state if user_state.user_editor.get_current_field_state() else []
-            print("Sending message to get photos from query")
+            logger.debug("Sending message to get photos from query")
             if field_type == PHOTO_TYPE:
                 current_state_message = f"{len(photos)} фото"
             else:
@@ -439,7 +674,7 @@ class Bot:
             user_state.user_editor.enable_files_sending()
             current_audio = user_state.user_editor.get_current_field_state()
             current_state_message = f"{len(current_audio)} аудио файлов"
-            print("Sending message to get photos from query")
+            logger.debug("Sending message to get photos from query")
             await AdminMessageSender.send_form_audio_field_message(update, field_message,
                                                                    current_state_message,
                                                                    current_audio)
@@ -452,8 +687,13 @@ class Bot:
                                                                   current_state,
                                                                   delete_link_button=(
                                                                           field_type == URL_TYPE and current_state))
+        elif field_type == LOCATION_TYPE:
+            user_state.user_editor.enable_editing_specific_field()
+            coordinates = user_state.user_editor.get_current_field_state()
+            current_state = f"{coordinates[0]}, {coordinates[1]}" if coordinates else NO_LOCATION_STATE
+            await AdminMessageSender.send_form_text_field_message(update, field_message, current_state)
         elif field_type == bool:
-            print("Handling boolean field")
+            logger.debug("Handling boolean field")
             current_state = user_state.user_editor.get_current_field_state()
             await AdminMessageSender.send_form_boolean_field_message(update, field_message,
                                                                      "Да" if current_state else "Нет")
@@ -471,11 +711,13 @@ class Bot:
                 await self.handle_photo_field_input(update, context, True if field_type == ONE_PHOTO_TYPE else False)
             elif field_type == AUDIO_TYPE:
                 await self.handle_audio_field_input(update, context)
+            elif field_type == LOCATION_TYPE:
+                await self.handle_location_field_input(update)
 
     async def handle_text_field_input(self, update: Update):
         user_state = self.get_user_state(update)
         if user_state.user_editor.get_editing_mode():
-            print("Handling text field input")
+            logger.debug("Handling text field input")
             field_type = user_state.user_editor.get_current_field_type()
             if field_type == URL_TYPE and update.callback_query and update.callback_query.data == DELETE_LINK_CALLBACK:
                 user_state.user_editor.add_editing_result(None)
@@ -496,9 +738,40 @@ class Bot:
                     else:
                         raise ValueError
             except ValueError as e:
-                print("Error while handling text field input:", e)
+                logger.error("Error while handling text field input: %s", e)
                 await update.message.reply_text(WRONG_FORMAT_MESSAGE)
 
+    async def handle_location_field_input(self, update: Update):
+        """Takes the coordinates from a shared location or from the text "latitude, longitude"."""
+        user_state = self.get_user_state(update)
+        if not update.message:
+            return
+        try:
+            if update.message.location:
+                latitude, longitude = update.message.location.latitude, update.message.location.longitude
+            else:
+                latitude, longitude = (float(coordinate) for coordinate in (update.message.text or "").split(","))
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError(f"Coordinates out of range: {latitude}, {longitude}")
+        except ValueError as e:
+            logger.error("Error while handling location field input: %s", e)
+            await update.message.reply_text(WRONG_FORMAT_MESSAGE)
+            return
+        user_state.user_editor.add_editing_result((latitude, longitude))
+        user_state.user_editor.disable_editing_specific_field()
+
+    async def _handle_location(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Sets the location of the edited point or lists the points nearest to the shared location."""
+        user_state = self.get_user_state(update)
+        if (user_state.has_user_editor() and user_state.user_editor.get_editing_mode()
+                and user_state.user_editor.get_current_field_type() == LOCATION_TYPE):
+            await self._handle_next_field(update, context)
+            return
+        location = update.message.location
+        nearby_points = self.points_index.find_nearest(location.latitude, location.longitude, NEARBY_POINTS_LIMIT,
+                                                       NEARBY_POINTS_MAX_DISTANCE)
+        await MessageSender.send_nearby_points(update, user_state, nearby_points)
+
     async def handle_audio_field_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Fetch the user's state
         user_state = self.get_user_state(update)
@@ -524,19 +797,44 @@ class Bot:
                     await file.download_to_drive(temp_file_path)
 
                     # Upload the file to S3
-                    s3_file_path = save_file_to_s3(temp_file_path, file_name, s3_directory="audio/")
+                    s3_file_path, size_report = await self._upload_audio(temp_file_path, file_name, audio.duration)
                     # Append file URL to the list of saved files
                     if s3_file_path:
                         user_state.user_editor.increase_loading_file_index()
                         user_state.user_editor.add_file_to_files_buffer(s3_file_path)
                         await sender.message.reply_text(
-                            f"Аудио {user_state.user_editor.get_loading_file_index()} загружено {CHECK_MARK_EMOJI}")
+                            f"Аудио {user_state.user_editor.get_loading_file_index()} загружено {CHECK_MARK_EMOJI}"
+                            f"{size_report}")
                     # Clean up the temporary file
                     os.remove(temp_file_path)
 
                 except Exception as e:
-                    print(f"Failed to handle audio: {e}")
-                    await sender.message.reply_text("Ошибка при обработке присланных фотографий.")
+                    logger.error("Failed to handle audio: %s", e)
+                    await sender.message.reply_text("Ошибка при обработке присланного аудио.")
+
+    async def _upload_audio(self, file_path: str, file_name: str, duration: int | None) -> tuple[str | None, str]:
+        """Uploads the audio transcoded if it is enabled, returns the S3 URL and the size report for the admin."""
+        if AUDIO_TRANSCODING:
+            try:
+                transcoded_audio = await self.audio_pipeline.transcode(file_path)
+            except (OSError, RuntimeError) as e:
+                logger.warning("Failed to transcode %s, storing the original: %s", file_path, e)
+            else:
+                try:
+                    s3_file_path, is_uploaded = self.media_store.store(
+                        transcoded_audio.path, AUDIO_S3_DIRECTORY, TRANSCODED_AUDIO_EXTENSION,
+                        metadata=transcoded_audio.get_metadata(), duration=transcoded_audio.duration)
+                finally:
+                    os.remove(transcoded_audio.path)
+                if is_uploaded and AUDIO_KEEP_ORIGINAL:
+                    save_file_to_s3(file_path, os.path.basename(s3_file_path)[:-len(TRANSCODED_AUDIO_EXTENSION)],
+                                    s3_directory=ORIGINAL_AUDIO_S3_DIRECTORY)
+                return s3_file_path, (f"\nРазмер: {transcoded_audio.original_size // 1024} КБ → "
+                                      f"{transcoded_audio.size // 1024} КБ")
+        metadata = {DURATION_METADATA_KEY: str(duration)} if duration else None
+        s3_file_path, _ = self.media_store.store(file_path, AUDIO_S3_DIRECTORY, os.path.splitext(file_name)[1],
+                                                 metadata=metadata, duration=duration)
+        return s3_file_path, ""
 
     async def handle_photo_field_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
                                        one_photo: bool = False):
@@ -544,13 +842,13 @@ class Bot:
         user_state = self.get_user_state(update)
         sender = update if update.message else update.callback_query
         if user_state.user_editor.get_editing_mode():
-            print("Handling photo field input")
+            logger.debug("Handling photo field input")
             field_type = user_state.user_editor.get_current_field_type()
             if field_type == PHOTO_TYPE or field_type == ONE_PHOTO_TYPE:
                 try:
                     # Fetch the file object from Telegram
                     attachment = update.message.effective_attachment[-1]
-                    if attachment.file_size > 6 * 1024 * 1024:
+                    if attachment.file_size > MAX_PHOTO_FILE_SIZE:
                         await update.message.reply_html(
                             f'<b>Файл слишком большой</b>'
                         )
@@ -560,25 +858,40 @@ class Bot:
                     # Create a unique file name
                     tmp_file_name = f'{IMAGES_PATH}/{file_name}'
 
-                    # Download the file locally (temporarily)
-                    file = await file.download_to_drive(tmp_file_name)
-                    if not file:
-                        raise ValueError("File download failed")
-                    s3_file_path = save_file_to_s3(tmp_file_name, file_name, s3_directory="images/")
+                    try:
+                        # Download the file locally (temporarily)
+                        file = await file.download_to_drive(tmp_file_name)
+                        if not file:
+                            raise ValueError("File download failed")
+                        optimized_image = await self.image_pipeline.optimize(tmp_file_name)
+                    finally:
+                        # Clean up the temporary file, the optimized copies are stored separately
+                        if os.path.exists(tmp_file_name):
+                            os.remove(tmp_file_name)
+                    try:
+                        s3_file_path, is_uploaded = self.media_store.store(optimized_image.path,
+                                                                           IMAGES_S3_DIRECTORY, ".jpg")
+                        if is_uploaded:
+                            save_file_to_s3(optimized_image.thumbnail_path, os.path.basename(s3_file_path),
+                                            s3_directory=THUMBNAILS_S3_DIRECTORY)
+                    finally:
+                        os.remove(optimized_image.path)
+                        os.remove(optimized_image.thumbnail_path)
                     # Append file URL to the list of saved files
                     if s3_file_path:
                         user_state.user_editor.increase_loading_file_index()
                         if not one_photo:
                             user_state.user_editor.add_file_to_files_buffer(s3_file_path)
                         else:
+                            # The photo sent before in this form is dropped, the stored one is released on the save
+                            self._delete_files([user_state.user_editor.get_current_field_result()])
                             user_state.user_editor.add_editing_result(s3_file_path)
                         await sender.message.reply_text(
-                            f"Фото {user_state.user_editor.get_loading_file_index()} загружено {CHECK_MARK_EMOJI}")
-                    # Clean up the temporary file
-                    os.remove(tmp_file_name)
+                            f"Фото {user_state.user_editor.get_loading_file_index()} загружено {CHECK_MARK_EMOJI}\n"
+                            f"Размер: {optimized_image.original_size // 1024} КБ → {optimized_image.size // 1024} КБ")
 
                 except Exception as e:
-                    print(f"Failed to handle photos: {e}")
+                    logger.error("Failed to handle photos: %s", e)
                     await sender.message.reply_text("Ошибка при обработке присланных фотографий.")
 
     def handle_boolean_field_input(self, update: Update):
@@ -610,7 +923,7 @@ class Bot:
     async def _edit_excursion(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_state = self.get_user_state(update)
         current_excursion = user_state.get_current_excursion()
-        print(current_excursion.get_name())
+        logger.info("Editing excursion %s", current_excursion.get_name())
         await MessageSender.delete_previous_buttons(update.callback_query)
         user_state.user_editor.enable_editing_mode(user_state.get_current_excursion())
         await self._handle_next_field(update, context)
@@ -641,6 +954,7 @@ class Bot:
                 current_excursion.points.remove(point)
                 self.data_loader.delete_point(point_id)
                 self.data_loader.save_excursion(current_excursion)
+                self.points_index.update_excursion(current_excursion)
                 previous_menu_button = InlineKeyboardButton(EDIT_POINTS_BUTTON,
                                                             callback_data=f"{EDIT_POINTS_CALLBACK}")
                 await AdminMessageSender.send_success_message(update, previous_menu_button=previous_menu_button)
@@ -701,6 +1015,11 @@ class Bot:
                         await self._handle_next_field(update, context)
                         return
 
+    async def _send_element_stats(self, update: Update, element: StatsObject,
+                                  previous_menu_button: InlineKeyboardButton) -> None:
+        windows = self.stats_recorder.get_windows(element, [days for days, _ in STATS_WINDOWS])
+        await AdminMessageSender.send_object_stats(update, element, windows, previous_menu_button=previous_menu_button)
+
     async def _send_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_state = self.get_user_state(update)
         await MessageSender.delete_previous_buttons(update.callback_query)
@@ -710,8 +1029,7 @@ class Bot:
             previous_menu_button = InlineKeyboardButton(
                 f"{BACK_ARROW_EMOJI}{EXCURSION_EMOJI}{current_excursion.get_name()}",
                 callback_data=f"{CHOOSE_CALLBACK}{current_excursion.get_id()}")
-            await AdminMessageSender.send_object_stats(update, current_excursion,
-                                                       previous_menu_button=previous_menu_button)
+            await self._send_element_stats(update, current_excursion, previous_menu_button)
         elif callback_data.startswith(POINT_STATS_CALLBACK):
             point_id = int(callback_data.split("_")[-1])
             for point in current_excursion.get_points():
@@ -719,8 +1037,7 @@ class Bot:
                     previous_menu_button = InlineKeyboardButton(
                         f"{BACK_ARROW_EMOJI}{LOCATION_PIN_EMOJI}{point.get_name()}",
                         callback_data=f"{EDIT_POINT_CALLBACK}{point_id}")
-                    await AdminMessageSender.send_object_stats(update, point,
-                                                               previous_menu_button=previous_menu_button)
+                    await self._send_element_stats(update, point, previous_menu_button)
                     return
         elif callback_data.startswith(EXTRA_POINT_STATS_CALLBACK):
             point_id, extra_point_id = update.callback_query.data.split("_")[-2:]
@@ -733,10 +1050,25 @@ class Bot:
                             previous_menu_button = InlineKeyboardButton(
                                 f"{BACK_ARROW_EMOJI}{SUB_THEME_EMOJI}{extra_point.get_name()}",
                                 callback_data=f"{EDIT_EXTRA_POINT_CALLBACK}{point_id}_{extra_point_id}")
-                            await AdminMessageSender.send_object_stats(update, extra_point,
-                                                                       previous_menu_button=previous_menu_button)
+                            await self._send_element_stats(update, extra_point, previous_menu_button)
                             return
 
+    async def _send_excursion_funnel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_state = self.get_user_state(update)
+        await MessageSender.delete_previous_buttons(update.callback_query)
+        current_excursion = user_state.get_current_excursion()
+        # The recorded starts are written first, the funnel is counted by the database
+        self.stats_recorder.flush()
+        steps = await asyncio.to_thread(self._load_excursion_funnel, current_excursion)
+        await AdminMessageSender.send_excursion_funnel(update, current_excursion, steps)
+
+    def _load_excursion_funnel(self, excursion: Excursion):
+        session = sessionmaker(bind=self.session.get_bind())()
+        try:
+            return load_excursion_funnel(session, excursion)
+        finally:
+            session.close()
+
     async def _send_excursion_summary(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_state = self.get_user_state(update)
         await MessageSender.delete_previous_buttons(update.callback_query)
@@ -757,30 +1089,28 @@ class Bot:
     async def handle_order_changing(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_state = self.get_user_state(update)
         if user_state.user_editor.get_order_changing():
-            print("Changing order")
             try:
                 points_number = len(user_state.get_current_excursion().get_points())
-                print("Points number: " + str(points_number))
                 new_points_order = [int(point.strip()) for point in update.message.text.split(',')]
-                print("New points order: ", new_points_order)
-                for point_index in new_points_order:
-                    if point_index < 0 or point_index > points_number or len(new_points_order) != points_number:
-                        raise IndexError
+                logger.info("New points order: %s", new_points_order)
+                # Every point exactly once
+                if sorted(new_points_order) != list(range(1, points_number + 1)):
+                    raise IndexError
                 old_points_order = {index: point for index, point in
                                     enumerate(user_state.get_current_excursion().get_points(), start=1)}
                 current_excursion = user_state.get_current_excursion()
                 current_excursion.points = [old_points_order[new_index] for new_index in new_points_order]
-                self.data_loader.save_excursion(current_excursion)
+                self.data_loader.save_points_order(current_excursion)
                 # Return button
                 previous_menu_button = InlineKeyboardButton(f"{BACK_ARROW_EMOJI}{current_excursion.get_name()}",
                                                             callback_data=f"{CHOOSE_CALLBACK}{current_excursion.get_id()}")
                 await AdminMessageSender.send_success_message(update, previous_menu_button=previous_menu_button)
-            except Exception as e:
-                print(f"Failed to handle order changing: {e}")
-                await update.message.reply_text(WRONG_FORMAT_MESSAGE)
             except IndexError as e:
-                print(f"Failed to handle order changing: {e}")
+                logger.error("Failed to handle order changing: %s", e)
                 await update.message.reply_text("Неправильный индекс, попробуйте еще раз")
+            except Exception as e:
+                logger.error("Failed to handle order changing: %s", e)
+                await update.message.reply_text(WRONG_FORMAT_MESSAGE)
 
     async def delete_excursion(self, update: Update):
         user_state = self.get_user_state(update)
@@ -793,6 +1123,7 @@ class Bot:
                 self._delete_element_files(extra_point)
             self.data_loader.delete_point(point.get_id())
         del self.excursions[current_excursion.get_name()]
+        self.points_index.remove_excursion(excursion_id)
         self.data_loader.delete_excursion(excursion_id)
         await AdminMessageSender.send_success_message(update)
 
@@ -809,6 +1140,8 @@ class Bot:
                 self.data_loader.delete_excursion(excursion.get_id())
             # self.data_loader.clear_database()
             self.excursions.clear()
+            self.points_index.rebuild(())
+            render_cache.clear()
             await AdminMessageSender.send_success_message(update)
 
     async def _handle_deleting(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -843,17 +1176,35 @@ class Bot:
             message = user_state.user_editor.get_echo_text()
             message = f"{NEWS_EMOJI} Новость от VolkAround:\n{message}"
             message = escape_markdown(message)
-            for user_state in self.user_states.values():
-                chat_id = user_state.get_chat_id()
-                if chat_id:
-                    try:
-                        await self.bot.send_message(chat_id=chat_id, text=message,
-                                                    parse_mode=telegram.constants.ParseMode.MARKDOWN_V2)
-                    except TelegramError as e:
-                        logging.error(f"Failed to send message: {e}")
+            # The rate limiter paces the broadcast behind the interactive replies
+            self.application.create_task(self._broadcast(message))
             user_state.user_editor.disable_sending_echo()
             await AdminMessageSender.send_success_message(update)
 
+    async def _broadcast(self, message: str) -> None:
+        """Sends the message to all users, their chat IDs are streamed from the database out of the event loop."""
+        async def send(chat_id: int) -> None:
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=message,
+                                            parse_mode=telegram.constants.ParseMode.MARKDOWN_V2,
+                                            rate_limit_args=BULK_PRIORITY)
+            except TelegramError as e:
+                logger.error("Failed to send message to chat %s: %s", chat_id, e)
+
+        # A separate session, so the handlers can keep using the main one while the batches are read in a thread
+        background_loader = PostgresLoadManager(sessionmaker(bind=self.session.get_bind())())
+        chat_id_batches = background_loader.iter_chat_ids()
+        chats_num = 0
+        try:
+            while (chat_ids := await asyncio.to_thread(next, chat_id_batches, None)) is not None:
+                for batch_start in range(0, len(chat_ids), BROADCAST_BATCH_SIZE):
+                    await asyncio.gather(*(send(chat_id) for chat_id
+                                           in chat_ids[batch_start:batch_start + BROADCAST_BATCH_SIZE]))
+                chats_num += len(chat_ids)
+        finally:
+            background_loader.session.close()
+        logger.info("Broadcast sent to %s chats", chats_num)
+
     async def _send_echo_request(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_state = self.get_user_state(update)
         if user_state.does_have_admin_access():
@@ -882,17 +1233,93 @@ class Bot:
         self._delete_files(files_to_delete)
 
 
-    @staticmethod
-    def _delete_files(files: List[str]):
+    def _delete_files(self, files: List[str]):
+        # Only the objects losing their last reference are deleted
+        files = [file_path for file_path in files if file_path and self.media_store.release(file_path)]
+        # The thumbnails and the kept audio originals are stored along with the uploaded files
+        files = [*files, *filter(None, (get_thumbnail_url(file_path) for file_path in files)),
+                 *filter(None, (get_original_audio_url(file_path) for file_path in files))]
         for file_path in files:
-            print(f"Deleting {file_path}")
+            logger.info("Deleting %s", file_path)
             if file_path is None:
                 continue
             try:
                 s3_delete_file(file_path)
-                print(f"Deleted: {file_path}")
+                logger.info("Deleted: %s", file_path)
             except Exception as e:
-                print(f"Error deleting {file_path}: {e}")
+                logger.error("Error deleting %s: %s", file_path, e)
+
+    async def _send_perf_summary(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Sends the summary of the performance metrics to the admin."""
+        user_state = self.get_user_state(update)
+        if not user_state.does_have_admin_access():
+            return
+        await update.message.reply_text(get_summary())
+
+    async def _start_profiling(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Profiles the next calls of the handler named by the admin, the report is sent back as a document."""
+        user_state = self.get_user_state(update)
+        if not user_state.does_have_admin_access():
+            return
+        if not context.args:
+            await update.message.reply_text(
+                PROFILE_USAGE_MESSAGE + ", ".join(sorted(self.handler_profiler.handler_names)))
+            return
+        handler_name = context.args[0]
+        try:
+            calls_num = int(context.args[1]) if len(context.args) > 1 else PROFILE_DEFAULT_CALLS
+        except ValueError:
+            await update.message.reply_text(WRONG_FORMAT_MESSAGE)
+            return
+        chat_id = update.effective_chat.id
+
+        def send_report(report_path: str, report: str) -> None:
+            self.application.create_task(self._send_report(chat_id, report_path, report))
+
+        try:
+            session = self.handler_profiler.start(handler_name, max(calls_num, 1), send_report)
+        except (RuntimeError, ValueError) as e:
+            await update.message.reply_text(str(e))
+            return
+        self.application.create_task(self._expire_profiling(session))
+        await update.message.reply_text(PROFILE_STARTED_MESSAGE.format(session.calls_limit, handler_name))
+
+    async def _expire_profiling(self, session) -> None:
+        await asyncio.sleep(PROFILE_TIMEOUT)
+        self.handler_profiler.expire(session)
+
+    async def _send_memory_diff(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Diffs the memory allocations over the window given by the admin."""
+        user_state = self.get_user_state(update)
+        if not user_state.does_have_admin_access():
+            return
+        try:
+            window = float(context.args[0]) if context.args else MEMDIFF_DEFAULT_WINDOW
+        except ValueError:
+            await update.message.reply_text(WRONG_FORMAT_MESSAGE)
+            return
+        if self.memory_profiler.is_running:
+            await update.message.reply_text(MEMDIFF_RUNNING_MESSAGE)
+            return
+        window = min(max(window, 1), MEMDIFF_MAX_WINDOW)
+        await update.message.reply_text(MEMDIFF_STARTED_MESSAGE.format(window))
+        # The window must not hold the update processing of the admin
+        self.application.create_task(self._diff_memory(update.effective_chat.id, window))
+
+    async def _diff_memory(self, chat_id: int, window: float) -> None:
+        try:
+            report_path, report = await self.memory_profiler.diff(window)
+        except Exception as e:
+            logger.error("Failed to diff the memory snapshots: %s", e)
+            return
+        await self._send_report(chat_id, report_path, report)
+
+    async def _send_report(self, chat_id: int, report_path: str, report: str) -> None:
+        try:
+            await self.bot.send_document(chat_id, document=report.encode(), filename=os.path.basename(report_path),
+                                         caption=report_path)
+        except TelegramError as e:
+            logger.error("Failed to send the report %s: %s", report_path, e)
 
     @staticmethod
     async def _move_to_excursions_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -901,10 +1328,17 @@ class Bot:
 
     def run(self):
         """Start the bot."""
+        self.register_handlers()
+        self.application.run_polling()
+
+    def register_handlers(self):
         # User callbacks handlers
         self.application.add_handler(CommandHandler(START_COMMAND, callback=self._start))
         self.application.add_handler(CommandHandler(CHANGE_MODE_COMMAND, self._change_mode))
         self.application.add_handler(CommandHandler(VIEW_EXCURSIONS_COMMAND, self._move_to_excursions_list))
+        self.application.add_handler(CommandHandler(PERF_COMMAND, self._send_perf_summary))
+        self.application.add_handler(CommandHandler(PROFILE_COMMAND, self._start_profiling))
+        self.application.add_handler(CommandHandler(MEMDIFF_COMMAND, self._send_memory_diff))
         self.application.add_handler(CallbackQueryHandler(self._show_excursions,
                                                           pattern=f"^{SHOW_EXCURSIONS_CALLBACK}"))
         self.application.add_handler(
@@ -932,6 +1366,9 @@ class Bot:
         self.application.add_handler(
             CallbackQueryHandler(self._handle_next_field, pattern=f"^{BOOLEAN_FIELD_CALLBACK}"))
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self._handle_messages))
+        # The updates of the live locations are the edits of the message, they are not answered
+        self.application.add_handler(MessageHandler(filters.LOCATION & filters.UpdateType.MESSAGE,
+                                                    self._handle_location))
         self.application.add_handler(
             MessageHandler((filters.PHOTO | filters.AUDIO) & ~(filters.PHOTO & filters.AUDIO), self._handle_next_field)
         )
@@ -961,6 +1398,8 @@ class Bot:
                                          f"{EXTRA_POINT_STATS_CALLBACK})"))
         self.application.add_handler(
             CallbackQueryHandler(self._send_excursion_summary, pattern=f"^{EXCURSION_SUMMARY_CALLBACK}$"))
+        self.application.add_handler(
+            CallbackQueryHandler(self._send_excursion_funnel, pattern=f"^{EXCURSION_FUNNEL_CALLBACK}$"))
         self.application.add_handler(
             CallbackQueryHandler(self._change_points_order, pattern=f"^{CHANGE_POINTS_ORDER_CALLBACK}$"))
         self.application.add_handler(
@@ -974,4 +1413,7 @@ class Bot:
             CallbackQueryHandler(self._handle_deleting, pattern=f"^{APPROVE_DELETING_CALLBACK}"))
         self.application.add_handler(CallbackQueryHandler(self._send_echo_request, pattern=f"^{ECHO_CALLBACK}$"))
         self.application.add_handler(CallbackQueryHandler(self._send_echo_to_users, pattern=f"^{SEND_ECHO_CALLBACK}$"))
-        self.application.run_polling()
+        for handlers_group in self.application.handlers.values():
+            self.handler_profiler.profile_handlers(handlers_group)
+            instrument_handlers(handlers_group)
+            trace_handlers(handlers_group)
@@ -1,8 +1,10 @@
-from io import BytesIO
+import logging
+import os
+from urllib.parse import urlparse
 
 import telegram
+from telegram.error import BadRequest
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery, Update, InputMediaPhoto, InputMediaAudio
-import re
 
 from src.components.user.user_state import UserState
 from src.constants import *
@@ -10,33 +12,17 @@ from src.components.excursion.point.point import Point
 from src.components.excursion.point.information_part import InformationPart
 
 from src.components.excursion.excursion import Excursion
+from src.components.excursion.points_index import NearbyPoint
 from typing import Dict, List, Union
 
-from src.data.s3bucket import s3_fetch_file
-
-
-def map_numbers_to_emoji_unicode(number: int) -> str:
-    # Define a dictionary mapping numbers to their emoji Unicode escape sequences
-    number_to_emoji_unicode = {
-        0: '\U00000030\U0000FE0F\U000020E3',  # 0️⃣
-        1: '\U00000031\U0000FE0F\U000020E3',  # 1️⃣
-        2: '\U00000032\U0000FE0F\U000020E3',  # 2️⃣
-        3: '\U00000033\U0000FE0F\U000020E3',  # 3️⃣
-        4: '\U00000034\U0000FE0F\U000020E3',  # 4️⃣
-        5: '\U00000035\U0000FE0F\U000020E3',  # 5️⃣
-        6: '\U00000036\U0000FE0F\U000020E3',  # 6️⃣
-        7: '\U00000037\U0000FE0F\U000020E3',  # 7️⃣
-        8: '\U00000038\U0000FE0F\U000020E3',  # 8️⃣
-        9: '\U00000039\U0000FE0F\U000020E3',  # 9️⃣
-    }
-    return ''.join([number_to_emoji_unicode.get(int(digit), digit) for digit in str(number)])
-
-def escape_markdown(text: str) -> str:
-    """
-    Escapes special characters for MarkdownV2 parse mode.
-    """
-    special_characters = r'[!"#$%&\'()*+,-./:;<=>?@\[\\\]^_`{|}~]'
-    return re.sub(special_characters, r'\\\g<0>', text)
+from src.components.messages.render_cache import render_cache
+from src.data.audio_pipeline import DURATION_METADATA_KEY
+from src.data.media_store import get_audio_duration
+from src.data.s3bucket import s3_fetch_file, s3_fetch_file_with_metadata, s3_presign_file
+from src.settings import MEDIA_DELIVERY_MODE, PRESIGNED_URL_TTL
+
+logger = logging.getLogger(__name__)
+
 
 class MessageSender:
     """Handles message formatting and sending."""
@@ -98,7 +84,39 @@ class MessageSender:
                 reply_markup=reply_markup
             )
         else:
-            print("Error: query.message is None")
+            logger.error("Error: query.message is None")
+
+    @staticmethod
+    async def send_nearby_points(update: Update, user_state: UserState, nearby_points: List[NearbyPoint]) -> None:
+        """Lists the nearest points with the buttons of their excursions."""
+        if not nearby_points:
+            await update.message.reply_text(
+                NO_NEARBY_POINTS_MESSAGE,
+                reply_markup=InlineKeyboardMarkup(
+                    [[InlineKeyboardButton(BACK_TO_EXCURSIONS_BUTTON, callback_data=SHOW_EXCURSIONS_CALLBACK)]]),
+            )
+            return
+        message = NEARBY_POINTS_MESSAGE
+        keyboard = []
+        excursions_ids = set()
+        for nearby_point in nearby_points:
+            distance = (f"{nearby_point.distance / 1000:.1f} км" if nearby_point.distance >= 1000
+                        else f"{nearby_point.distance:.0f} м")
+            message += (f"{LOCATION_PIN_EMOJI} {nearby_point.point.get_name()} — "
+                        f"{nearby_point.excursion.get_name()}, {distance}\n")
+            excursion = nearby_point.excursion
+            if excursion.get_id() in excursions_ids:
+                continue
+            excursions_ids.add(excursion.get_id())
+            button_text = f"{EXCURSION_EMOJI} {excursion.get_name()}"
+            callback_data = f"{CHOOSE_CALLBACK}{excursion.get_id()}"
+            # Same access as in the excursions list
+            if excursion.is_paid_excursion() and not user_state.does_have_access(excursion):
+                button_text = f"{BLOCK_EMOJI} {excursion.get_name()}"
+                callback_data = DISABLED_CALLBACK
+            keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
+        keyboard.append([InlineKeyboardButton(BACK_TO_EXCURSIONS_BUTTON, callback_data=SHOW_EXCURSIONS_CALLBACK)])
+        await update.message.reply_text(message, reply_markup=InlineKeyboardMarkup(keyboard))
 
     @staticmethod
     async def send_excursion_start_message(query: CallbackQuery, excursion: Excursion, is_admin: bool) -> None:
@@ -108,6 +126,7 @@ class MessageSender:
         if is_admin:
             points_number = len(excursion.get_points())
             keyboard.append([InlineKeyboardButton(STATS_BUTTON, callback_data=EXCURSION_STATS_CALLBACK)])
+            keyboard.append([InlineKeyboardButton(FUNNEL_BUTTON, callback_data=EXCURSION_FUNNEL_CALLBACK)])
             keyboard.append([InlineKeyboardButton(EXCURSION_SUMMARY_BUTTON, callback_data=EXCURSION_SUMMARY_CALLBACK)])
             keyboard.append([InlineKeyboardButton(EDIT_EXCURSION_BUTTON, callback_data=EDIT_EXCURSION_CALLBACK)])
             keyboard.append([InlineKeyboardButton(PUBLISH_EXCURSION_BUTTON,
@@ -142,7 +161,7 @@ class MessageSender:
         elif query:
             await query.answer(error_message, show_alert=is_alert)
         else:
-            print("Error: query.message is None")
+            logger.error("Error: query.message is None")
 
     @staticmethod
     async def delete_previous_buttons(query):
@@ -150,7 +169,7 @@ class MessageSender:
         try:
             await query.message.edit_reply_markup(reply_markup=None)
         except Exception as e:
-            print(f"Error deleting buttons: {e}")
+            logger.error("Error deleting buttons: %s", e)
 
     @staticmethod
     async def send_point_location_info(query: CallbackQuery, point: Point, point_number: int) -> None:
@@ -161,34 +180,24 @@ class MessageSender:
             keyboard.append([InlineKeyboardButton(OPEN_LOCATION_IN_GOOGLE_MAPS, url=point_location_link)])
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-        location_description_text = ''.join((
-            f"*+------ ТОЧКА {map_numbers_to_emoji_unicode(point_number)} ------+*\n"
-            f"Ваш следующий пункт назначения:\n"
-            f"{LOCATION_PIN_EMOJI} *{point.get_name()}*\n"
-            f"{LOCATION_PIN_EMOJI} Адрес: *{point.get_address()}*\n"
-            f"*+----------------------+*"
-        ))
+        location_description_text = render_cache.get_location_caption(point, point_number)
 
         if point.get_location_photo():
             try:
                 # Fetch the photo from S3
                 file_name = point.get_location_photo()  # Assume this is the S3 object key
-                print(file_name)
-                s3_file_obj = s3_fetch_file(file_name)
-
-                if s3_file_obj:
-                    # Read the file content into a BytesIO object
-                    s3_file_obj.seek(0)
-                    await query.message.reply_photo(
-                        photo=s3_file_obj,
-                        caption=location_description_text,
-                        parse_mode=telegram.constants.ParseMode.MARKDOWN,
-                        reply_markup=reply_markup,
-                    )
-                else:
+                logger.debug("Sending photo %s", file_name)
+                is_sent = await MessageSender.reply_photo(
+                    query.message, file_name,
+                    caption=location_description_text,
+                    parse_mode=telegram.constants.ParseMode.MARKDOWN,
+                    reply_markup=reply_markup,
+                )
+
+                if not is_sent:
                     await query.message.reply_text("Ошибка: Фотография не найдена в S3.")
             except Exception as e:
-                print(f"Error fetching photo from S3: {e}")
+                logger.error("Error fetching photo from S3: %s", e)
                 await query.message.reply_text("Произошла ошибка при загрузке фотографии.")
         else:
             await query.message.reply_text(
@@ -197,6 +206,32 @@ class MessageSender:
                 reply_markup=reply_markup,
             )
 
+    @staticmethod
+    async def reply_photo(message, file_url: str, **kwargs) -> bool:
+        """Replies with the photo stored in S3, returns False if the photo is not found."""
+        if MEDIA_DELIVERY_MODE == PRESIGNED_MEDIA_DELIVERY:
+            try:
+                await message.reply_photo(photo=s3_presign_file(file_url, PRESIGNED_URL_TTL), **kwargs)
+                return True
+            except BadRequest as e:
+                # Telegram rejected the URL or could not fetch it, the other errors may follow a delivered photo
+                logger.warning("Failed to send the presigned photo %s, uploading it: %s", file_url, e)
+        s3_file_obj = s3_fetch_file(file_url)
+        if s3_file_obj is None:
+            return False
+        s3_file_obj.seek(0)
+        await message.reply_photo(photo=s3_file_obj, **kwargs)
+        return True
+
+    @staticmethod
+    def _build_presigned_media(file_url: str, is_photo: bool) -> InputMediaPhoto | InputMediaAudio:
+        presigned_url = s3_presign_file(file_url, PRESIGNED_URL_TTL)
+        if is_photo:
+            return InputMediaPhoto(media=presigned_url)
+        # The duration is kept in memory since the upload, so nothing is requested. The file name is taken
+        # by Telegram from the URL path, which ends with the same object name the uploads are sent with
+        return InputMediaAudio(media=presigned_url, duration=get_audio_duration(file_url))
+
     @staticmethod
     async def send_media_group(
             sender: Union[Update, CallbackQuery],
@@ -204,27 +239,41 @@ class MessageSender:
             is_photo: bool
     ) -> None:
         """Sends a group of media files (photos or audio) using URLs from S3."""
+        if files_paths and sender and MEDIA_DELIVERY_MODE == PRESIGNED_MEDIA_DELIVERY:
+            # Telegram fetches the files itself, they are uploaded only if sending them fails
+            try:
+                await sender.message.reply_media_group(media=[
+                    MessageSender._build_presigned_media(file_url, is_photo) for file_url in files_paths
+                ])
+                return
+            except BadRequest as e:
+                logger.warning("Failed to send the presigned media, uploading them: %s", e)
         if files_paths and sender:
             media_group = []
 
             for file_url in files_paths:
-                print(f"Preparing media: {file_url}")
+                logger.debug("Preparing media: %s", file_url)
                 try:
-                    s3_file_obj = s3_fetch_file(file_url)
+                    fetched_file = s3_fetch_file_with_metadata(file_url)
 
-                    if not isinstance(s3_file_obj, BytesIO):
-                        raise ValueError("s3_fetch_file did not return a BytesIO object.")
+                    if fetched_file is None:
+                        raise ValueError("s3_fetch_file_with_metadata did not return the file.")
+                    s3_file_obj, metadata = fetched_file
                     # Reset the BytesIO pointer to the beginning
                     s3_file_obj.seek(0)
                     # Create the appropriate media element (photo or audio)
-                    new_media_element = (
-                        InputMediaPhoto(media=s3_file_obj) if is_photo else InputMediaAudio(media=s3_file_obj)
-                    )
-                    print(f"Prepared media element: {new_media_element}")
+                    if is_photo:
+                        new_media_element = InputMediaPhoto(media=s3_file_obj)
+                    else:
+                        # The duration is stored with the transcoded tracks
+                        duration = metadata.get(DURATION_METADATA_KEY)
+                        new_media_element = InputMediaAudio(media=s3_file_obj,
+                                                            filename=os.path.basename(urlparse(file_url).path),
+                                                            duration=int(duration) if duration else None)
                     media_group.append(new_media_element)
                 except Exception as e:
                     # Handle any issues with creating media elements
-                    print(f"Error processing media: {e}")
+                    logger.error("Error processing media: %s", e)
                     if hasattr(sender, "message") and sender.message:
                         await sender.message.reply_text(f"Ошибка загрузки медиа: {file_url}")
                     return
@@ -233,7 +282,7 @@ class MessageSender:
                 try:
                     await sender.message.reply_media_group(media=media_group)
                 except Exception as e:
-                    print(f"Failed to send media group: {e}")
+                    logger.error("Failed to send media group: %s", e)
                     if hasattr(sender, "message") and sender.message:
                         await sender.message.reply_text("Ошибка отправки медиа.")
 
@@ -253,16 +302,7 @@ class MessageSender:
                 return
             except Exception as e:
                 await MessageSender.send_error_message(query, AUDIO_IS_NOT_FOUND_ERROR)
-        text_content = part.get_text()
-        part_emoji = LOCATION_PIN_EMOJI if part.__class__ == Point else SUB_THEME_EMOJI
-        text_content = ''.join((f"{part_emoji} {part.get_name()}\n"
-                        f"~~~~~~~~~~ ∞ ~~~~~~~~~~\n"
-                        f"{text_content}\n"
-                        f"~~~~~~~~~~ ∞ ~~~~~~~~~~\n\n"))
-        if part.get_link():
-            text_content += f"{LINK_EMOJI} {part.get_link()}\n"
-        escaped_part_name = escape_markdown(part.get_name())
-        text_content = escape_markdown(text_content).replace(escaped_part_name, f"*{escaped_part_name}*", 1)
+        text_content = render_cache.get_part_text(part)
         await query.message.reply_text(text_content, parse_mode=telegram.constants.ParseMode.MARKDOWN_V2)
 
     @staticmethod
@@ -303,8 +343,7 @@ class MessageSender:
         if point.extra_information_points:
             extra_information_points = point.get_extra_information_points()
             for extra_part in extra_information_points:
-                print("Send move on request")
-                # print(num, elem.get_name())
+                logger.debug("Send move on request")
                 button_text = extra_part.get_name()
                 if extra_part.is_completed(user_id):
                     button_text = f"{CHECK_MARK_EMOJI} {button_text}"
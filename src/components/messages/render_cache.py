@@ -0,0 +1,117 @@
+import re
+from typing import Any, Dict, Tuple
+
+from src.components.excursion.point.information_part import InformationPart
+from src.components.excursion.point.point import Point
+from src.constants import *
+
+MARKDOWN_V2_SPECIAL_CHARACTERS = re.compile(r'[!"#$%&\'()*+,-./:;<=>?@\[\\\]^_`{|}~]')
+
+NUMBER_TO_EMOJI_UNICODE = {
+    0: '\U00000030\U0000FE0F\U000020E3',  # 0️⃣
+    1: '\U00000031\U0000FE0F\U000020E3',  # 1️⃣
+    2: '\U00000032\U0000FE0F\U000020E3',  # 2️⃣
+    3: '\U00000033\U0000FE0F\U000020E3',  # 3️⃣
+    4: '\U00000034\U0000FE0F\U000020E3',  # 4️⃣
+    5: '\U00000035\U0000FE0F\U000020E3',  # 5️⃣
+    6: '\U00000036\U0000FE0F\U000020E3',  # 6️⃣
+    7: '\U00000037\U0000FE0F\U000020E3',  # 7️⃣
+    8: '\U00000038\U0000FE0F\U000020E3',  # 8️⃣
+    9: '\U00000039\U0000FE0F\U000020E3',  # 9️⃣
+}
+
+# Render kinds stored in the cache
+PART_TEXT_RENDER = "part_text"
+LOCATION_CAPTION_RENDER = "location_caption"
+
+
+def map_numbers_to_emoji_unicode(number: int) -> str:
+    return ''.join([NUMBER_TO_EMOJI_UNICODE.get(int(digit), digit) for digit in str(number)])
+
+
+def escape_markdown(text: str) -> str:
+    """
+    Escapes special characters for MarkdownV2 parse mode.
+    """
+    return MARKDOWN_V2_SPECIAL_CHARACTERS.sub(r'\\\g<0>', text)
+
+
+def render_part_text(part: InformationPart | Point) -> str:
+    """Builds the MarkdownV2 body of a point or an information part."""
+    part_emoji = LOCATION_PIN_EMOJI if part.__class__ == Point else SUB_THEME_EMOJI
+    text_content = ''.join((f"{part_emoji} {part.get_name()}\n"
+                            f"~~~~~~~~~~ ∞ ~~~~~~~~~~\n"
+                            f"{part.get_text()}\n"
+                            f"~~~~~~~~~~ ∞ ~~~~~~~~~~\n\n"))
+    if part.get_link():
+        text_content += f"{LINK_EMOJI} {part.get_link()}\n"
+    escaped_part_name = escape_markdown(part.get_name())
+    return escape_markdown(text_content).replace(escaped_part_name, f"*{escaped_part_name}*", 1)
+
+
+def render_location_caption(point: Point, point_number: int) -> str:
+    """Builds the Markdown caption of the point location message."""
+    return ''.join((
+        f"*+------ ТОЧКА {map_numbers_to_emoji_unicode(point_number)} ------+*\n"
+        f"Ваш следующий пункт назначения:\n"
+        f"{LOCATION_PIN_EMOJI} *{point.get_name()}*\n"
+        f"{LOCATION_PIN_EMOJI} Адрес: *{point.get_address()}*\n"
+        f"*+----------------------+*"
+    ))
+
+
+class RenderCache:
+    """
+    Keeps the final message bodies of points and information parts, so the Markdown escaping is done once per
+    content version instead of once per delivery.
+    """
+
+    def __init__(self) -> None:
+        # (class name, element id) -> (content version, {(render kind, extra key): rendered text})
+        self.renders: Dict[Tuple[str, int], Tuple[int, Dict[Tuple[str, Any], str]]] = dict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _get_element_key(element: InformationPart | Point) -> Tuple[str, int]:
+        return element.__class__.__name__, element.get_id()
+
+    def _get_element_renders(self, element: InformationPart | Point) -> Dict[Tuple[str, Any], str]:
+        element_key = self._get_element_key(element)
+        cached = self.renders.get(element_key)
+        if cached is None or cached[0] != element.get_content_version():
+            cached = (element.get_content_version(), dict())
+            self.renders[element_key] = cached
+        return cached[1]
+
+    def get_part_text(self, part: InformationPart | Point) -> str:
+        """Returns the text body used in text mode and as the audio mode fallback."""
+        element_renders = self._get_element_renders(part)
+        render_key = (PART_TEXT_RENDER, None)
+        if render_key not in element_renders:
+            self.misses += 1
+            element_renders[render_key] = render_part_text(part)
+        else:
+            self.hits += 1
+        return element_renders[render_key]
+
+    def get_location_caption(self, point: Point, point_number: int) -> str:
+        """Returns the location caption, the point number is a part of the key since points can be reordered."""
+        element_renders = self._get_element_renders(point)
+        render_key = (LOCATION_CAPTION_RENDER, point_number)
+        if render_key not in element_renders:
+            self.misses += 1
+            element_renders[render_key] = render_location_caption(point, point_number)
+        else:
+            self.hits += 1
+        return element_renders[render_key]
+
+    def invalidate(self, element: InformationPart | Point) -> None:
+        """Drops every render of the element."""
+        self.renders.pop(self._get_element_key(element), None)
+
+    def clear(self) -> None:
+        self.renders.clear()
+
+
+render_cache = RenderCache()
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from src.monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Priorities passed to the Bot API methods as rate_limit_args
+INTERACTIVE_PRIORITY = "interactive"
+BULK_PRIORITY = "bulk"
+
+# Requests between the sweeps of the idle chat buckets
+CHAT_BUCKETS_SWEEP_INTERVAL = 1000
+# Bulk requests wait this long while the interactive ones are queued
+BULK_YIELD_DELAY = 0.05  # Seconds
+
+SEND_DELAY = metrics.histogram("volkaround_telegram_send_delay_seconds",
+                               "Time the Telegram Bot API calls waited for the rate limiter", ("priority",))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated_at", "paused_until")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def get_delay(self, reserve: float = 0.0) -> float:
+        """Returns how long to wait before a token can be taken leaving the reserve in the bucket."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        missing_tokens = 1 + reserve - self.tokens
+        return 0.0 if missing_tokens <= 0 else missing_tokens / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Stops giving the tokens, e.g. after Telegram asked to retry later."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def is_idle(self) -> bool:
+        return self.get_delay(self.capacity - 1) == 0.0
+
+
+class SendScheduler(BaseRateLimiter):
+    """
+    Paces the Bot API calls addressed to chats with a global token bucket and a bucket per chat,
+    so bursts are spread instead of being rejected by Telegram. Calls rejected with RetryAfter are retried
+    after the requested time, the chat (or the whole bot for the calls without a chat) is paused meanwhile.
+
+    Interactive calls go first: bulk ones, marked with rate_limit_args=BULK_PRIORITY, leave a reserve
+    of the global tokens and wait while interactive calls are queued.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float, group_rate: float,
+                 bulk_reserve: float, max_retries: int) -> None:
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.bulk_reserve = bulk_reserve
+        self.max_retries = max_retries
+        self.chat_buckets: Dict[Any, TokenBucket] = dict()
+        self.interactive_waiting = 0
+        self.requests_num = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self.chat_buckets.clear()
+
+    def _get_chat_bucket(self, chat_id) -> TokenBucket:
+        chat_bucket = self.chat_buckets.get(chat_id)
+        if chat_bucket is None:
+            # Private chats have positive ids, groups and channels negative ones or @usernames
+            is_group = isinstance(chat_id, str) or int(chat_id) < 0
+            chat_bucket = (TokenBucket(self.group_rate, 1) if is_group
+                           else TokenBucket(self.chat_rate, self.chat_burst))
+            self.chat_buckets[chat_id] = chat_bucket
+        return chat_bucket
+
+    def _sweep_chat_buckets(self) -> None:
+        for chat_id in [chat_id for chat_id, bucket in self.chat_buckets.items() if bucket.is_idle()]:
+            del self.chat_buckets[chat_id]
+
+    async def _acquire(self, chat_bucket: TokenBucket, is_bulk: bool) -> None:
+        reserve = self.bulk_reserve if is_bulk else 0.0
+        while True:
+            global_delay = self.global_bucket.get_delay(reserve)
+            if is_bulk and self.interactive_waiting:
+                global_delay = max(global_delay, BULK_YIELD_DELAY)
+            delay = max(global_delay, chat_bucket.get_delay())
+            if delay <= 0:
+                self.global_bucket.consume()
+                chat_bucket.consume()
+                return
+            # Only the interactive calls held by the global limit make the bulk ones step aside
+            if is_bulk or global_delay <= 0:
+                await asyncio.sleep(delay)
+                continue
+            self.interactive_waiting += 1
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self.interactive_waiting -= 1
+
+    async def process_request(self, callback: Callable[..., Coroutine[Any, Any, Any]], args: Any,
+                              kwargs: Dict[str, Any], endpoint: str, data: Dict[str, Any],
+                              rate_limit_args: str | None) -> Any:
+        priority = BULK_PRIORITY if rate_limit_args == BULK_PRIORITY else INTERACTIVE_PRIORITY
+        chat_id = data.get("chat_id")
+        self.requests_num += 1
+        if self.requests_num % CHAT_BUCKETS_SWEEP_INTERVAL == 0:
+            self._sweep_chat_buckets()
+        retries_num = 0
+        while True:
+            started_at = time.perf_counter()
+            if chat_id is None:
+                # getUpdates, answerCallbackQuery and the like do not send messages, they only respect the pause
+                chat_bucket = None
+                await asyncio.sleep(max(0.0, self.global_bucket.paused_until - time.monotonic()))
+            else:
+                chat_bucket = self._get_chat_bucket(chat_id)
+                await self._acquire(chat_bucket, priority == BULK_PRIORITY)
+            SEND_DELAY.observe(time.perf_counter() - started_at, priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if retries_num >= self.max_retries:
+                    logger.error("Giving up %s to chat %s after %s retries", endpoint, chat_id, retries_num)
+                    raise
+                retries_num += 1
+                logger.warning("Flood control on %s to chat %s, retrying in %s s", endpoint, chat_id, e.retry_after)
+                (chat_bucket or self.global_bucket).pause(e.retry_after)
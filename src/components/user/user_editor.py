@@ -5,9 +5,15 @@ from telegram import InlineKeyboardButton
 from src.components.excursion.excursion import Excursion
 from src.components.excursion.point.information_part import InformationPart
 from src.components.excursion.point.point import Point
+from src.constants import ONE_PHOTO_TYPE
 
 
 class UserEditor:
+    __slots__ = ("echo_text", "is_editing_mode", "editing_item", "fields", "current_field_counter", "editing_result",
+                 "excursion_id", "point_id", "extra_information_point_id", "is_order_changing", "return_callback",
+                 "return_message", "return_to_previous_menu_callback", "return_to_previous_menu_message",
+                 "files_sending_mode", "editing_specific_field", "sending_echo", "files_buffer", "loading_file_index")
+
     def __init__(self):
         self.echo_text = ''
         self.is_editing_mode = False
@@ -161,6 +167,20 @@ class UserEditor:
         current_field_name = self.get_current_field_name()
         return self.editing_item.to_dict().get(current_field_name)
 
+    def get_current_field_result(self) -> Any:
+        """Returns the value entered for the current field in this form, None if it was not entered yet."""
+        return self.editing_result.get(self.get_current_field_name())
+
+    def get_replaced_photos(self) -> List[str]:
+        """
+        Returns the stored single photos the entered ones replace, called before the results are set to the item.
+        An entered photo holds its own reference, so the stored one is released even if it is the same object.
+        """
+        stored_state = self.editing_item.to_dict()
+        return [stored_state[field.get_name()] for field in self.fields
+                if field.get_type() == ONE_PHOTO_TYPE and field.get_name() in self.editing_result
+                and stored_state.get(field.get_name())]
+
     def is_form_finished(self):
         return len(self.fields) <= self.current_field_counter
 
@@ -1,27 +1,53 @@
+import logging
+
 from src.components.excursion.excursion import Excursion
 from src.components.user.user_editor import UserEditor
 from src.constants import TEXT_MODE, AUDIO_MODE, AUDIO_MODE_RU, TEXT_MODE_RU
 from src.database.models import UserStateModel
 
+logger = logging.getLogger(__name__)
+
 
 class UserState:
     """Tracks the state of an individual user."""
+    __slots__ = ("username", "user_id", "chat_id", "is_admin", "mode", "current_excursion", "current_excursion_step",
+                 "restored_excursion_id", "paid_excursions", "_user_editor", "is_dirty")
 
     def __init__(self, username: str, user_id: int, chat_id: int, mode: str = TEXT_MODE, paid_excursions: list[int] = None,
-                 completed_excursions: list[int] = None, is_admin: bool = False) -> None:
+                 completed_excursions: list[int] = None, is_admin: bool = False,
+                 current_excursion_id: int = None, current_excursion_step: int = -1) -> None:
         self.username = username
         self.user_id = user_id
         self.chat_id = chat_id
         self.is_admin = is_admin
         self.mode = mode
         self.current_excursion = None
-        self.current_excursion_step = -1
-        self.paid_excursions = paid_excursions if paid_excursions is not None else []
-        self.user_editor = UserEditor()
+        self.current_excursion_step = current_excursion_step if current_excursion_id is not None else -1
+        # Excursion of the persisted progress, resolved to the excursion object on the next interaction
+        self.restored_excursion_id = current_excursion_id
+        self.paid_excursions = set(paid_excursions) if paid_excursions else set()
+        # Allocated when the user starts editing, most of the users never do
+        self._user_editor = None
+        # True when the persisted fields were changed after the last save
+        self.is_dirty = False
+
+    @property
+    def user_editor(self) -> UserEditor:
+        if self._user_editor is None:
+            self._user_editor = UserEditor()
+        return self._user_editor
+
+    def has_user_editor(self) -> bool:
+        return self._user_editor is not None
+
+    def release_user_editor(self) -> None:
+        """Drops the editing state, the editor is allocated again on the next access."""
+        self._user_editor = None
 
     def change_mode(self) -> None:
-        print("Current user mode: ", self.mode)
+        logger.debug("Current user mode: %s", self.mode)
         self.mode = AUDIO_MODE if self.mode == TEXT_MODE else TEXT_MODE
+        self.is_dirty = True
 
     def get_username(self) -> str:
         return self.username
@@ -29,8 +55,29 @@ class UserState:
     def get_chat_id(self) -> int:
         return self.chat_id
 
+    def set_chat_id(self, chat_id: int) -> None:
+        self.chat_id = chat_id
+        self.is_dirty = True
+
+    def get_is_dirty(self) -> bool:
+        return self.is_dirty
+
+    def mark_saved(self) -> None:
+        self.is_dirty = False
+
     def set_excursion(self, excursion: Excursion) -> None:
         self.current_excursion = excursion
+        self.restored_excursion_id = None
+
+    def get_restored_excursion_id(self) -> int | None:
+        return self.restored_excursion_id
+
+    def restore_excursion(self, excursion: Excursion | None) -> None:
+        """Continues the persisted excursion progress, resets it if the excursion does not exist anymore."""
+        if excursion is None:
+            self.reset_current_excursion()
+        else:
+            self.set_excursion(excursion)
 
     def does_have_access(self, excursion: Excursion) -> bool:
         if self.is_admin or excursion.get_id() in self.paid_excursions:
@@ -48,6 +95,12 @@ class UserState:
     def reset_current_excursion(self) -> None:
         self.current_excursion = None
         self.current_excursion_step = -1
+        self.restored_excursion_id = None
+
+    def get_current_excursion_id(self) -> int | None:
+        if self.current_excursion is not None:
+            return self.current_excursion.get_id()
+        return self.restored_excursion_id
 
     def get_current_excursion(self) -> Excursion:
         return self.current_excursion
@@ -65,7 +118,8 @@ class UserState:
         return self.user_id
 
     def add_paid_excursion(self, excursion: Excursion) -> None:
-        self.paid_excursions.append(excursion.get_id())
+        self.paid_excursions.add(excursion.get_id())
+        self.is_dirty = True
 
     def get_mode(self) -> str:
         return AUDIO_MODE_RU if self.mode == AUDIO_MODE else TEXT_MODE_RU
@@ -78,7 +132,7 @@ class UserState:
             "chat_id": self.chat_id,
             "mode": self.mode,
             "is_admin": self.is_admin,
-            "paid_excursions": self.paid_excursions,
+            "paid_excursions": sorted(self.paid_excursions),
         }
 
     def to_model(self) -> UserStateModel:
@@ -89,5 +143,7 @@ class UserState:
             username=self.username,
             mode=self.mode,
             is_admin=self.is_admin,
-            paid_excursions=self.paid_excursions,
+            paid_excursions=sorted(self.paid_excursions),
+            current_excursion_id=self.get_current_excursion_id(),
+            current_excursion_step=self.current_excursion_step,
         )
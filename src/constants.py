@@ -36,6 +36,7 @@ PERSON_EMOJI = "\U0001F464"  # 👤 (Bust in Silhouette)
 DELETE_EMOJI = '\U0001F5D1'  # 🗑️
 AUTHOR_EMOJI = '\U0001F47D'  # 👽
 STATS_EMOJI = '\U0001F4C8'
+FUNNEL_EMOJI = '\U0001F4C9'  # 📉
 SUMMARY_EMOJI = '\U0001F4D6'
 SUB_THEME_EMOJI = '\U0001F9E9'  # 🧩
 FOLDER_EMOJI = '\U0001F4C1'  # 📁
@@ -65,6 +66,10 @@ NEWS_EMOJI = "\U0001F4F0"  # 📰
 AUDIO_PATH = os.path.abspath("media/audio")
 IMAGES_PATH = os.path.abspath("media/images")
 
+# Media delivery modes, the bytes are uploaded to Telegram or Telegram fetches them by presigned S3 URLs
+UPLOAD_MEDIA_DELIVERY = "upload"
+PRESIGNED_MEDIA_DELIVERY = "presigned"
+
 # User state modes
 ADMINS_LIST = {"ivanezox", "zeevvolk", "donnie_stockman"}
 AUDIO_MODE = "audio"
@@ -76,6 +81,12 @@ TEXT_MODE_RU = 'текстовый формат'
 START_COMMAND = 'start'
 CHANGE_MODE_COMMAND = 'changemode'
 VIEW_EXCURSIONS_COMMAND = 'viewexcursions'
+PERF_COMMAND = 'perf'
+PROFILE_COMMAND = 'profile'
+MEMDIFF_COMMAND = 'memdiff'
+
+# Messages of a broadcast handed to the rate limiter at once
+BROADCAST_BATCH_SIZE = 100
 
 # Errors messages
 EXCURSION_DOES_NOT_EXISTS_ERROR = (f"Упс, такой экскурсии не существует!"
@@ -128,6 +139,14 @@ CHANGING_ORDER_MESSAGE = ("Вы редактируете порядок точе
                           " и отправьте сообщение\n"
                           "Пример: 1, 4, 5, 6")
 WRONG_FORMAT_MESSAGE = f"{ERROR_EMOJI} Неправильный формат, попробуйте еще раз"
+# Windows of the statistics screen, the number of the last days and the title
+STATS_WINDOWS = ((1, "Сегодня"), (7, "За 7 дней"), (30, "За 30 дней"))
+FUNNEL_MESSAGE = f"{FUNNEL_EMOJI} Воронка экскурсии {{excursion_name}}\n(пользователи, % от предыдущего шага, % от начавших)\n\n"
+FUNNEL_STARTED_STEP_TITLE = "Начали экскурсию"
+FUNNEL_COMPLETED_STEP_TITLE = "Завершили экскурсию"
+NEARBY_POINTS_MESSAGE = f"{MAP_EMOJI} Ближайшие к вам точки экскурсий:\n\n"
+NO_NEARBY_POINTS_MESSAGE = f"{MAP_EMOJI} Рядом с вами пока нет точек экскурсий"
+NO_LOCATION_STATE = "Нет геопозиции"
 
 # Buttons labels
 SYNC_BUTTON = f"Синхронизировать {SYNC_EMOJI}"
@@ -157,6 +176,7 @@ CHANGE_POINTS_ORDER_BUTTON = f'{CHANGE_ORDER_EMOTIONS} Редактироват
 DELETE_POINT_BUTTON = f"{DELETE_EMOJI} Удалить точку"
 DELETE_EXTRA_POINT_BUTTON = f"{DELETE_EMOJI} Удалить подтему"
 STATS_BUTTON = f"{STATS_EMOJI} Статистика"
+FUNNEL_BUTTON = f"{FUNNEL_EMOJI} Воронка прохождения"
 EXCURSION_SUMMARY_BUTTON = f"{SUMMARY_EMOJI} Обзор экскурсии"
 DELETE_EXCURSION_BUTTON = f"{DELETE_EMOJI} Удалить экскурсию"
 # DISABLE_SENDING_FILES_BUTTON = f"{FINISH_EMOJI} Закончить отправку файлов"
@@ -194,7 +214,13 @@ INFORMATION_PART_PHOTOS_FIELD_MESSAGE = f"{PHOTO_EMOJI} Пришлите фот
 POINT_ADDRESS_FIELD_MESSAGE = f"{TEXT_EMOJI} Введите адресс локации. Если хотите оставить предыдущее значение, пропустите поле"
 POINT_LOCATION_PHOTO_FIELD_MESSAGE = f"{PHOTO_EMOJI} Пришлите фото геолокации. Если хотите оставить предыдущее значение, пропустите поле"
 POINT_LOCATION_LINK_FIELD_MESSAGE = f"{LINK_EMOJI} Пришлите ссылку на точку в Google Maps. Если хотите оставить предыдущее значение, пропустите поле"
+POINT_LOCATION_FIELD_MESSAGE = (f"{LOCATION_PIN_EMOJI} Пришлите геопозицию точки или ее координаты через запятую "
+                                "(пример: 55.7539, 37.6208). Если хотите оставить предыдущее значение, пропустите поле")
 ECHO_MESSAGE = f"{TEXT_EMOJI} Пришлите новость для того, чтобы послать ее всем пользователям."
+PROFILE_USAGE_MESSAGE = f"Использование: /{PROFILE_COMMAND} <обработчик> [число вызовов]\nОбработчики: "
+PROFILE_STARTED_MESSAGE = "Профилирование {} следующих вызовов {} запущено, отчет придет сюда"
+MEMDIFF_STARTED_MESSAGE = "Сравнение снимков памяти через {:g} с запущено, отчет придет сюда"
+MEMDIFF_RUNNING_MESSAGE = "Сравнение снимков памяти уже запущено"
 
 # Fields keys
 NAME_FIELD = "name"
@@ -211,12 +237,14 @@ POINT_ADDRESS_FIELD = "address"
 POINT_LOCATION_PHOTO_FIELD = "location_photo"
 POINT_EXTRA_INFORMATION_PART_FIELD = "extra_information_points"
 POINT_LOCATION_LINK_FIELD = "location_link"
+POINT_LOCATION_FIELD = "location"
 
 # Types
 PHOTO_TYPE = "photos"
 AUDIO_TYPE = "audio"
 ONE_PHOTO_TYPE = "photo"
 URL_TYPE = "url"
+LOCATION_TYPE = "location"
 
 # get_fields() keys
 FIELD_MESSAGE_KEY = "field_message"
@@ -255,6 +283,7 @@ EDIT_EXTRA_POINT_FIELDS_CALLBACK = "edit_fields_extra_point_"
 DELETE_EXTRA_POINT_CALLBACK = "delete_extra_point_"
 DELETE_EXCURSION_CALLBACK = "delete_excursion"
 EXCURSION_STATS_CALLBACK = "stats_excursion_"
+EXCURSION_FUNNEL_CALLBACK = "excursion_funnel"
 POINT_STATS_CALLBACK = "stats_point_"
 EXTRA_POINT_STATS_CALLBACK = "stats_extra_point_"
 EXCURSION_SUMMARY_CALLBACK = "excursion_summary"
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import os
+
+from src.monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+AUDIO_S3_DIRECTORY = "audio/"
+ORIGINAL_AUDIO_S3_DIRECTORY = "audio/originals/"
+TRANSCODED_AUDIO_EXTENSION = ".m4a"
+# S3 object metadata key of the track duration in seconds
+DURATION_METADATA_KEY = "duration"
+
+AUDIO_BYTES_SAVED = metrics.counter("volkaround_audio_bytes_saved_total",
+                                    "Bytes saved by transcoding the uploaded audio")
+
+
+def get_original_audio_url(audio_url: str) -> str | None:
+    """Returns the URL of the original kept along with the transcoded track, it is named as the track without
+    the extension."""
+    directory_start = audio_url.find(f"/{AUDIO_S3_DIRECTORY}")
+    if (directory_start == -1 or f"/{ORIGINAL_AUDIO_S3_DIRECTORY}" in audio_url
+            or not audio_url.endswith(TRANSCODED_AUDIO_EXTENSION)):
+        return None
+    name_start = directory_start + len(AUDIO_S3_DIRECTORY) + 1
+    return (f"{audio_url[:directory_start]}/{ORIGINAL_AUDIO_S3_DIRECTORY}"
+            f"{audio_url[name_start:-len(TRANSCODED_AUDIO_EXTENSION)]}")
+
+
+class TranscodedAudio:
+    __slots__ = ("path", "original_size", "size", "duration")
+
+    def __init__(self, path: str, original_size: int, size: int, duration: int | None) -> None:
+        self.path = path
+        self.original_size = original_size
+        self.size = size
+        self.duration = duration
+
+    def get_metadata(self) -> dict:
+        return {DURATION_METADATA_KEY: str(self.duration)} if self.duration is not None else dict()
+
+
+class AudioPipeline:
+    """
+    Transcodes the uploaded audio to mono AAC of a speech bitrate with the local ffmpeg binary.
+    The ffmpeg processes run outside of the event loop, their number is limited by the workers number.
+    """
+
+    def __init__(self, workers_num: int, bitrate: str, ffmpeg_path: str, ffprobe_path: str) -> None:
+        self.bitrate = bitrate
+        self.ffmpeg_path = ffmpeg_path
+        self.ffprobe_path = ffprobe_path
+        self.workers = asyncio.Semaphore(workers_num)
+
+    @staticmethod
+    async def _run(*command: str) -> bytes:
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.PIPE)
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"{os.path.basename(command[0])} failed: {stderr.decode(errors='replace')[-500:]}")
+        return stdout
+
+    async def get_duration(self, path: str) -> int | None:
+        """Returns the duration of the track in whole seconds."""
+        output = await self._run(self.ffprobe_path, "-v", "error", "-show_entries", "format=duration",
+                                 "-of", "default=noprint_wrappers=1:nokey=1", path)
+        try:
+            return round(float(output.strip()))
+        except ValueError:
+            return None
+
+    async def transcode(self, source_path: str) -> TranscodedAudio:
+        path = f"{os.path.splitext(source_path)[0]}.transcoded{TRANSCODED_AUDIO_EXTENSION}"
+        async with self.workers:
+            # Mono AAC without the tags and cover art, the index is moved to the start to play while loading
+            await self._run(self.ffmpeg_path, "-y", "-v", "error", "-i", source_path, "-vn", "-map_metadata", "-1",
+                            "-ac", "1", "-c:a", "aac", "-b:a", self.bitrate, "-movflags", "+faststart", path)
+            duration = await self.get_duration(path)
+        transcoded_audio = TranscodedAudio(path, os.path.getsize(source_path), os.path.getsize(path), duration)
+        AUDIO_BYTES_SAVED.inc(amount=max(transcoded_audio.original_size - transcoded_audio.size, 0))
+        logger.info("Transcoded %s: %s -> %s bytes, %s s", source_path, transcoded_audio.original_size,
+                    transcoded_audio.size, duration)
+        return transcoded_audio
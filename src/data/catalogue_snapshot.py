@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from src.components.excursion.excursion import Excursion
+from src.components.excursion.point.information_part import InformationPart
+from src.components.excursion.point.point import Point
+from src.data.s3bucket import get_s3_client
+from src.settings import BUCKET_NAME
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"VOLKSNAP"
+# Increase when the records layout changes, snapshots of other formats are ignored
+SNAPSHOT_FORMAT_VERSION = 4
+# Magic, format version, catalogue version
+SNAPSHOT_HEADER = struct.Struct(">8sHq")
+
+
+def _information_part_to_record(part: InformationPart) -> tuple:
+    return part.id, part.parent_id, part.part_name, part.photos, part.audio, part.text, part.link
+
+
+def _information_part_from_record(record: tuple) -> InformationPart:
+    (part_id, parent_id, name, photos, audio, text, link) = record
+    return InformationPart(information_point_id=part_id, parent_id=parent_id, part_name=name, photos=photos,
+                           audio=audio, text=text, link=link)
+
+
+def _point_to_record(point: Point) -> tuple:
+    return (point.id, point.parent_id, point.part_name, point.address, point.location_photo, point.location_link,
+            point.latitude, point.longitude, point.photos, point.audio, point.text, point.link,
+            tuple(_information_part_to_record(part) for part in point.extra_information_points))
+
+
+def _point_from_record(record: tuple) -> Point:
+    (point_id, parent_id, name, address, location_photo, location_link, latitude, longitude, photos, audio, text,
+     link, extra_parts) = record
+    return Point(point_id=point_id, parent_id=parent_id, part_name=name, address=address,
+                 location_photo=location_photo, location_link=location_link, latitude=latitude, longitude=longitude,
+                 photos=photos, audio=audio, text=text, link=link,
+                 extra_information_points=[_information_part_from_record(part) for part in extra_parts])
+
+
+def _excursion_to_record(excursion: Excursion) -> tuple:
+    return (excursion.id, excursion.name, excursion.is_paid, excursion.is_draft, excursion.duration,
+            tuple(_point_to_record(point) for point in excursion.points))
+
+
+def _excursion_from_record(record: tuple) -> Excursion:
+    (excursion_id, name, is_paid, is_draft, duration, points) = record
+    return Excursion(excursion_id=excursion_id, name=name, is_paid=is_paid, is_draft=is_draft, duration=duration,
+                     points=[_point_from_record(point) for point in points])
+
+
+def serialize_catalogue(excursions: Dict[str, Excursion], catalogue_version: int) -> bytes:
+    # The statistics are left out, they change with every flush and are loaded from the database on the start
+    records = [_excursion_to_record(excursion) for excursion in excursions.values()]
+    # Plain JSON, the snapshot may come from the bucket and must not be able to run code on load
+    payload = zlib.compress(json.dumps(records, ensure_ascii=False, separators=(",", ":")).encode())
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, catalogue_version) + payload
+
+
+def deserialize_catalogue(data: bytes) -> Tuple[int, Dict[str, Excursion]] | None:
+    """Returns the catalogue version and the excursions, or None if the snapshot is of another format."""
+    if len(data) < SNAPSHOT_HEADER.size:
+        return None
+    magic, format_version, catalogue_version = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or format_version != SNAPSHOT_FORMAT_VERSION:
+        return None
+    records = json.loads(zlib.decompress(data[SNAPSHOT_HEADER.size:]))
+    excursions = dict()
+    for record in records:
+        excursion = _excursion_from_record(record)
+        excursions[excursion.get_name()] = excursion
+    return catalogue_version, excursions
+
+
+class CatalogueSnapshot:
+    """
+    Stores a compact binary snapshot of the excursion graph together with the database catalogue version it
+    was taken at. The snapshot is kept on the local disk and, if a bucket is configured, copied to S3,
+    since the local disk does not survive a deploy.
+    """
+
+    def __init__(self, path: str, s3_key: str | None = None) -> None:
+        self.path = path
+        self.s3_key = s3_key if BUCKET_NAME else None
+        # Writes are serialized and kept out of the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalogue-snapshot")
+        self.written_version = None
+        # Whether the last read snapshot was taken from the local disk, i.e. by this database's bot
+        self.is_read_locally = False
+
+    def read(self) -> Tuple[int, Dict[str, Excursion]] | None:
+        """Restores the catalogue from the local snapshot or, if it is missing, from the S3 copy."""
+        data = self._read_local()
+        self.is_read_locally = data is not None
+        if data is None:
+            data = self._read_s3()
+        if data is None:
+            return None
+        try:
+            snapshot = deserialize_catalogue(data)
+        except (zlib.error, ValueError, TypeError) as e:
+            logger.error("Catalogue snapshot is corrupted: %s", e)
+            return None
+        if snapshot is None:
+            logger.info("Catalogue snapshot has an unsupported format, ignoring it")
+            return None
+        logger.info("Restored %s excursions from the catalogue snapshot of version %s", len(snapshot[1]), snapshot[0])
+        return snapshot
+
+    def write(self, excursions: Dict[str, Excursion], catalogue_version: int) -> None:
+        """Serializes and stores the catalogue in the background."""
+        self.written_version = catalogue_version
+        self.executor.submit(self._store, dict(excursions), catalogue_version)
+
+    def write_if_changed(self, excursions: Dict[str, Excursion], catalogue_version: int) -> None:
+        """Writes the catalogue if its version differs from the last written one."""
+        if catalogue_version != self.written_version:
+            self.write(excursions, catalogue_version)
+
+    def set_written_version(self, catalogue_version: int) -> None:
+        """Registers the version of a snapshot that is already stored."""
+        self.written_version = catalogue_version
+
+    def close(self) -> None:
+        """Waits for the pending writes."""
+        self.executor.shutdown(wait=True)
+
+    def _read_local(self) -> bytes | None:
+        try:
+            with open(self.path, "rb") as snapshot_file:
+                return snapshot_file.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error("Failed to read the catalogue snapshot: %s", e)
+            return None
+
+    def _read_s3(self) -> bytes | None:
+        if not self.s3_key:
+            return None
+        try:
+            response = get_s3_client().get_object(Bucket=BUCKET_NAME, Key=self.s3_key)
+            return response['Body'].read()
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                logger.error("Failed to fetch the catalogue snapshot from S3: %s", e)
+            return None
+        except BotoCoreError as e:
+            logger.error("Failed to fetch the catalogue snapshot from S3: %s", e)
+            return None
+
+    def _store(self, excursions: Dict[str, Excursion], catalogue_version: int) -> None:
+        try:
+            data = serialize_catalogue(excursions, catalogue_version)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "wb") as snapshot_file:
+                snapshot_file.write(data)
+            os.replace(temp_path, self.path)
+            if self.s3_key:
+                get_s3_client().put_object(Bucket=BUCKET_NAME, Key=self.s3_key, Body=data)
+            logger.info("Stored catalogue snapshot of version %s (%s bytes)", catalogue_version, len(data))
+        except (OSError, ClientError, BotoCoreError) as e:
+            logger.error("Failed to store the catalogue snapshot: %s", e)
@@ -0,0 +1,191 @@
+"""
+Append-only log of the users' interactions, partitioned by month.
+
+Rebuilds the daily statistics rollups from the log:
+    python -m src.data.event_log --rebuild-stats-since 2026-10-01
+"""
+import argparse
+import csv
+import io
+import logging
+import time
+from datetime import date, datetime, timezone
+from typing import List, Tuple
+
+import psycopg2
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.monitoring.metrics import metrics
+from src.monitoring.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+# Event types, stored as smallint
+EXCURSION_STARTED_EVENT = 1
+POINT_ARRIVED_EVENT = 2
+EXTRA_PART_OPENED_EVENT = 3
+MODE_CHANGED_EVENT = 4
+EXCURSION_COMPLETED_EVENT = 5
+FEEDBACK_GIVEN_EVENT = 6
+
+# Values of the feedback and mode change events
+POSITIVE_FEEDBACK_VALUE = 1
+NEGATIVE_FEEDBACK_VALUE = -1
+TEXT_MODE_VALUE = 0
+AUDIO_MODE_VALUE = 1
+
+EVENT_COLUMNS = ("created_at", "event_type", "user_id", "excursion_id", "entity_id", "value")
+COPY_EVENTS_QUERY = (f"COPY interaction_events ({', '.join(EVENT_COLUMNS)}) "
+                     f"FROM STDIN WITH (FORMAT csv, NULL '')")
+
+# Recomputes the rollups of the days since the given one: every view event is counted as a view of its entity,
+# the first view of the entity by the user over the whole log as a new visitor
+REBUILD_STATS_QUERIES = (
+    text("DELETE FROM stats_daily WHERE day >= :since"),
+    text("""
+        WITH views AS (
+            SELECT CASE event_type WHEN :point_arrived THEN 'point'
+                                   WHEN :extra_part_opened THEN 'information_part'
+                                   ELSE 'excursion' END AS entity_type,
+                   CASE event_type WHEN :excursion_completed THEN excursion_id ELSE entity_id END AS entity_id,
+                   user_id, created_at
+            FROM interaction_events
+            WHERE event_type IN (:point_arrived, :extra_part_opened, :excursion_completed)
+        ), first_views AS (
+            SELECT entity_type, entity_id, user_id, min(created_at) AS created_at
+            FROM views GROUP BY entity_type, entity_id, user_id
+        ), counters AS (
+            SELECT entity_type, entity_id, created_at::date AS day, 1 AS views, 0 AS new_visitors, 0 AS likes,
+                   0 AS dislikes
+            FROM views WHERE created_at >= :since
+            UNION ALL
+            SELECT entity_type, entity_id, created_at::date, 0, 1, 0, 0
+            FROM first_views WHERE created_at >= :since
+            UNION ALL
+            SELECT 'excursion', excursion_id, created_at::date, 0, 0,
+                   (value = :positive_feedback)::int, (value = :negative_feedback)::int
+            FROM interaction_events WHERE event_type = :feedback_given AND created_at >= :since
+        )
+        INSERT INTO stats_daily (entity_type, entity_id, day, views, new_visitors, likes, dislikes)
+        SELECT entity_type, entity_id, day, sum(views), sum(new_visitors), sum(likes), sum(dislikes)
+        FROM counters WHERE entity_id IS NOT NULL
+        GROUP BY entity_type, entity_id, day
+    """),
+)
+
+EVENTS_WRITTEN = metrics.counter("volkaround_interaction_events_written_total", "Interaction events written")
+EVENTS_DROPPED = metrics.counter("volkaround_interaction_events_dropped_total",
+                                 "Interaction events dropped as the buffer overflowed while the writes failed")
+
+
+def get_partition_name(month: date) -> str:
+    return f"interaction_events_{month.year}_{month.month:02d}"
+
+
+def get_next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def create_partitions(session, months_ahead: int) -> None:
+    """Creates the partitions of the current month and the next ones, the events never land in the default one."""
+    month = date.today().replace(day=1)
+    for _ in range(months_ahead + 1):
+        next_month = get_next_month(month)
+        try:
+            session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {get_partition_name(month)} PARTITION OF interaction_events "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"))
+            session.commit()
+        except SQLAlchemyError as e:
+            # E.g. the default partition already has the events of the month
+            session.rollback()
+            logger.error("Error creating the interaction events partition of %s: %s", month, e)
+        month = next_month
+
+
+def rebuild_stats(session, since: date) -> None:
+    """Replaces the daily statistics rollups of the days since the given one with the ones counted from the log."""
+    try:
+        for query in REBUILD_STATS_QUERIES:
+            session.execute(query, {
+                "since": since, "point_arrived": POINT_ARRIVED_EVENT, "extra_part_opened": EXTRA_PART_OPENED_EVENT,
+                "excursion_completed": EXCURSION_COMPLETED_EVENT, "feedback_given": FEEDBACK_GIVEN_EVENT,
+                "positive_feedback": POSITIVE_FEEDBACK_VALUE, "negative_feedback": NEGATIVE_FEEDBACK_VALUE,
+            })
+        session.commit()
+        logger.info("Rebuilt statistics rollups since %s", since)
+    except SQLAlchemyError as e:
+        session.rollback()
+        logger.error("Error rebuilding statistics rollups: %s", e)
+        raise
+
+
+class EventLog:
+    """
+    Buffers the interaction events in memory and appends them to interaction_events with a single COPY,
+    when the buffer fills up or the flush interval passes.
+    """
+
+    def __init__(self, session, flush_size: int, flush_interval: float, max_buffered: int) -> None:
+        self.session = session
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.buffer: List[Tuple] = list()
+        self.last_flush = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    def record(self, event_type: int, user_id: int, excursion_id: int | None = None, entity_id: int | None = None,
+               value: int | None = None) -> None:
+        # Stamped on the record, so the buffering does not shift the events in time
+        self.buffer.append((datetime.now(timezone.utc), event_type, user_id, excursion_id, entity_id, value))
+        if len(self.buffer) >= self.flush_size:
+            self.flush()
+
+    def flush_due(self) -> None:
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    @traced("event_log.flush")
+    def flush(self) -> None:
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        events = self.buffer
+        self.buffer = list()
+        data = io.StringIO()
+        csv.writer(data).writerows(
+            (created_at.isoformat(), *("" if field is None else field for field in fields))
+            for created_at, *fields in events)
+        data.seek(0)
+        try:
+            with self.session.connection().connection.cursor() as cursor:
+                cursor.copy_expert(COPY_EVENTS_QUERY, data)
+            self.session.commit()
+            EVENTS_WRITTEN.inc(amount=len(events))
+            logger.debug("Wrote %s interaction events", len(events))
+        # The errors of the raw DBAPI cursor are not wrapped by SQLAlchemy
+        except (SQLAlchemyError, psycopg2.Error) as e:
+            self.session.rollback()
+            self._requeue(events, e)
+
+    def _requeue(self, events: List[Tuple], error: Exception) -> None:
+        self.buffer = events + self.buffer
+        dropped_num = len(self.buffer) - self.max_buffered
+        if dropped_num > 0:
+            del self.buffer[:dropped_num]
+            EVENTS_DROPPED.inc(amount=dropped_num)
+        logger.error("Error writing %s interaction events, %s dropped: %s", len(events), max(dropped_num, 0), error)
+
+
+if __name__ == "__main__":
+    from src.database.session import create_session
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild-stats-since", type=date.fromisoformat, required=True,
+                        help="First day of the rebuilt statistics rollups, YYYY-MM-DD")
+    args = parser.parse_args()
+    rebuild_stats(create_session(check_schema=False), args.rebuild_stats_since)
@@ -0,0 +1,76 @@
+import logging
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.components.excursion.excursion import Excursion
+from src.constants import FUNNEL_STARTED_STEP_TITLE, FUNNEL_COMPLETED_STEP_TITLE
+from src.monitoring.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+STARTED_STEP = "started"
+POINT_STEP = "point"
+COMPLETED_STEP = "completed"
+
+# Counts the users of every funnel step in one statement from the primary key indexes of the steps tables.
+# The later steps count only the users who started the excursion, so no step exceeds the started cohort
+EXCURSION_FUNNEL_QUERY = text("""
+    SELECT :started_step, NULL, count(*) FROM excursion_starts WHERE excursion_id = :excursion_id
+    UNION ALL
+    SELECT :point_step, arrivals.point_id, count(*)
+    FROM point_arrivals AS arrivals
+    JOIN excursion_starts AS starts ON starts.excursion_id = arrivals.excursion_id AND starts.user_id = arrivals.user_id
+    WHERE arrivals.excursion_id = :excursion_id
+    GROUP BY arrivals.point_id
+    UNION ALL
+    SELECT :completed_step, NULL, count(*)
+    FROM excursion_completions AS completions
+    JOIN excursion_starts AS starts
+        ON starts.excursion_id = completions.excursion_id AND starts.user_id = completions.user_id
+    WHERE completions.excursion_id = :excursion_id
+""")
+
+
+class FunnelStep:
+    __slots__ = ("title", "users_num", "step_conversion", "total_conversion")
+
+    def __init__(self, title: str, users_num: int, step_conversion: float | None,
+                 total_conversion: float | None) -> None:
+        self.title = title
+        self.users_num = users_num
+        # Shares of the users of the previous step and of the started ones, None if there were no users
+        self.step_conversion = step_conversion
+        self.total_conversion = total_conversion
+
+
+@traced("funnel.load_excursion_funnel")
+def load_excursion_funnel(session, excursion: Excursion) -> List[FunnelStep]:
+    """Returns the steps of the excursion funnel: started, reached every point in the excursion order, completed."""
+    try:
+        rows = session.execute(EXCURSION_FUNNEL_QUERY, {
+            "excursion_id": excursion.get_id(), "started_step": STARTED_STEP, "point_step": POINT_STEP,
+            "completed_step": COMPLETED_STEP,
+        }).all()
+        session.commit()
+    except SQLAlchemyError as e:
+        session.rollback()
+        logger.error("Error loading the funnel of excursion %s: %s", excursion.get_id(), e)
+        return []
+    points_users_num = {point_id: users_num for step, point_id, users_num in rows if step == POINT_STEP}
+    started_num = next(users_num for step, _, users_num in rows if step == STARTED_STEP)
+    completed_num = next((users_num for step, _, users_num in rows if step == COMPLETED_STEP), 0)
+
+    steps_users_num = [(FUNNEL_STARTED_STEP_TITLE, started_num)]
+    steps_users_num.extend((f"{index}. {point.get_name()}", points_users_num.get(point.get_id(), 0))
+                           for index, point in enumerate(excursion.get_points(), start=1))
+    steps_users_num.append((FUNNEL_COMPLETED_STEP_TITLE, completed_num))
+    steps = []
+    previous_num = None
+    for title, users_num in steps_users_num:
+        step_conversion = users_num / previous_num if previous_num else None
+        total_conversion = users_num / started_num if started_num else None
+        steps.append(FunnelStep(title, users_num, step_conversion, total_conversion))
+        previous_num = users_num
+    return steps
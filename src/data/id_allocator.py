@@ -0,0 +1,52 @@
+import logging
+from typing import Dict, Tuple
+
+from sqlalchemy import text, Table
+
+from src.database.models import ExcursionModel, PointModel, InformationPartModel
+
+logger = logging.getLogger(__name__)
+
+
+class IdAllocator:
+    """
+    Allocates entity ids from the Postgres id sequences with a hi-lo scheme.
+    The sequences are incremented by the block size, so every nextval reserves a whole block of ids for this process
+    and the ids stay unique across all the workers and tools sharing the database.
+    """
+
+    def __init__(self, session) -> None:
+        self.session = session
+        # Sequence name -> (next id to return, first id after the reserved block)
+        self.blocks: Dict[str, Tuple[int, int]] = dict()
+
+    @staticmethod
+    def _get_sequence_name(table: Table) -> str:
+        return table.c.id.default.name
+
+    def _reserve_block(self, sequence_name: str) -> Tuple[int, int]:
+        """Reserves the next block of ids, the block size is the sequence increment."""
+        block_start, block_size = self.session.execute(
+            text("SELECT nextval(CAST(:sequence AS regclass)), seqincrement "
+                 "FROM pg_sequence WHERE seqrelid = CAST(:sequence AS regclass)"),
+            {"sequence": sequence_name},
+        ).one()
+        logger.info("Reserved ids %s-%s from %s", block_start, block_start + block_size - 1, sequence_name)
+        return block_start, block_start + block_size
+
+    def next_id(self, table: Table) -> int:
+        sequence_name = self._get_sequence_name(table)
+        next_id, block_end = self.blocks.get(sequence_name, (0, 0))
+        if next_id >= block_end:
+            next_id, block_end = self._reserve_block(sequence_name)
+        self.blocks[sequence_name] = (next_id + 1, block_end)
+        return next_id
+
+    def next_excursion_id(self) -> int:
+        return self.next_id(ExcursionModel.__table__)
+
+    def next_point_id(self) -> int:
+        return self.next_id(PointModel.__table__)
+
+    def next_information_part_id(self) -> int:
+        return self.next_id(InformationPartModel.__table__)
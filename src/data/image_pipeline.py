@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+from src.monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+IMAGES_S3_DIRECTORY = "images/"
+THUMBNAILS_S3_DIRECTORY = "images/thumbnails/"
+
+IMAGE_BYTES_SAVED = metrics.counter("volkaround_image_bytes_saved_total",
+                                    "Bytes saved by optimizing the uploaded images")
+
+
+class OptimizedImage:
+    __slots__ = ("path", "thumbnail_path", "original_size", "size", "thumbnail_size")
+
+    def __init__(self, path: str, thumbnail_path: str, original_size: int, size: int, thumbnail_size: int) -> None:
+        self.path = path
+        self.thumbnail_path = thumbnail_path
+        self.original_size = original_size
+        self.size = size
+        self.thumbnail_size = thumbnail_size
+
+    def get_saved_bytes(self) -> int:
+        return self.original_size - self.size
+
+
+def optimize_image(source_path: str, max_side: int, thumbnail_side: int, quality: int) -> OptimizedImage:
+    """
+    Decodes the image, applies its EXIF orientation and re-encodes it as a progressive JPEG without metadata,
+    downsized to fit the maximal side, along with a small thumbnail. Runs in the worker processes.
+    """
+    base_path = os.path.splitext(source_path)[0]
+    path = f"{base_path}.optimized.jpg"
+    thumbnail_path = f"{base_path}.thumbnail.jpg"
+    with Image.open(source_path) as source_image:
+        image = ImageOps.exif_transpose(source_image).convert("RGB")
+    # The EXIF, ICC and other metadata are dropped as they are not passed to save
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    image.save(path, "JPEG", quality=quality, optimize=True, progressive=True)
+    image.thumbnail((thumbnail_side, thumbnail_side), Image.Resampling.LANCZOS)
+    image.save(thumbnail_path, "JPEG", quality=quality, optimize=True)
+    return OptimizedImage(path, thumbnail_path, os.path.getsize(source_path), os.path.getsize(path),
+                          os.path.getsize(thumbnail_path))
+
+
+def get_thumbnail_url(image_url: str) -> str | None:
+    """Returns the URL of the thumbnail stored along with the uploaded image."""
+    directory_start = image_url.find(f"/{IMAGES_S3_DIRECTORY}")
+    if directory_start == -1 or f"/{THUMBNAILS_S3_DIRECTORY}" in image_url:
+        return None
+    name_start = directory_start + len(IMAGES_S3_DIRECTORY) + 1
+    return f"{image_url[:directory_start]}/{THUMBNAILS_S3_DIRECTORY}{image_url[name_start:]}"
+
+
+class ImagePipeline:
+    """Optimizes the uploaded images in a pool of worker processes, so decoding never blocks the event loop."""
+
+    def __init__(self, workers_num: int, max_side: int, thumbnail_side: int, quality: int) -> None:
+        self.workers_num = workers_num
+        self.max_side = max_side
+        self.thumbnail_side = thumbnail_side
+        self.quality = quality
+        self.executor = None
+
+    async def optimize(self, source_path: str) -> OptimizedImage:
+        if self.executor is None:
+            # Started on the first upload, most of the bot instances never receive any
+            self.executor = ProcessPoolExecutor(max_workers=self.workers_num)
+        optimized_image = await asyncio.get_running_loop().run_in_executor(
+            self.executor, optimize_image, source_path, self.max_side, self.thumbnail_side, self.quality)
+        IMAGE_BYTES_SAVED.inc(amount=max(optimized_image.get_saved_bytes(), 0))
+        logger.info("Optimized %s: %s -> %s bytes, thumbnail %s bytes", source_path, optimized_image.original_size,
+                    optimized_image.size, optimized_image.thumbnail_size)
+        return optimized_image
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
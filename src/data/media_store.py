@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import os
+from typing import Dict, Tuple
+
+from sqlalchemy import update, delete, select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.database.models import MediaObjectModel
+from src.data.s3bucket import save_file_to_s3, get_s3_url, get_s3_key
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Durations of the stored audio tracks by their keys, loaded on the start and added by the uploads,
+# so the tracks are sent by the presigned URLs without reading the metadata of their objects
+audio_durations: Dict[str, int] = dict()
+
+
+def get_audio_duration(file_url: str) -> int | None:
+    return audio_durations.get(get_s3_key(file_url))
+
+
+def get_content_hash(file_path: str) -> str:
+    """SHA-256 of the file, read in chunks so large tracks are never loaded whole."""
+    content_hash = hashlib.sha256()
+    with open(file_path, "rb") as media_file:
+        while chunk := media_file.read(HASH_CHUNK_SIZE):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+class MediaStore:
+    """
+    Stores the uploaded media in S3 under the hash of their content, so the same file sent again or reused
+    by another point is stored and cached once. Every upload is counted as a reference in the media_objects table,
+    the object is deleted with its last reference.
+    """
+
+    def __init__(self, session) -> None:
+        self.session = session
+
+    def load_durations(self) -> None:
+        """Reads the durations of the stored audio tracks."""
+        try:
+            rows = self.session.execute(select(MediaObjectModel.key, MediaObjectModel.duration)
+                                        .where(MediaObjectModel.duration.isnot(None))).all()
+            self.session.commit()
+        except SQLAlchemyError as e:
+            self.session.rollback()
+            logger.error("Error loading media durations: %s", e)
+            return
+        audio_durations.update(rows)
+        logger.info("Loaded durations of %s audio tracks", len(rows))
+
+    def _acquire(self, key: str, size: int, duration: int | None) -> bool:
+        """Adds a reference to the object, returns whether the object is already uploaded."""
+        statement = insert(MediaObjectModel).values(key=key, refcount=1, size=size, is_uploaded=False,
+                                                    duration=duration)
+        statement = statement.on_conflict_do_update(
+            index_elements=[MediaObjectModel.key],
+            set_={"refcount": MediaObjectModel.refcount + 1,
+                  "duration": func.coalesce(MediaObjectModel.duration, statement.excluded.duration)},
+        ).returning(MediaObjectModel.is_uploaded)
+        try:
+            is_uploaded = self.session.execute(statement).scalar_one()
+            self.session.commit()
+            return is_uploaded
+        except SQLAlchemyError as e:
+            self.session.rollback()
+            logger.error("Error acquiring media object %s: %s", key, e)
+            raise
+
+    def _mark_uploaded(self, key: str) -> None:
+        try:
+            self.session.execute(update(MediaObjectModel).where(MediaObjectModel.key == key).values(is_uploaded=True))
+            self.session.commit()
+        except SQLAlchemyError as e:
+            # The next store of the content uploads it again
+            self.session.rollback()
+            logger.error("Error marking media object %s uploaded: %s", key, e)
+
+    def store(self, file_path: str, s3_directory: str, extension: str, metadata: Dict[str, str] | None = None,
+              duration: int | None = None) -> Tuple[str | None, bool]:
+        """
+        Uploads the file unless the same content is already stored, the duration is kept for the audio tracks.
+        Returns the URL of the object and whether it was uploaded now, so the caller stores its companion files.
+        """
+        content_hash = get_content_hash(file_path)
+        key = f"{s3_directory}{content_hash}{extension}"
+        if duration:
+            audio_durations[key] = duration
+        if self._acquire(key, os.path.getsize(file_path), duration):
+            logger.info("Media %s is already stored, skipping the upload", key)
+            return get_s3_url(key), False
+        # The URL is never returned before the object exists. If another store of the same content is still
+        # uploading it, the content is uploaded once more, so a failure of that upload does not affect this one
+        file_url = save_file_to_s3(file_path, f"{content_hash}{extension}", s3_directory=s3_directory,
+                                   metadata=metadata)
+        if file_url is None:
+            self.release(get_s3_url(key))
+            return None, False
+        self._mark_uploaded(key)
+        return file_url, True
+
+    def release(self, file_url: str) -> bool:
+        """Removes a reference to the object, returns whether it has to be deleted from S3."""
+        key = get_s3_key(file_url)
+        try:
+            refcount = self.session.execute(
+                update(MediaObjectModel).where(MediaObjectModel.key == key)
+                .values(refcount=MediaObjectModel.refcount - 1).returning(MediaObjectModel.refcount)
+            ).scalar_one_or_none()
+            if refcount is not None and refcount <= 0:
+                self.session.execute(delete(MediaObjectModel).where(MediaObjectModel.key == key))
+            self.session.commit()
+        except SQLAlchemyError as e:
+            self.session.rollback()
+            logger.error("Error releasing media object %s: %s", key, e)
+            return False
+        # The objects uploaded before the deduplication are not counted and have a single reference
+        is_deleted = refcount is None or refcount <= 0
+        if is_deleted:
+            audio_durations.pop(key, None)
+        return is_deleted
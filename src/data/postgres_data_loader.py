@@ -1,26 +1,36 @@
-from sqlalchemy import text
+from sqlalchemy import text, update, values, column, Integer
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict
-from src.database.models import InformationPartModel, ExcursionModel, UserStateModel, PointModel, Base
+from typing import List, Dict, Iterator
+from src.database.models import InformationPartModel, ExcursionModel, UserStateModel, PointModel, Base, \
+    CatalogueMetaModel
 from src.components.excursion.excursion import Excursion
 from src.components.excursion.point.point import Point
 from src.components.excursion.point.information_part import InformationPart
 from src.components.user.user_state import UserState
 from src.constants import *
+from src.monitoring.tracing import traced
 import logging
 
+# Tables whose changes increase the catalogue version
+CATALOGUE_TABLES = (ExcursionModel, PointModel, InformationPartModel)
+CATALOGUE_META_ID = 1
+
+logger = logging.getLogger(__name__)
+
 
 class PostgresLoadManager:
     def __init__(self, session) -> None:
         """
         Initializes the MongoLoadManager with a SQLAlchemy session.
         """
-        logging.info("Initializing PostgresLoadManager")
+        logger.info("Initializing PostgresLoadManager")
         self.session = session
+        # Catalogue version the loaded excursions correspond to
+        self.catalogue_version = 0
 
     def load_information_part(self, point_id: int) -> List[InformationPart]:
         """Loads information parts related to a specific point."""
-        logging.info(f"Loading information parts for point {point_id}")
+        logger.debug("Loading information parts for point %s", point_id)
         try:
             data = self.session.query(InformationPartModel).filter_by(parent_id=point_id).all()
             information_parts = list()
@@ -38,20 +48,19 @@ class PostgresLoadManager:
                     dislikes_num=part.dislikes_num or 0,
                     visitors=part.visitors or [],
                 )
-                if part.id > InformationPart.information_part_id:
-                    InformationPart.information_part_id = part.id
                 information_parts.append(information_part)
-            logging.info(f"Found {len(information_parts)} information parts for point {point_id}")
+            logger.debug("Found %s information parts for point %s", len(information_parts), point_id)
             return information_parts
         except SQLAlchemyError as e:
-            logging.error(f"Error loading information parts: {e}")
+            logger.error("Error loading information parts: %s", e)
             return []
 
     def load_points(self, excursion_id: int) -> List[Point]:
         """Loads points related to a specific excursion."""
-        logging.info(f"Loading points for excursion {excursion_id}")
+        logger.debug("Loading points for excursion %s", excursion_id)
         try:
-            data = self.session.query(PointModel).filter_by(parent_id=excursion_id).all()
+            data = self.session.query(PointModel).filter_by(parent_id=excursion_id).order_by(PointModel.position,
+                                                                                             PointModel.id).all()
             points = list()
             for point in data:
                 point_obj = Point(
@@ -61,6 +70,8 @@ class PostgresLoadManager:
                     address=point.address or DEFAULT_ADDRESS,
                     location_photo=point.location_photo,
                     location_link=point.location_link,
+                    latitude=point.latitude,
+                    longitude=point.longitude,
                     photos=point.photos or [],
                     audio=point.audio or [],
                     text=point.text or DEFAULT_TEXT,
@@ -71,19 +82,20 @@ class PostgresLoadManager:
                     extra_information_points=self.load_information_part(point.id),
                     visitors=point.visitors or [],
                 )
-                if point.id > Point.point_id:
-                    Point.point_id = point.id
                 points.append(point_obj)
-            logging.info(f"Found {len(points)} points for excursion {excursion_id}")
+            logger.debug("Found %s points for excursion %s", len(points), excursion_id)
             return points
         except SQLAlchemyError as e:
-            logging.error(f"Error loading points: {e}")
+            logger.error("Error loading points: %s", e)
             return []
 
+    @traced("data_loader.load_excursions")
     def load_excursions(self) -> Dict[str, Excursion]:
         """Loads all excursions and their related points."""
-        logging.info("Loading excursions")
+        logger.info("Loading excursions")
         try:
+            # Read before loading, so changes made during the load are detected by the next version check
+            self.catalogue_version = self.get_catalogue_version()
             excursions = {}
             data = self.session.query(ExcursionModel).all()
             for excursion_data in data:
@@ -100,39 +112,128 @@ class PostgresLoadManager:
                     visitors=excursion_data.visitors or [],
                 )
                 excursions[excursion.get_name()] = excursion
-                if excursion.id > Excursion.excursion_id:
-                    Excursion.excursion_id = excursion.id
-            logging.info(f"Found {len(excursions)} excursions")
+            logger.info("Found %s excursions", len(excursions))
             return excursions
         except SQLAlchemyError as e:
-            logging.error(f"Error loading excursions: {e}")
+            logger.error("Error loading excursions: %s", e)
             return {}
 
-    def load_user_states(self) -> Dict[int, UserState]:
-        """Loads all user states."""
-        logging.info("Loading user states")
+    def load_statistics(self, excursions: Dict[str, Excursion]) -> None:
+        """Sets the lifetime statistics of the loaded excursions, points and information parts from the database."""
+        logger.info("Loading catalogue statistics")
+        elements = {("excursion", excursion.get_id()): excursion for excursion in excursions.values()}
+        for excursion in excursions.values():
+            for point in excursion.get_points():
+                elements[("point", point.get_id())] = point
+                elements.update((("information_part", part.get_id()), part)
+                                for part in point.get_extra_information_points())
         try:
-            user_states = {}
-            data = self.session.query(UserStateModel).all()
-            for user_data in data:
-                user_state = UserState(
-                    username=user_data.username,
-                    chat_id=user_data.chat_id,
-                    user_id=user_data.user_id,
-                    mode=user_data.mode or TEXT_MODE,
-                    is_admin=user_data.username in ADMINS_LIST or user_data.is_admin or False,
-                    paid_excursions=user_data.paid_excursions or [],
-                )
-                user_states[user_state.user_id] = user_state
-            logging.info(f"Found {len(user_states)} user states")
-            return user_states
+            for entity_type, model in (("excursion", ExcursionModel), ("point", PointModel),
+                                       ("information_part", InformationPartModel)):
+                rows = self.session.query(model.id, model.views_num, model.likes_num, model.dislikes_num,
+                                          model.visitors)
+                for element_id, views_num, likes_num, dislikes_num, visitors in rows:
+                    element = elements.get((entity_type, element_id))
+                    if element is not None:
+                        element.set_statistics(views_num or 0, likes_num or 0, dislikes_num or 0, visitors)
+            self.session.commit()
         except SQLAlchemyError as e:
-            logging.error(f"Error loading user states: {e}")
-            return {}
+            logger.error("Error loading catalogue statistics: %s", e)
+            self.session.rollback()
 
-    def save_entity(self, table, entity, entity_id):
-        """Generic save method for any table."""
-        logging.info(f"Saving entity {entity_id} for table {table}")
+    @staticmethod
+    def _build_user_state(user_data: UserStateModel) -> UserState:
+        return UserState(
+            username=user_data.username,
+            chat_id=user_data.chat_id,
+            user_id=user_data.user_id,
+            mode=user_data.mode or TEXT_MODE,
+            is_admin=user_data.username in ADMINS_LIST or user_data.is_admin or False,
+            paid_excursions=user_data.paid_excursions or [],
+            current_excursion_id=user_data.current_excursion_id,
+            current_excursion_step=(user_data.current_excursion_step
+                                    if user_data.current_excursion_step is not None else -1),
+        )
+
+    @traced("data_loader.load_user_state")
+    def load_user_state(self, user_id: int) -> UserState | None:
+        """
+        Loads the state of a single user, returns None if the user is unknown.
+        Database errors are raised, so a failed load is never mistaken for a new user whose blank state
+        would overwrite the stored one.
+        """
+        logger.debug("Loading user state for user %s", user_id)
+        try:
+            user_data = self.session.query(UserStateModel).filter_by(user_id=user_id).first()
+            return self._build_user_state(user_data) if user_data else None
+        except SQLAlchemyError as e:
+            logger.error("Error loading user state %s: %s", user_id, e)
+            self.session.rollback()
+            raise
+
+    def iter_user_states(self, batch_size: int = 1000) -> Iterator[UserState]:
+        """
+        Streams all user states ordered by user ID.
+        Users are fetched in keyset-paginated batches, so the session can be used by other handlers between batches.
+        """
+        logger.info("Streaming user states")
+        last_user_id = None
+        while True:
+            try:
+                query = self.session.query(UserStateModel)
+                if last_user_id is not None:
+                    query = query.filter(UserStateModel.user_id > last_user_id)
+                data = query.order_by(UserStateModel.user_id).limit(batch_size).all()
+            except SQLAlchemyError as e:
+                logger.error("Error streaming user states: %s", e)
+                self.session.rollback()
+                return
+            for user_data in data:
+                yield self._build_user_state(user_data)
+            if len(data) < batch_size:
+                return
+            last_user_id = data[-1].user_id
+
+    def iter_chat_ids(self, batch_size: int = 1000) -> Iterator[List[int]]:
+        """
+        Streams the chat IDs of all users in keyset-paginated batches ordered by user ID.
+        Only the IDs are read, no user states are built.
+        """
+        last_user_id = None
+        while True:
+            try:
+                query = (self.session.query(UserStateModel.user_id, UserStateModel.chat_id)
+                         .filter(UserStateModel.chat_id.isnot(None)))
+                if last_user_id is not None:
+                    query = query.filter(UserStateModel.user_id > last_user_id)
+                data = query.order_by(UserStateModel.user_id).limit(batch_size).all()
+            except SQLAlchemyError as e:
+                logger.error("Error streaming chat IDs: %s", e)
+                self.session.rollback()
+                return
+            if data:
+                yield [chat_id for _, chat_id in data]
+            if len(data) < batch_size:
+                return
+            last_user_id = data[-1].user_id
+
+    def get_catalogue_version(self) -> int:
+        """Returns the current catalogue version stored in the database."""
+        version = self.session.query(CatalogueMetaModel.version).filter_by(id=CATALOGUE_META_ID).scalar()
+        return version or 0
+
+    def increase_catalogue_version(self) -> None:
+        """Increases the catalogue version in the current transaction."""
+        self.catalogue_version = self.session.execute(
+            text("INSERT INTO catalogue_meta (id, version) VALUES (:id, 1) "
+                 "ON CONFLICT (id) DO UPDATE SET version = catalogue_meta.version + 1 RETURNING version"),
+            {"id": CATALOGUE_META_ID},
+        ).scalar_one()
+
+    @traced("data_loader.save_entity")
+    def save_entity(self, table, entity, entity_id) -> bool:
+        """Generic save method for any table, returns whether the entity is saved."""
+        logger.debug("Saving entity %s for table %s", entity_id, table)
         try:
             entity_model = entity.to_model()
             existing = self.session.query(table).filter_by(id=entity_id).first()
@@ -140,54 +241,79 @@ class PostgresLoadManager:
                 self.session.merge(entity_model)
             else:
                 self.session.add(entity_model)
+            if table in CATALOGUE_TABLES:
+                self.increase_catalogue_version()
             self.session.commit()
-            logging.info(f"Saved entity with ID {entity_id} to the database.")
+            logger.debug("Saved entity with ID %s to the database.", entity_id)
+            return True
         except SQLAlchemyError as e:
-            logging.error(f"Error saving entity with ID {entity_id}: {e}")
+            logger.error("Error saving entity with ID %s: %s", entity_id, e)
             self.session.rollback()
+            return False
 
+    @traced("data_loader.delete_entity")
     def delete_entity(self, table, entity_id):
         """Generic delete method for any table."""
-        logging.info(f"Deleting entity with ID: {entity_id}")
+        logger.debug("Deleting entity with ID: %s", entity_id)
         try:
             self.session.query(table).filter_by(id=entity_id).delete()
+            if table in CATALOGUE_TABLES:
+                self.increase_catalogue_version()
             self.session.commit()
-            logging.info(f"Deleted entity with ID: {entity_id} from the database.")
+            logger.debug("Deleted entity with ID: %s from the database.", entity_id)
         except SQLAlchemyError as e:
-            logging.error(f"Error deleting entity with ID: {entity_id}: {e}")
+            logger.error("Error deleting entity with ID: %s: %s", entity_id, e)
             self.session.rollback()
 
     # ExcursionModel
-    def save_excursion(self, excursion: Excursion) -> None:
-        logging.info(f"Saving excursion {excursion.get_name()} with ID {excursion.get_id()}")
-        self.save_entity(ExcursionModel, excursion, excursion.get_id())
+    def save_excursion(self, excursion: Excursion) -> bool:
+        logger.debug("Saving excursion %s with ID %s", excursion.get_name(), excursion.get_id())
+        return self.save_entity(ExcursionModel, excursion, excursion.get_id())
 
     def delete_excursion(self, excursion_id: int) -> None:
-        logging.info(f"Deleting excursion with ID: {excursion_id}")
+        logger.info("Deleting excursion with ID: %s", excursion_id)
         self.delete_entity(ExcursionModel, excursion_id)
 
     def save_information_part(self, information_part: InformationPart) -> None:
-        logging.info(f"Saving information part {information_part.get_name()} with ID: {information_part.get_id()}")
+        logger.debug("Saving information part %s with ID: %s", information_part.get_name(), information_part.get_id())
         self.save_entity(InformationPartModel, information_part, information_part.get_id())
 
     def delete_information_part(self, information_part_id: int) -> None:
-        logging.info(f"Deleting information part with ID: {information_part_id}")
+        logger.info("Deleting information part with ID: %s", information_part_id)
         self.delete_entity(InformationPartModel, information_part_id)
 
     # PointModel
     def save_point(self, point: Point) -> None:
-        logging.info(f"Saving point {point.get_name()} with ID: {point.get_id()}")
+        logger.debug("Saving point %s with ID: %s", point.get_name(), point.get_id())
         self.save_entity(PointModel, point, point.get_id())
 
     def delete_point(self, point_id: int) -> None:
-        logging.info(f"Deleting point with ID: {point_id}")
+        logger.info("Deleting point with ID: %s", point_id)
         self.delete_entity(PointModel, point_id)
 
+    @traced("data_loader.save_points_order")
+    def save_points_order(self, excursion: Excursion) -> None:
+        """Writes the positions of all the points of the excursion in one statement."""
+        if not excursion.get_points():
+            return
+        logger.info("Saving points order of excursion %s", excursion.get_id())
+        new_positions = values(column("id", Integer), column("position", Integer), name="new_positions").data(
+            [(point.get_id(), position) for position, point in enumerate(excursion.get_points())])
+        try:
+            self.session.execute(update(PointModel).where(PointModel.id == new_positions.c.id)
+                                 .values(position=new_positions.c.position))
+            self.increase_catalogue_version()
+            self.session.commit()
+        except SQLAlchemyError as e:
+            logger.error("Error saving points order of excursion %s: %s", excursion.get_id(), e)
+            self.session.rollback()
+
     # UserStateModel
+    @traced("data_loader.save_user_state")
     def save_user_state(self, user_state: UserState) -> None:
 
         # self.save_entity(UserStateModel, user_state, user_state.get_user_id())
-        logging.info(f"Saving user {user_state.get_username()} state with ID: {user_state.get_user_id()}")
+        logger.debug("Saving user %s state with ID: %s", user_state.get_username(), user_state.get_user_id())
         try:
             user_state_model = user_state.to_model()  # Convert to database model
             existing = self.session.query(UserStateModel).filter_by(user_id=user_state.get_user_id()).first()
@@ -196,31 +322,54 @@ class PostgresLoadManager:
             else:
                 self.session.add(user_state_model)
             self.session.commit()
-            logging.info(f"Saved user state with ID {user_state.get_user_id()} to the database.")
+            logger.debug("Saved user state with ID %s to the database.", user_state.get_user_id())
+        except SQLAlchemyError as e:
+            logger.error("Error saving user state with ID %s: %s", user_state.get_user_id(), e)
+            self.session.rollback()
+
+    @traced("data_loader.save_users_progress")
+    def save_users_progress(self, user_states: List[UserState]) -> bool:
+        """Writes only the excursion progress and mode of the users in one bulk update, returns whether it is saved."""
+        if not user_states:
+            return True
+        logger.info("Saving excursion progress of %s users", len(user_states))
+        try:
+            self.session.execute(update(UserStateModel), [
+                {
+                    "user_id": user_state.get_user_id(),
+                    "current_excursion_id": user_state.get_current_excursion_id(),
+                    "current_excursion_step": user_state.get_current_excursion_step(),
+                    "mode": user_state.mode,
+                }
+                for user_state in user_states
+            ])
+            self.session.commit()
+            return True
         except SQLAlchemyError as e:
-            logging.error(f"Error saving user state with ID {user_state.get_user_id()}: {e}")
+            logger.error("Error saving excursion progress: %s", e)
             self.session.rollback()
+            return False
 
     def delete_user_state(self, user_id: int) -> None:
-        logging.info(f"Deleting user state with ID: {user_id}")
+        logger.info("Deleting user state with ID: %s", user_id)
         self.delete_entity(UserStateModel, user_id)
 
     def clear_database(self) -> None:
-        logging.info("Clearing database")
+        logger.info("Clearing database")
         try:
             # Disable foreign key checks if needed
             self.session.execute(text("SET session_replication_role = 'replica';"))
             # Iterate through all tables and clear them
             for table in reversed(Base.metadata.sorted_tables):
-                print(f"Clearing table {table.name}...")
+                logger.info("Clearing table %s...", table.name)
                 self.session.execute(table.delete())
 
             # Re-enable foreign key checks
             self.session.execute(text("SET session_replication_role = 'origin';"))
             self.session.commit()
-            logging.info("All tables cleared successfully.")
+            logger.info("All tables cleared successfully.")
         except Exception as e:
             self.session.rollback()
-            logging.error(f"Error clearing tables: {e}")
+            logger.error("Error clearing tables: %s", e)
         # finally:
         #     self.session.close()
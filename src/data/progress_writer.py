@@ -0,0 +1,67 @@
+import time
+from typing import Dict
+
+from src.components.user.user_state import UserState
+from src.data.postgres_data_loader import PostgresLoadManager
+
+
+class ProgressWriter:
+    """
+    Coalesces writes of the users' excursion progress.
+    A change is written right away if the user was not written during the last flush interval,
+    otherwise it is kept pending and written by the next due flush, so each user is written at most once per interval.
+    The changes of a failed write are kept pending and retried by the next due flush.
+    """
+
+    def __init__(self, data_loader: PostgresLoadManager, flush_interval: float) -> None:
+        self.data_loader = data_loader
+        self.flush_interval = flush_interval
+        self.pending: Dict[int, UserState] = dict()
+        self.last_write: Dict[int, float] = dict()
+
+    def schedule(self, user_state: UserState) -> None:
+        """Registers a progress change of the user."""
+        user_id = user_state.get_user_id()
+        now = time.monotonic()
+        last_write = self.last_write.get(user_id)
+        if last_write is None or now - last_write >= self.flush_interval:
+            self.pending.pop(user_id, None)
+            self._write([user_state], now)
+        else:
+            self.pending[user_id] = user_state
+
+    def flush_due(self) -> None:
+        """Writes the pending changes of the users whose flush interval has passed."""
+        now = time.monotonic()
+        due = [user_state for user_id, user_state in self.pending.items()
+               if user_id not in self.last_write or now - self.last_write[user_id] >= self.flush_interval]
+        for user_state in due:
+            del self.pending[user_state.get_user_id()]
+        self._write(due, now)
+        # Users without pending changes and with an expired interval do not need to be tracked anymore
+        expired = [user_id for user_id, last_write in self.last_write.items()
+                   if now - last_write >= self.flush_interval and user_id not in self.pending]
+        for user_id in expired:
+            del self.last_write[user_id]
+
+    def flush_user(self, user_id: int) -> None:
+        """Writes the pending change of the user, e.g. before its state leaves the cache."""
+        user_state = self.pending.pop(user_id, None)
+        if user_state is not None:
+            self._write([user_state], time.monotonic())
+
+    def flush(self) -> None:
+        """Writes all the pending changes."""
+        pending = list(self.pending.values())
+        self.pending.clear()
+        self._write(pending, time.monotonic())
+
+    def _write(self, user_states: list[UserState], now: float) -> None:
+        if not user_states:
+            return
+        if not self.data_loader.save_users_progress(user_states):
+            for user_state in user_states:
+                self.pending[user_state.get_user_id()] = user_state
+            return
+        for user_state in user_states:
+            self.last_write[user_state.get_user_id()] = now
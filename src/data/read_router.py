@@ -0,0 +1,105 @@
+import logging
+import time
+from typing import Callable, List, TypeVar
+
+from botocore.client import BaseClient
+from botocore.exceptions import BotoCoreError, ClientError
+
+from src.monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Weight of the last call in the moving average of the endpoint latency
+LATENCY_SMOOTHING = 0.2
+# Every n-th read goes through the endpoints in the configured order to refresh their latencies
+PROBE_INTERVAL = 50
+# Consecutive failures after which the endpoint is skipped for the cooldown
+FAILURES_THRESHOLD = 3
+NOT_FOUND_CODES = ("404", "NoSuchKey", "NotFound")
+
+S3_READ_FAILOVERS = metrics.counter("volkaround_s3_read_failovers_total",
+                                    "S3 reads that failed on the endpoint and went to the next one", ("endpoint",))
+
+
+class ReadEndpoint:
+    __slots__ = ("url", "client", "latency", "failures_num", "unhealthy_until")
+
+    def __init__(self, url: str | None) -> None:
+        self.url = url
+        self.client = None
+        self.latency = 0.0  # Not measured yet, so it is tried first
+        self.failures_num = 0
+        self.unhealthy_until = 0.0
+
+    def get_name(self) -> str:
+        return self.url or "default"
+
+
+class ReadEndpointRouter:
+    """
+    Routes the S3 reads to the fastest healthy endpoint of the ordered list, e.g. an edge cache, a regional replica
+    and the primary. A failed read goes to the next endpoint, an endpoint failing repeatedly is skipped for
+    the cooldown. Missing objects are looked up on the next endpoints as well, since replicas may lag behind.
+    """
+
+    def __init__(self, endpoint_urls: List[str | None], create_client: Callable[[str | None], BaseClient],
+                 cooldown: float) -> None:
+        self.endpoints = [ReadEndpoint(url) for url in endpoint_urls]
+        self.create_client = create_client
+        self.cooldown = cooldown
+        self.reads_num = 0
+
+    def get_endpoints_order(self) -> List[ReadEndpoint]:
+        """Healthy endpoints by latency, then the unhealthy ones in case all the healthy fail."""
+        self.reads_num += 1
+        now = time.monotonic()
+        healthy_endpoints = [endpoint for endpoint in self.endpoints if endpoint.unhealthy_until <= now]
+        unhealthy_endpoints = [endpoint for endpoint in self.endpoints if endpoint.unhealthy_until > now]
+        if self.reads_num % PROBE_INTERVAL:
+            healthy_endpoints.sort(key=lambda endpoint: endpoint.latency)
+        return healthy_endpoints + unhealthy_endpoints
+
+    def _get_client(self, endpoint: ReadEndpoint) -> BaseClient:
+        if endpoint.client is None:
+            endpoint.client = self.create_client(endpoint.url)
+        return endpoint.client
+
+    def _record_success(self, endpoint: ReadEndpoint, latency: float) -> None:
+        endpoint.latency = (latency if not endpoint.latency
+                            else endpoint.latency + LATENCY_SMOOTHING * (latency - endpoint.latency))
+        endpoint.failures_num = 0
+        endpoint.unhealthy_until = 0.0
+
+    def _record_failure(self, endpoint: ReadEndpoint, error: Exception) -> None:
+        S3_READ_FAILOVERS.inc(endpoint.get_name())
+        endpoint.failures_num += 1
+        if endpoint.failures_num >= FAILURES_THRESHOLD:
+            endpoint.unhealthy_until = time.monotonic() + self.cooldown
+            logger.warning("S3 read endpoint %s is unhealthy for %s s: %s", endpoint.get_name(), self.cooldown, error)
+        else:
+            logger.warning("S3 read from %s failed, trying the next endpoint: %s", endpoint.get_name(), error)
+
+    def call(self, read: Callable[[BaseClient], T]) -> T:
+        """Runs the read with the clients of the endpoints until one of them succeeds."""
+        last_error = None
+        for endpoint in self.get_endpoints_order():
+            client = self._get_client(endpoint)
+            started_at = time.perf_counter()
+            try:
+                result = read(client)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in NOT_FOUND_CODES:
+                    self._record_failure(endpoint, e)
+                else:
+                    self._record_success(endpoint, time.perf_counter() - started_at)
+                last_error = e
+                continue
+            except BotoCoreError as e:
+                self._record_failure(endpoint, e)
+                last_error = e
+                continue
+            self._record_success(endpoint, time.perf_counter() - started_at)
+            return result
+        raise last_error
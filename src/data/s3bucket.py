@@ -1,30 +1,89 @@
+import functools
 import os
 import boto3
 import logging
 from urllib.parse import urlparse
-from botocore.client import BaseClient
+from botocore.client import BaseClient, Config
 from botocore.exceptions import ClientError
 from io import BytesIO
+from typing import Dict, Tuple
+from src.monitoring.metrics import instrument_s3_client
+from src.monitoring.tracing import trace_s3_client
+from src.data.read_router import ReadEndpointRouter
 from src.settings import AWS_REGION, AWS_SERVER_PUBLIC_KEY, AWS_SERVER_SECRET_KEY, BUCKET_NAME, ENDPOINT_URL, \
-    CUSTOM_ENDPOINT_URL, EDGE_ENDPOINT_URL
+    CUSTOM_ENDPOINT_URL, EDGE_ENDPOINT_URL, READ_ENDPOINT_URLS, READ_ENDPOINT_COOLDOWN, READ_CONNECT_TIMEOUT, \
+    READ_TIMEOUT, READ_MAX_RETRIES
 
+logger = logging.getLogger(__name__)
 
-def get_s3_client() -> BaseClient:
+
+def get_s3_client(endpoint_url: str | None = ENDPOINT_URL, config: Config | None = None) -> BaseClient:
+    session = boto3.session.Session()
+    client = session.client('s3',
+                            region_name=AWS_REGION,
+                            endpoint_url=endpoint_url,
+                            aws_access_key_id=AWS_SERVER_PUBLIC_KEY,
+                            aws_secret_access_key=AWS_SERVER_SECRET_KEY,
+                            config=config)
+    instrument_s3_client(client)
+    trace_s3_client(client)
+    return client
+
+
+def get_read_endpoint_urls() -> list[str | None]:
+    endpoint_urls = list(READ_ENDPOINT_URLS)
+    if not endpoint_urls and EDGE_ENDPOINT_URL:
+        endpoint_urls.append(EDGE_ENDPOINT_URL)
+    if ENDPOINT_URL not in endpoint_urls:
+        endpoint_urls.append(ENDPOINT_URL)
+    return endpoint_urls
+
+
+# Short timeouts and few retries, the router retries a failed read with the next endpoint instead
+READ_CLIENT_CONFIG = Config(connect_timeout=READ_CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                            retries={'max_attempts': READ_MAX_RETRIES})
+
+# The clients are created on the first read through the module function, so the benchmarks can replace it
+read_router = ReadEndpointRouter(get_read_endpoint_urls(),
+                                 lambda endpoint_url: get_s3_client(endpoint_url, READ_CLIENT_CONFIG),
+                                 READ_ENDPOINT_COOLDOWN)
+
+
+@functools.lru_cache(maxsize=1)
+def get_presigning_client() -> BaseClient:
+    """Client signing the URLs handed to Telegram, the signing is done locally without any request."""
     session = boto3.session.Session()
     return session.client('s3',
                           region_name=AWS_REGION,
-                          endpoint_url=ENDPOINT_URL,
+                          endpoint_url=CUSTOM_ENDPOINT_URL or ENDPOINT_URL,
                           aws_access_key_id=AWS_SERVER_PUBLIC_KEY,
-                          aws_secret_access_key=AWS_SERVER_SECRET_KEY)
+                          aws_secret_access_key=AWS_SERVER_SECRET_KEY,
+                          config=Config(signature_version='s3v4'))
+
+
+def s3_presign_file(file_url: str, expires_in: int) -> str:
+    """Returns a temporary GET URL of the file, so it can be fetched without the credentials."""
+    return get_presigning_client().generate_presigned_url(
+        'get_object', Params={'Bucket': BUCKET_NAME, 'Key': get_s3_key(file_url)}, ExpiresIn=expires_in)
+
+
+def get_s3_url(s3_object_key: str) -> str:
+    return f"https://{BUCKET_NAME}.s3.amazonaws.com/{s3_object_key}"
+
 
+def get_s3_key(file_url: str) -> str:
+    return urlparse(file_url).path.lstrip('/')
 
-def save_file_to_s3(file_path: str, s3_file_name: str, s3_directory: str = "images/") -> str | None:
+
+def save_file_to_s3(file_path: str, s3_file_name: str, s3_directory: str = "images/",
+                    metadata: Dict[str, str] | None = None) -> str | None:
     """
     Uploads a photo to an AWS S3 bucket.
 
     :param s3_file_name:
     :param file_path: The local file path of the photo to upload.
     :param s3_directory: The directory in the S3 bucket where the photo will be stored. Default is "images/".
+    :param metadata: User metadata stored with the object, e.g. the duration of an audio track.
     :return: The public URL of the uploaded photo if successful, None otherwise.
     """
     # Ensure the file exists locally
@@ -41,14 +100,14 @@ def save_file_to_s3(file_path: str, s3_file_name: str, s3_directory: str = "imag
         # Upload the file to S3
         s3_client = get_s3_client()  # Assume get_s3_client() is defined to return a configured S3 client
 
-        s3_client.upload_file(file_path, BUCKET_NAME, s3_object_key)
+        s3_client.upload_file(file_path, BUCKET_NAME, s3_object_key,
+                              ExtraArgs={"Metadata": metadata} if metadata else None)
 
         # Generate the public URL of the uploaded photo
-        photo_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{s3_object_key}"
-        return photo_url
+        return get_s3_url(s3_object_key)
 
     except ClientError as e:
-        logging.error(f"Failed to upload photo to S3: {e}")
+        logger.error("Failed to upload photo to S3: %s", e)
         return None
 
 
@@ -58,27 +117,36 @@ def s3_file_exists(file_url) -> bool:
         parsed_url = urlparse(file_url)
         file_key = parsed_url.path.lstrip('/')  # Extract the file key from the URL
 
-        s3_client = get_s3_client()
-        s3_client.head_object(Bucket=BUCKET_NAME, Key=file_key)
+        read_router.call(lambda s3_client: s3_client.head_object(Bucket=BUCKET_NAME, Key=file_key))
         return True
     except ClientError as e:
         if e.response['Error']['Code'] == '404':
             return False
-        logging.error(f"Error checking file existence in S3: {e}")
+        logger.error("Error checking file existence in S3: %s", e)
         return False
 
 
 def s3_fetch_file(file_url) -> BytesIO | None:
     """Fetch a file from S3 using its URL."""
+    fetched_file = s3_fetch_file_with_metadata(file_url)
+    return fetched_file[0] if fetched_file else None
+
+
+def _read_object(s3_client: BaseClient, file_key: str) -> Tuple[BytesIO, Dict[str, str]]:
+    response = s3_client.get_object(Bucket=BUCKET_NAME, Key=file_key)
+    return BytesIO(response['Body'].read()), response.get('Metadata', dict())
+
+
+def s3_fetch_file_with_metadata(file_url) -> Tuple[BytesIO, Dict[str, str]] | None:
+    """Fetch a file from S3 using its URL along with the user metadata stored with it."""
     try:
         parsed_url = urlparse(file_url)
         file_key = parsed_url.path.lstrip('/')  # Extract the file key from the URL
 
-        s3_client = get_s3_client()
-        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=file_key)
-        return BytesIO(response['Body'].read())
+        # The body is read inside the routed call, so a broken transfer fails over as well
+        return read_router.call(lambda s3_client: _read_object(s3_client, file_key))
     except ClientError as e:
-        logging.error(f"Failed to fetch file from S3: {e}")
+        logger.error("Failed to fetch file from S3: %s", e)
         return None
 
 
@@ -90,8 +158,8 @@ def s3_delete_file(file_url) -> bool:
 
         s3_client = get_s3_client()
         s3_client.delete_object(Bucket=BUCKET_NAME, Key=file_key)
-        logging.info(f"File deleted from S3: {file_key}")
+        logger.info("File deleted from S3: %s", file_key)
         return True
     except ClientError as e:
-        logging.error(f"Failed to delete file from S3: {e}")
+        logger.error("Failed to delete file from S3: %s", e)
         return False
@@ -0,0 +1,243 @@
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy import text, func, select, bindparam, cast
+from sqlalchemy.dialects.postgresql import insert, JSONB
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.components.excursion.stats_object import StatsObject
+from src.database.models import StatsDailyModel, ExcursionStartModel, ExcursionModel, PointModel, \
+    InformationPartModel, PointArrivalModel, ExcursionCompletionModel
+from src.monitoring.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("views", "new_visitors", "likes", "dislikes")
+# Tables of the lifetime counters by the entity type
+ENTITY_TABLES = {
+    "excursion": ExcursionModel.__table__,
+    "point": PointModel.__table__,
+    "information_part": InformationPartModel.__table__,
+}
+
+# Moves the days older than the cutoff into the row of the first day of their month
+COMPACT_STATS_QUERY = text("""
+    WITH compacted AS (
+        DELETE FROM stats_daily
+        WHERE day < :cutoff AND day <> date_trunc('month', day)::date
+        RETURNING entity_type, entity_id, day, views, new_visitors, likes, dislikes
+    )
+    INSERT INTO stats_daily (entity_type, entity_id, day, views, new_visitors, likes, dislikes)
+    SELECT entity_type, entity_id, date_trunc('month', day)::date,
+           sum(views), sum(new_visitors), sum(likes), sum(dislikes)
+    FROM compacted
+    GROUP BY entity_type, entity_id, date_trunc('month', day)::date
+    ON CONFLICT (entity_type, entity_id, day) DO UPDATE SET
+        views = stats_daily.views + excluded.views,
+        new_visitors = stats_daily.new_visitors + excluded.new_visitors,
+        likes = stats_daily.likes + excluded.likes,
+        dislikes = stats_daily.dislikes + excluded.dislikes
+""")
+# Rows of the deleted excursions, points and information parts
+DELETE_ORPHANED_STATS_QUERY = text("""
+    DELETE FROM stats_daily AS stats
+    WHERE (stats.entity_type = 'excursion' AND NOT EXISTS (SELECT 1 FROM excursions WHERE id = stats.entity_id))
+       OR (stats.entity_type = 'point' AND NOT EXISTS (SELECT 1 FROM points WHERE id = stats.entity_id))
+       OR (stats.entity_type = 'information_part'
+           AND NOT EXISTS (SELECT 1 FROM information_parts WHERE id = stats.entity_id))
+""")
+DELETE_ORPHANED_STARTS_QUERY = text("""
+    DELETE FROM excursion_starts AS starts
+    WHERE NOT EXISTS (SELECT 1 FROM excursions WHERE id = starts.excursion_id)
+""")
+DELETE_ORPHANED_ARRIVALS_QUERY = text("""
+    DELETE FROM point_arrivals AS arrivals
+    WHERE NOT EXISTS (SELECT 1 FROM points WHERE id = arrivals.point_id)
+""")
+DELETE_ORPHANED_COMPLETIONS_QUERY = text("""
+    DELETE FROM excursion_completions AS completions
+    WHERE NOT EXISTS (SELECT 1 FROM excursions WHERE id = completions.excursion_id)
+""")
+
+
+class StatsWindow:
+    __slots__ = ("days", "views", "new_visitors", "likes", "dislikes")
+
+    def __init__(self, days: int, views: int = 0, new_visitors: int = 0, likes: int = 0, dislikes: int = 0) -> None:
+        self.days = days
+        self.views = views
+        self.new_visitors = new_visitors
+        self.likes = likes
+        self.dislikes = dislikes
+
+
+class StatsRecorder:
+    """
+    Counts the interactions with the excursions, points and information parts per day in memory
+    and adds them to the stats_daily rollups in one upsert per flush. The lifetime counters and visitors of the
+    entities are increased by the same flush in place, so the statistics never rewrite the whole catalogue rows.
+    The excursion starts, point arrivals and completions of the funnel are kept until the flush as well and
+    written to their tables.
+    """
+
+    def __init__(self, session) -> None:
+        self.session = session
+        self.pending: Dict[Tuple[str, int, date], List[int]] = dict()
+        self.pending_visitors: Dict[Tuple[str, int], List[int]] = dict()
+        self.pending_starts: Set[Tuple[int, int]] = set()
+        self.pending_arrivals: Set[Tuple[int, int, int]] = set()
+        self.pending_completions: Set[Tuple[int, int]] = set()
+
+    def record(self, element: StatsObject, views: int = 0, new_visitors: int = 0, likes: int = 0,
+               dislikes: int = 0) -> None:
+        key = (element.stats_entity_type, element.get_id(), date.today())
+        counters = self.pending.get(key)
+        if counters is None:
+            counters = self.pending[key] = [0] * len(COUNTERS)
+        counters[0] += views
+        counters[1] += new_visitors
+        counters[2] += likes
+        counters[3] += dislikes
+
+    def record_view(self, element: StatsObject, user_id: int) -> None:
+        """Counts the view of the element and the visit of the user, the user is added to the element's visitors."""
+        is_new_visitor = element.add_new_visitor(user_id)
+        if is_new_visitor:
+            self.pending_visitors.setdefault((element.stats_entity_type, element.get_id()), []).append(user_id)
+        self.record(element, views=1, new_visitors=int(is_new_visitor))
+
+    def record_start(self, element: StatsObject, user_id: int) -> None:
+        self.pending_starts.add((element.get_id(), user_id))
+
+    def record_arrival(self, excursion: StatsObject, point: StatsObject, user_id: int) -> None:
+        self.pending_arrivals.add((excursion.get_id(), point.get_id(), user_id))
+
+    def record_completion(self, excursion: StatsObject, user_id: int) -> None:
+        self.pending_completions.add((excursion.get_id(), user_id))
+
+    @traced("stats_recorder.flush")
+    def flush(self) -> None:
+        self._flush_funnel()
+        if not self.pending:
+            return
+        pending = self.pending
+        pending_visitors = self.pending_visitors
+        self.pending = dict()
+        self.pending_visitors = dict()
+        statement = insert(StatsDailyModel).values([
+            {"entity_type": entity_type, "entity_id": entity_id, "day": day, **dict(zip(COUNTERS, counters))}
+            for (entity_type, entity_id, day), counters in pending.items()
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=[StatsDailyModel.entity_type, StatsDailyModel.entity_id, StatsDailyModel.day],
+            set_={counter: getattr(StatsDailyModel, counter) + getattr(statement.excluded, counter)
+                  for counter in COUNTERS},
+        )
+        try:
+            self.session.execute(statement)
+            self._increase_totals(pending, pending_visitors)
+            self.session.commit()
+            logger.debug("Flushed %s statistics rollups", len(pending))
+        except SQLAlchemyError as e:
+            self.session.rollback()
+            logger.error("Error flushing statistics rollups: %s", e)
+            # Kept for the next flush, nothing is recorded meanwhile as the flush does not yield to the event loop
+            self.pending = pending
+            self.pending_visitors = pending_visitors
+
+    def _increase_totals(self, pending: Dict[Tuple[str, int, date], List[int]],
+                         pending_visitors: Dict[Tuple[str, int], List[int]]) -> None:
+        totals: Dict[Tuple[str, int], List[int]] = dict()
+        for (entity_type, entity_id, _), counters in pending.items():
+            entity_totals = totals.setdefault((entity_type, entity_id), [0] * len(COUNTERS))
+            for index, counter in enumerate(counters):
+                entity_totals[index] += counter
+        for entity_type, table in ENTITY_TABLES.items():
+            parameters = [
+                {"entity_id": entity_id, "added_views": views, "added_likes": likes, "added_dislikes": dislikes,
+                 "added_visitors": pending_visitors.get((entity_type, entity_id), [])}
+                for (totals_entity_type, entity_id), (views, _, likes, dislikes) in totals.items()
+                if totals_entity_type == entity_type
+            ]
+            if not parameters:
+                continue
+            self.session.execute(
+                table.update().where(table.c.id == bindparam("entity_id")).values(
+                    views_num=func.coalesce(table.c.views_num, 0) + bindparam("added_views"),
+                    likes_num=func.coalesce(table.c.likes_num, 0) + bindparam("added_likes"),
+                    dislikes_num=func.coalesce(table.c.dislikes_num, 0) + bindparam("added_dislikes"),
+                    visitors=func.coalesce(table.c.visitors, cast([], JSONB)).op("||")(
+                        bindparam("added_visitors", type_=JSONB)),
+                ),
+                parameters,
+            )
+
+    def _flush_funnel(self) -> None:
+        if not (self.pending_starts or self.pending_arrivals or self.pending_completions):
+            return
+        pending_starts, pending_arrivals, pending_completions = (self.pending_starts, self.pending_arrivals,
+                                                                 self.pending_completions)
+        self.pending_starts, self.pending_arrivals, self.pending_completions = set(), set(), set()
+        try:
+            if pending_starts:
+                self.session.execute(insert(ExcursionStartModel).values([
+                    {"excursion_id": excursion_id, "user_id": user_id} for excursion_id, user_id in pending_starts
+                ]).on_conflict_do_nothing())
+            if pending_arrivals:
+                self.session.execute(insert(PointArrivalModel).values([
+                    {"excursion_id": excursion_id, "point_id": point_id, "user_id": user_id}
+                    for excursion_id, point_id, user_id in pending_arrivals
+                ]).on_conflict_do_nothing())
+            if pending_completions:
+                self.session.execute(insert(ExcursionCompletionModel).values([
+                    {"excursion_id": excursion_id, "user_id": user_id} for excursion_id, user_id in pending_completions
+                ]).on_conflict_do_nothing())
+            self.session.commit()
+        except SQLAlchemyError as e:
+            self.session.rollback()
+            logger.error("Error flushing excursion funnel steps: %s", e)
+            self.pending_starts, self.pending_arrivals, self.pending_completions = (pending_starts, pending_arrivals,
+                                                                                   pending_completions)
+
+    def get_windows(self, element: StatsObject, windows_days: List[int]) -> List[StatsWindow]:
+        """Sums the rollups of the element over the last days of every window, today included."""
+        self.flush()
+        today = date.today()
+        columns = []
+        for days in windows_days:
+            is_in_window = StatsDailyModel.day > today - timedelta(days=days)
+            columns.extend(func.coalesce(func.sum(getattr(StatsDailyModel, counter)).filter(is_in_window), 0)
+                           for counter in COUNTERS)
+        try:
+            row = self.session.execute(
+                select(*columns).where(StatsDailyModel.entity_type == element.stats_entity_type,
+                                       StatsDailyModel.entity_id == element.get_id(),
+                                       StatsDailyModel.day > today - timedelta(days=max(windows_days)))
+            ).one()
+        except SQLAlchemyError as e:
+            self.session.rollback()
+            logger.error("Error loading statistics of %s %s: %s", element.stats_entity_type, element.get_id(), e)
+            return [StatsWindow(days) for days in windows_days]
+        return [StatsWindow(days, *row[index * len(COUNTERS):(index + 1) * len(COUNTERS)])
+                for index, days in enumerate(windows_days)]
+
+
+def compact_stats(session, retention_days: int) -> None:
+    """
+    Compacts the days older than the retention into months and drops the rollups and funnel steps of the deleted
+    entities.
+    """
+    try:
+        compacted = session.execute(COMPACT_STATS_QUERY,
+                                    {"cutoff": date.today() - timedelta(days=retention_days)}).rowcount
+        deleted = session.execute(DELETE_ORPHANED_STATS_QUERY).rowcount
+        deleted += session.execute(DELETE_ORPHANED_STARTS_QUERY).rowcount
+        deleted += session.execute(DELETE_ORPHANED_ARRIVALS_QUERY).rowcount
+        deleted += session.execute(DELETE_ORPHANED_COMPLETIONS_QUERY).rowcount
+        session.commit()
+        logger.info("Compacted statistics rollups: %s monthly rows updated, %s orphaned rows deleted",
+                    compacted, deleted)
+    except SQLAlchemyError as e:
+        session.rollback()
+        logger.error("Error compacting statistics rollups: %s", e)
@@ -0,0 +1,102 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator
+
+from src.components.user.user_state import UserState
+from src.data.postgres_data_loader import PostgresLoadManager
+from src.data.progress_writer import ProgressWriter
+
+
+class UserStateStore:
+    """
+    Keeps the states of recently active users in memory and loads the others from the database on first touch.
+    The least recently used states are evicted when the store is full or when they were idle for too long,
+    dirty states and the pending progress of the evicted users are written back to the database on eviction.
+    """
+
+    def __init__(self, data_loader: PostgresLoadManager, progress_writer: ProgressWriter, max_size: int,
+                 idle_timeout: float) -> None:
+        self.data_loader = data_loader
+        self.progress_writer = progress_writer
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        # Ordered from the least to the most recently used user
+        self.user_states: OrderedDict[int, UserState] = OrderedDict()
+        self.last_access: Dict[int, float] = dict()
+
+    def __len__(self) -> int:
+        return len(self.user_states)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.user_states
+
+    def get(self, user_id: int) -> UserState | None:
+        """
+        Returns the user state, loading it from the database if needed. Returns None for unknown users,
+        the database errors of the load are raised.
+        """
+        user_state = self.user_states.get(user_id)
+        if user_state is None:
+            user_state = self.data_loader.load_user_state(user_id)
+            if user_state is None:
+                return None
+            self.user_states[user_id] = user_state
+        else:
+            self.user_states.move_to_end(user_id)
+        self._touch(user_id)
+        return user_state
+
+    def add(self, user_state: UserState) -> None:
+        """Adds a new user state and saves it to the database."""
+        self.data_loader.save_user_state(user_state)
+        user_state.mark_saved()
+        self.user_states[user_state.get_user_id()] = user_state
+        self.user_states.move_to_end(user_state.get_user_id())
+        self._touch(user_state.get_user_id())
+
+    def _touch(self, user_id: int) -> None:
+        now = time.monotonic()
+        self.last_access[user_id] = now
+        self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        """Evicts the least recently used states while the store is full or the oldest state is idle."""
+        while self.user_states:
+            oldest_user_id = next(iter(self.user_states))
+            is_idle = now - self.last_access[oldest_user_id] > self.idle_timeout
+            if len(self.user_states) <= self.max_size and not is_idle:
+                return
+            self._evict_user(oldest_user_id)
+
+    def _evict_user(self, user_id: int) -> None:
+        user_state = self.user_states.pop(user_id)
+        del self.last_access[user_id]
+        # The step changes are not marked dirty, a returning user would reload the progress written before them
+        self.progress_writer.flush_user(user_id)
+        if user_state.get_is_dirty():
+            self.data_loader.save_user_state(user_state)
+            user_state.mark_saved()
+
+    def evict_idle(self) -> None:
+        self._evict(time.monotonic())
+
+    def flush(self) -> None:
+        """Writes all dirty states back to the database."""
+        for user_state in self.user_states.values():
+            if user_state.get_is_dirty():
+                self.data_loader.save_user_state(user_state)
+                user_state.mark_saved()
+
+    def clear(self) -> None:
+        """Flushes and drops all the cached states."""
+        self.flush()
+        self.user_states.clear()
+        self.last_access.clear()
+
+    def iter_all(self) -> Iterator[UserState]:
+        """
+        Streams the states of all registered users without caching them.
+        Cached states are returned instead of their database copies, so unsaved changes are visible.
+        """
+        for user_state in self.data_loader.iter_user_states():
+            yield self.user_states.get(user_state.get_user_id(), user_state)
@@ -1,15 +1,19 @@
-from sqlalchemy import Column, Integer, String, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Text, ForeignKey, Sequence, BigInteger, Date, Index, \
+    DateTime, SmallInteger, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import JSONB
 
 Base = declarative_base()
 
+# Ids are allocated in blocks by IdAllocator, each nextval of the id sequences reserves ID_BLOCK_SIZE ids
+ID_BLOCK_SIZE = 50
+
 
 # Define Models
 class ExcursionModel(Base):
     __tablename__ = 'excursions'
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(Integer, Sequence('excursions_id_seq', increment=ID_BLOCK_SIZE), primary_key=True)
     name = Column(String, nullable=False)
     is_paid = Column(Boolean, default=False)
     likes_num = Column(Integer, default=0)
@@ -23,12 +27,15 @@ class ExcursionModel(Base):
 
 class PointModel(Base):
     __tablename__ = 'points'
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    parent_id = Column(Integer, ForeignKey('excursions.id'))
+    id = Column(Integer, Sequence('points_id_seq', increment=ID_BLOCK_SIZE), primary_key=True)
+    parent_id = Column(Integer, ForeignKey('excursions.id'), index=True)
+    position = Column(Integer, nullable=False, default=0)  # Order of the point in the excursion
     name = Column(String, nullable=False)
     address = Column(String, default="")
     location_photo = Column(String)
     location_link = Column(String)
+    latitude = Column(Float)
+    longitude = Column(Float)
     photos = Column(JSONB, default=[])  # JSONB field
     audio = Column(JSONB, default=[])  # JSONB field
     text = Column(Text, default="")
@@ -43,8 +50,8 @@ class PointModel(Base):
 
 class InformationPartModel(Base):
     __tablename__ = 'information_parts'
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    parent_id = Column(Integer, ForeignKey('points.id'))  # Added ForeignKey constraint
+    id = Column(Integer, Sequence('information_parts_id_seq', increment=ID_BLOCK_SIZE), primary_key=True)
+    parent_id = Column(Integer, ForeignKey('points.id'), index=True)  # Added ForeignKey constraint
     name = Column(String, nullable=False)
     photos = Column(JSONB, default=[])  # JSONB field
     audio = Column(JSONB, default=[])  # JSONB field
@@ -60,8 +67,82 @@ class InformationPartModel(Base):
 class UserStateModel(Base):
     __tablename__ = 'user_states'
     user_id = Column(Integer, primary_key=True)
-    chat_id = Column(Integer, default=0)
+    chat_id = Column(Integer, default=0, index=True)
     username = Column(String, nullable=False)
     mode = Column(String, default="TEXT_MODE")
     is_admin = Column(Boolean, default=False)
     paid_excursions = Column(JSONB, default=[])  # JSONB field
+    current_excursion_id = Column(Integer, nullable=True)
+    current_excursion_step = Column(Integer, default=-1)
+
+
+class CatalogueMetaModel(Base):
+    """Single row table, the version is increased on every change of excursions, points or information parts."""
+    __tablename__ = 'catalogue_meta'
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+class MediaObjectModel(Base):
+    """Media stored in S3 under the hash of their content, counts the catalogue fields referencing the object."""
+    __tablename__ = 'media_objects'
+    key = Column(String, primary_key=True)
+    refcount = Column(Integer, nullable=False, default=0)
+    size = Column(BigInteger, nullable=False, default=0)
+    # Set once the object is in S3, the concurrent stores of the same content do not return it before
+    is_uploaded = Column(Boolean, nullable=False, default=True)
+    duration = Column(Integer)  # Seconds, of the audio tracks
+
+
+class StatsDailyModel(Base):
+    """
+    Interactions with the excursions, points and information parts rolled up per day.
+    The days older than the retention are compacted into the row of the first day of their month.
+    """
+    __tablename__ = 'stats_daily'
+    entity_type = Column(String, primary_key=True)
+    entity_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    views = Column(Integer, nullable=False, default=0)
+    new_visitors = Column(Integer, nullable=False, default=0)
+    likes = Column(Integer, nullable=False, default=0)
+    dislikes = Column(Integer, nullable=False, default=0)
+    __table_args__ = (Index('ix_stats_daily_day', 'day'),)
+
+
+class ExcursionStartModel(Base):
+    """Users who started the excursion, the first step of the excursion funnel."""
+    __tablename__ = 'excursion_starts'
+    excursion_id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+
+
+class PointArrivalModel(Base):
+    """Users who reached the point of the excursion, the steps of the excursion funnel."""
+    __tablename__ = 'point_arrivals'
+    excursion_id = Column(Integer, primary_key=True)
+    point_id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+
+
+class ExcursionCompletionModel(Base):
+    """Users who completed the excursion, the last step of the excursion funnel."""
+    __tablename__ = 'excursion_completions'
+    excursion_id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+
+
+class InteractionEventModel(Base):
+    """
+    Append-only log of the users' interactions, partitioned by month of created_at.
+    The table has no primary key nor indexes, so the batched COPY only appends to the heap of the month.
+    """
+    __tablename__ = 'interaction_events'
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    event_type = Column(SmallInteger, nullable=False)
+    user_id = Column(BigInteger, nullable=False)
+    excursion_id = Column(Integer)
+    entity_id = Column(Integer)  # Point or information part
+    value = Column(SmallInteger)  # Feedback or mode
+    __table_args__ = {'postgresql_partition_by': 'RANGE (created_at)'}
+    __mapper_args__ = {'primary_key': [created_at, user_id, event_type]}
@@ -2,72 +2,82 @@ import psycopg2
 from sqlalchemy import create_engine, inspect, Engine
 from sqlalchemy.orm import Session, sessionmaker
 
+from src.monitoring.metrics import instrument_engine
+from src.monitoring.tracing import trace_engine
 from src.database.models import Base, ExcursionModel, PointModel, InformationPartModel, UserStateModel
 from src.settings import DATABASE_URL
 import logging
 
+logger = logging.getLogger(__name__)
+
 
 def get_db_connection():
     try:
         conn = psycopg2.connect(DATABASE_URL)
-        logging.info("Connection established successfully.")
+        logger.info("Connection established successfully.")
         return conn
     except psycopg2.Error as e:
-        logging.error(f"Error connecting to the database: {e}")
+        logger.error("Error connecting to the database: %s", e)
         return None
 
 
-def create_session() -> Session:
+def create_session(check_schema: bool = True) -> Session:
     """
     Creates and returns a new SQLAlchemy session.
 
+    Args:
+        check_schema: Inspect the database and create the missing tables.
+
     Returns:
         Session: A new SQLAlchemy session.
     """
     # Construct the connection string manually
     engine = create_engine(DATABASE_URL)
+    instrument_engine(engine)
+    trace_engine(engine)
     SessionLocal = sessionmaker(bind=engine)
-    is_missing_table: bool = check_tables(engine)
-    if is_missing_table:
-        Base.metadata.create_all(engine)
+    if check_schema:
+        is_missing_table: bool = check_tables(engine)
+        if is_missing_table:
+            Base.metadata.create_all(engine)
     return SessionLocal()
 
 
 def check_tables(engine: Engine) -> bool:
-    logging.info(f"Inspecting tables in database...")
+    logger.info("Inspecting tables in database...")
     inspector = inspect(engine)
     existing_tables = inspector.get_table_names()
-    logging.info(f"Existing tables: {existing_tables}")
+    logger.info("Existing tables: %s", existing_tables)
 
-    logging.info(f"Checking if Excursion table exists in database...")
+    logger.info("Checking if Excursion table exists in database...")
     if ExcursionModel.__tablename__ not in existing_tables:
-        logging.info("Excursion table does not exist. Creating table...")
+        logger.info("Excursion table does not exist. Creating table...")
         # ExcursionModel.__table__.create(engine)  # Create only the 'information_parts' table
         return True
     else:
-        logging.info("Excursion table exists...")
+        logger.info("Excursion table exists...")
 
-    logging.info(f"Checking if Point table exists in database...")
+    logger.info("Checking if Point table exists in database...")
     if PointModel.__tablename__ not in existing_tables:
-        logging.info("Points table does not exist. Creating table...")
+        logger.info("Points table does not exist. Creating table...")
         # PointModel.__table__.create(engine)
         return True
     else:
-        logging.info("Points table exists...")
+        logger.info("Points table exists...")
 
-    logging.info(f"Checking if InformationPart table exists in database...")
+    logger.info("Checking if InformationPart table exists in database...")
     if InformationPartModel.__tablename__ not in existing_tables:
-        logging.info("Information part table does not exist. Creating table...")
+        logger.info("Information part table does not exist. Creating table...")
         return True
     else:
-        logging.info("Information part table exists...")
+        logger.info("Information part table exists...")
 
-    logging.info(f"Checking if UserState table exists in database...")
+    logger.info("Checking if UserState table exists in database...")
     if UserStateModel.__tablename__ not in existing_tables:
-        logging.info("User state table does not exist. Creating table...")
+        logger.info("User state table does not exist. Creating table...")
         return True
     else:
-        logging.info("User state table exists...")
+        logger.info("User state table exists...")
 
-    logging.info(f"All tables exist in database. Finishing inspection...")
+    logger.info("All tables exist in database. Finishing inspection...")
     return False
@@ -7,10 +7,16 @@ import logging
 from botocore.session import Session
 
 from src.components.messages.bot import Bot
+from src.data.catalogue_snapshot import CatalogueSnapshot
 from src.database.session import create_session
-from src.settings import TOKEN, DATABASE_URL, DEBUG
+from src.monitoring.metrics import start_metrics_server
+from src.monitoring.tracing import configure_tracing
+from src.settings import TOKEN, DATABASE_URL, DEBUG, CATALOGUE_SNAPSHOT_PATH, CATALOGUE_SNAPSHOT_S3_KEY, \
+    METRICS_HOST, METRICS_PORT, TRACE_EXPORT_PATH, TRACE_OTLP_ENDPOINT, TRACE_SAMPLE_RATE, TRACE_SLOW_THRESHOLD
 from src.database.session import get_db_connection
 
+logger = logging.getLogger(__name__)
+
 
 def apply_migrations():
     try:
@@ -20,52 +26,61 @@ def apply_migrations():
         # Construct the absolute path to the alembic.ini file
         alembic_ini_path = os.path.join(cwd, "alembic.ini")
         alembic_cfg = Config(alembic_ini_path)  # Path to your Alembic configuration file
-        logging.info(f"Alembic ini path: {alembic_ini_path}")
-        logging.info(f"Current sqlalchemy.url: {alembic_cfg.get_main_option('sqlalchemy.url')}")
+        logger.info("Alembic ini path: %s", alembic_ini_path)
+        logger.info("Current sqlalchemy.url: %s", alembic_cfg.get_main_option('sqlalchemy.url'))
         alembic_cfg.set_main_option('sqlalchemy.url', DATABASE_URL)
-        logging.info(f"Set sqlalchemy.url parameter to: {DATABASE_URL}")
-        logging.info(f"Current sqlalchemy.url: {alembic_cfg.get_main_option('sqlalchemy.url')}")
+        logger.info("Set sqlalchemy.url parameter to: %s", DATABASE_URL)
+        logger.info("Current sqlalchemy.url: %s", alembic_cfg.get_main_option('sqlalchemy.url'))
         # Log Alembic version before running the upgrade
         # logging.info(f"Current Alembic version: {command.current(alembic_cfg)}")
 
         # Apply all migrations up to the latest
-        logging.info("Applying migrations...")
+        logger.info("Applying migrations...")
         # command.upgrade(alembic_cfg, "head")
-        logging.info("Migrations applied successfully")
+        logger.info("Migrations applied successfully")
     except Exception as e:
-        logging.error(f"Error applying migrations: {e}")
+        logger.error("Error applying migrations: %s", e)
         raise RuntimeError(f"Error applying migrations: {e}")
 
 
 def test_connection():
-    logging.info("Testing database connection")
+    logger.info("Testing database connection")
     conn = get_db_connection()
     if conn:
         try:
             with conn.cursor() as cursor:
                 cursor.execute("SELECT version();")
                 db_version = cursor.fetchone()
-                logging.info(f"Database version: {db_version[0]}")
+                logger.info("Database version: %s", db_version[0])
         finally:
             conn.close()
 
 
 if __name__ == "__main__":
     # Example log messages
-    logging.info("Running main file")
+    logger.info("Running main file")
     if not TOKEN:
         raise ValueError("TELEGRAM_BOT_TOKEN is not set in the environment or .env file")
     else:
-        logging.info(f"Using token: {TOKEN[:3]}...")  # Replace with your bot token
-    # Test connection to database and apply migrations
-    test_connection()
+        logger.info("Using token: %s...", TOKEN[:3])  # Replace with your bot token
+    # Apply migrations, the database connection is checked by the session on first use
+    if DEBUG:
+        test_connection()
     apply_migrations()
-    logging.info("Creating session...")
-    session: Session = create_session()
-    logging.info("Session created successfully")
+    # Restore the catalogue from the snapshot, it is reconciled with the database in the background
+    catalogue_snapshot = CatalogueSnapshot(CATALOGUE_SNAPSHOT_PATH, CATALOGUE_SNAPSHOT_S3_KEY)
+    restored_catalogue = catalogue_snapshot.read()
+    logger.info("Creating session...")
+    # A local snapshot was taken by a bot of this database, so its tables exist. A snapshot from the bucket
+    # may be restored against a fresh database, the tables are checked then
+    session: Session = create_session(check_schema=not (restored_catalogue and catalogue_snapshot.is_read_locally))
+    logger.info("Session created successfully")
 
-    logging.info("Initializing Bot...")
-    bot = Bot(TOKEN, session)
-    logging.info("Bot initialized, starting bot...")
+    logger.info("Initializing Bot...")
+    bot = Bot(TOKEN, session, catalogue_snapshot, restored_catalogue)
+    logger.info("Bot initialized, starting bot...")
+    if METRICS_PORT:
+        start_metrics_server(METRICS_HOST, METRICS_PORT)
+    configure_tracing(TRACE_EXPORT_PATH, TRACE_OTLP_ENDPOINT, TRACE_SAMPLE_RATE, TRACE_SLOW_THRESHOLD)
 
     bot.run()
@@ -0,0 +1,76 @@
+import atexit
+import json
+import logging
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+
+PLAIN_LOG_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+# Attributes of every log record, the other ones are the extra fields passed to the logging call
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats the records as single-line JSON documents with the extra fields of the logging call."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        document = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                document[key] = value
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+        return json.dumps(document, ensure_ascii=False, default=str)
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Passes only a share of the debug records, the records of the other levels are always passed."""
+
+    def __init__(self, sample_rate: float) -> None:
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.sample_rate
+
+
+def parse_levels(levels: str) -> Dict[str, str]:
+    """Parses the per-logger levels in the "src.data=WARNING,httpx=ERROR" format."""
+    parsed_levels = dict()
+    for item in levels.split(","):
+        if "=" in item:
+            logger_name, level = item.split("=", 1)
+            parsed_levels[logger_name.strip()] = level.strip().upper()
+    return parsed_levels
+
+
+def configure_logging(level: str, levels: str, json_format: bool, debug_sample_rate: float) -> QueueListener:
+    """
+    Sends the records of the root logger through a queue to the stream handler running in a background thread,
+    so the logging calls of the handlers do not wait for the I/O.
+    """
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(PLAIN_LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(level.upper())
+    for logger_name, logger_level in parse_levels(levels).items():
+        logging.getLogger(logger_name).setLevel(logger_level)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
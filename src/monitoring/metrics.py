@@ -0,0 +1,316 @@
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from sqlalchemy import Engine, event
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = "") -> str:
+    labels = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values: Dict[Tuple[str, ...], float] = dict()
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        return self.values.get(label_values, 0)
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """Histogram with cumulative buckets, the quantiles are estimated from the buckets."""
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        # Label values -> (counts per bucket with the +Inf one, sum, count)
+        self.values: Dict[Tuple[str, ...], List] = dict()
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self.lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def get_count(self, *label_values: str) -> int:
+        series = self.values.get(label_values)
+        return series[2] if series else 0
+
+    def get_mean(self, *label_values: str) -> float:
+        series = self.values.get(label_values)
+        return series[1] / series[2] if series and series[2] else 0.0
+
+    def get_quantile(self, quantile: float, *label_values: str) -> float:
+        """Estimates the quantile by the linear interpolation inside the bucket it falls in."""
+        series = self.values.get(label_values)
+        if not series or not series[2]:
+            return 0.0
+        rank = quantile * series[2]
+        cumulative = 0
+        for index, bucket_count in enumerate(series[0]):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower_bound = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower_bound
+                return lower_bound + (self.buckets[index] - lower_bound) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def get_label_values(self) -> List[Tuple[str, ...]]:
+        return list(self.values.keys())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for label_values, (bucket_counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                bound_label = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, label_values, bound_label)} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, label_values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, label_values)} {count}")
+        return lines
+
+
+class Gauge:
+    """Value read from the application state when the metrics are collected."""
+
+    def __init__(self, name: str, description: str, getter: Callable[[], float]) -> None:
+        self.name = name
+        self.description = description
+        self.getter = getter
+
+    def get(self) -> float:
+        try:
+            return self.getter()
+        except Exception as e:
+            logger.error("Failed to read gauge %s: %s", self.name, e)
+            return 0
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge", f"{self.name} {self.get()}"]
+
+
+class MetricsRegistry:
+    """Keeps the metrics of the bot process and renders them in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Counter | Histogram | Gauge] = dict()
+
+    def counter(self, name: str, description: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, description, label_names))
+
+    def histogram(self, name: str, description: str, label_names: Tuple[str, ...] = ()) -> Histogram:
+        return self._register(Histogram(name, description, label_names))
+
+    def gauge(self, name: str, description: str, getter: Callable[[], float]) -> Gauge:
+        """Registers the gauge, replaces the previous one of the same name."""
+        gauge = Gauge(name, description, getter)
+        self.metrics[name] = gauge
+        return gauge
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str):
+        return self.metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HANDLER_LATENCY = metrics.histogram("volkaround_handler_latency_seconds", "Latency of the update handlers",
+                                    ("handler",))
+HANDLER_ERRORS = metrics.counter("volkaround_handler_errors_total", "Exceptions raised by the update handlers",
+                                 ("handler",))
+S3_REQUESTS = metrics.counter("volkaround_s3_requests_total", "S3 API calls", ("operation", "status"))
+S3_BYTES = metrics.counter("volkaround_s3_bytes_total", "Bytes transferred to and from S3", ("operation",))
+S3_LATENCY = metrics.histogram("volkaround_s3_latency_seconds", "Latency of the S3 API calls", ("operation",))
+SQL_STATEMENTS = metrics.counter("volkaround_sql_statements_total", "Executed SQL statements", ("statement",))
+SQL_LATENCY = metrics.histogram("volkaround_sql_latency_seconds", "Latency of the SQL statements", ("statement",))
+TELEGRAM_REQUESTS = metrics.counter("volkaround_telegram_requests_total", "Telegram Bot API calls",
+                                    ("method", "status"))
+TELEGRAM_LATENCY = metrics.histogram("volkaround_telegram_latency_seconds", "Latency of the Telegram Bot API calls",
+                                     ("method",))
+TELEGRAM_RETRY_AFTER = metrics.counter("volkaround_telegram_retry_after_total",
+                                       "Telegram Bot API calls rejected with RetryAfter (HTTP 429)", ("method",))
+
+
+def instrument_handler(callback: Callable) -> Callable:
+    """Wraps the handler callback to record its latency and errors."""
+    handler_name = getattr(callback, "__name__", type(callback).__name__)
+
+    @functools.wraps(callback)
+    async def instrumented_callback(update, context):
+        started_at = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(handler_name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started_at, handler_name)
+
+    return instrumented_callback
+
+
+def instrument_handlers(handlers: Iterable) -> None:
+    for handler in handlers:
+        handler.callback = instrument_handler(handler.callback)
+
+
+def _get_s3_body_size(body) -> int:
+    try:
+        return len(body)
+    except TypeError:
+        return 0
+
+
+def instrument_s3_client(client) -> None:
+    """Records the calls of the boto3 S3 client through the botocore events."""
+
+    def on_params(params, context, model, **kwargs):
+        context["metrics_operation"] = model.name
+        context["metrics_started_at"] = time.perf_counter()
+        if "Body" in params:
+            context["metrics_sent_bytes"] = _get_s3_body_size(params["Body"])
+
+    def on_response(http_response, parsed, model, context, **kwargs):
+        operation = model.name
+        S3_REQUESTS.inc(operation, str(http_response.status_code))
+        received_bytes = parsed.get("ContentLength", 0) if operation == "GetObject" else 0
+        S3_BYTES.inc(operation, amount=received_bytes + context.get("metrics_sent_bytes", 0))
+        if "metrics_started_at" in context:
+            S3_LATENCY.observe(time.perf_counter() - context["metrics_started_at"], operation)
+
+    # The errors come with the request context only, the operation is taken from the parameters event
+    def on_error(exception, context, **kwargs):
+        operation = context.get("metrics_operation", "unknown")
+        S3_REQUESTS.inc(operation, type(exception).__name__)
+        if "metrics_started_at" in context:
+            S3_LATENCY.observe(time.perf_counter() - context["metrics_started_at"], operation)
+
+    client.meta.events.register("before-parameter-build.s3", on_params)
+    client.meta.events.register("after-call.s3", on_response)
+    client.meta.events.register("after-call-error.s3", on_error)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Records the number and latency of the SQL statements executed by the engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("metrics_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        started_at = connection.info["metrics_started_at"].pop()
+        statement_type = statement.lstrip().split(" ", 1)[0].upper() or "OTHER"
+        SQL_STATEMENTS.inc(statement_type)
+        SQL_LATENCY.observe(time.perf_counter() - started_at, statement_type)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        started_at = exception_context.connection.info.get("metrics_started_at") \
+            if exception_context.connection is not None else None
+        if started_at:
+            started_at.pop()
+        SQL_STATEMENTS.inc("ERROR")
+
+
+def get_summary() -> str:
+    """Short human-readable summary of the metrics for the admins."""
+    lines = ["Обработчики (вызовы, p50/p95 мс, ошибки):"]
+    handlers = sorted(HANDLER_LATENCY.get_label_values(), key=lambda labels: -HANDLER_LATENCY.get_count(*labels))
+    for labels in handlers[:10]:
+        lines.append(f"  {labels[0]}: {HANDLER_LATENCY.get_count(*labels)}, "
+                     f"{HANDLER_LATENCY.get_quantile(0.5, *labels) * 1000:.0f}/"
+                     f"{HANDLER_LATENCY.get_quantile(0.95, *labels) * 1000:.0f}, "
+                     f"{HANDLER_ERRORS.get(*labels):.0f}")
+    lines.append("S3 (вызовы, среднее мс):")
+    for labels in S3_LATENCY.get_label_values():
+        lines.append(f"  {labels[0]}: {S3_LATENCY.get_count(*labels)}, {S3_LATENCY.get_mean(*labels) * 1000:.0f}")
+    lines.append(f"  Передано: {S3_BYTES.total() / 2 ** 20:.1f} МБ")
+    lines.append("SQL (запросы, среднее мс):")
+    for labels in SQL_LATENCY.get_label_values():
+        lines.append(f"  {labels[0]}: {SQL_LATENCY.get_count(*labels)}, {SQL_LATENCY.get_mean(*labels) * 1000:.1f}")
+    lines.append(f"Telegram: {TELEGRAM_REQUESTS.total():.0f} вызовов, RetryAfter: {TELEGRAM_RETRY_AFTER.total():.0f}")
+    for metric in metrics.metrics.values():
+        if isinstance(metric, Gauge):
+            lines.append(f"{metric.name}: {metric.get():g}")
+    return "\n".join(lines)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host: str, port: int) -> ThreadingHTTPServer | None:
+    """Serves the metrics on http://host:port/metrics from a background thread."""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    except OSError as e:
+        logger.error("Failed to start the metrics server on %s:%s: %s", host, port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,176 @@
+import asyncio
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Iterable, Set
+
+logger = logging.getLogger(__name__)
+
+# Functions shown in the reports
+REPORT_LINES_NUM = 40
+TRACEMALLOC_FRAMES_NUM = 10
+
+
+class ProfilingSession:
+    __slots__ = ("handler_name", "calls_limit", "deadline", "on_finish", "profile", "calls_num", "profiled_time",
+                 "is_running")
+
+    def __init__(self, handler_name: str, calls_limit: int, deadline: float, on_finish: Callable) -> None:
+        self.handler_name = handler_name
+        self.calls_limit = calls_limit
+        self.deadline = deadline
+        self.on_finish = on_finish
+        self.profile = cProfile.Profile()
+        self.calls_num = 0
+        self.profiled_time = 0.0
+        self.is_running = False
+
+
+class HandlerProfiler:
+    """
+    Profiles the next calls of a single handler with cProfile. The session switches itself off after the requested
+    number of calls, when the profiled time exceeds the overhead cap or when it times out, then the report is passed
+    to the callback of the session. Other handlers keep running unprofiled, they only pay a single attribute check.
+    """
+
+    def __init__(self, output_dir: str, max_calls: int, max_profiled_time: float, timeout: float) -> None:
+        self.output_dir = output_dir
+        self.max_calls = max_calls
+        self.max_profiled_time = max_profiled_time
+        self.timeout = timeout
+        self.handler_names: Set[str] = set()
+        self.session = None
+
+    def get_is_active(self) -> bool:
+        return self.session is not None
+
+    def start(self, handler_name: str, calls_num: int, on_finish: Callable[[str, str], None]) -> ProfilingSession:
+        """Starts profiling of the handler, on_finish gets the path and the text of the report."""
+        if self.session is not None:
+            raise RuntimeError(f"Handler {self.session.handler_name} is already being profiled")
+        if handler_name not in self.handler_names:
+            raise ValueError(f"Unknown handler {handler_name}")
+        self.session = ProfilingSession(handler_name, min(calls_num, self.max_calls), time.monotonic() + self.timeout,
+                                        on_finish)
+        logger.info("Profiling %s calls of %s", self.session.calls_limit, handler_name)
+        return self.session
+
+    def stop(self, session: ProfilingSession, reason: str) -> None:
+        """Switches the session off and reports what it has collected."""
+        if self.session is not session:
+            return
+        self.session = None
+        logger.info("Profiling of %s stopped: %s", session.handler_name, reason)
+        try:
+            report_path, report = self._write_report(session, reason)
+        except Exception as e:
+            logger.error("Failed to write the profiling report of %s: %s", session.handler_name, e)
+            return
+        session.on_finish(report_path, report)
+
+    def expire(self, session: ProfilingSession) -> None:
+        """Stops the session if it is still running after its timeout."""
+        if self.session is session and time.monotonic() >= session.deadline:
+            self.stop(session, "timeout")
+
+    def profile_handler(self, callback: Callable) -> Callable:
+        """Wraps the handler callback to profile it while a session for it is active."""
+        handler_name = getattr(callback, "__name__", type(callback).__name__)
+        self.handler_names.add(handler_name)
+
+        @functools.wraps(callback)
+        async def profiled_callback(update, context):
+            session = self.session
+            # Only one profiler may be enabled at a time, the concurrent calls run unprofiled
+            if session is None or session.handler_name != handler_name or session.is_running:
+                return await callback(update, context)
+            session.is_running = True
+            started_at = time.perf_counter()
+            session.profile.enable()
+            try:
+                return await callback(update, context)
+            finally:
+                session.profile.disable()
+                session.is_running = False
+                session.profiled_time += time.perf_counter() - started_at
+                session.calls_num += 1
+                if session.calls_num >= session.calls_limit:
+                    self.stop(session, f"{session.calls_num} calls profiled")
+                elif session.profiled_time >= self.max_profiled_time:
+                    self.stop(session, f"overhead cap of {self.max_profiled_time:g} s reached")
+                elif time.monotonic() >= session.deadline:
+                    self.stop(session, "timeout")
+
+        return profiled_callback
+
+    def profile_handlers(self, handlers: Iterable) -> None:
+        for handler in handlers:
+            handler.callback = self.profile_handler(handler.callback)
+
+    def _write_report(self, session: ProfilingSession, reason: str) -> tuple[str, str]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        file_name = f"{session.handler_name}-{datetime.now():%Y%m%d-%H%M%S}"
+        stream = io.StringIO()
+        stream.write(f"{session.handler_name}: {session.calls_num} calls, {session.profiled_time * 1000:.0f} ms "
+                     f"profiled, stopped: {reason}\n"
+                     f"The awaits of the handler also profile the tasks running meanwhile.\n\n")
+        if session.calls_num:
+            session.profile.dump_stats(os.path.join(self.output_dir, f"{file_name}.prof"))
+            stats = pstats.Stats(session.profile, stream=stream)
+            stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_LINES_NUM)
+        report_path = os.path.join(self.output_dir, f"{file_name}.txt")
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            report_file.write(stream.getvalue())
+        return report_path, stream.getvalue()
+
+
+class MemoryProfiler:
+    """Diffs two tracemalloc snapshots taken at the start and at the end of a window."""
+
+    def __init__(self, output_dir: str, max_window: float) -> None:
+        self.output_dir = output_dir
+        self.max_window = max_window
+        self.is_running = False
+
+    async def diff(self, window: float) -> tuple[str, str]:
+        """Traces the allocations during the window, returns the path and the text of the report."""
+        if self.is_running:
+            raise RuntimeError("Memory diff is already running")
+        self.is_running = True
+        window = min(window, self.max_window)
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES_NUM)
+        try:
+            first_snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+            await asyncio.sleep(window)
+            second_snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+            current_size, peak_size = tracemalloc.get_traced_memory()
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+            self.is_running = False
+        report = await asyncio.to_thread(self._build_report, first_snapshot, second_snapshot, window, current_size,
+                                         peak_size)
+        os.makedirs(self.output_dir, exist_ok=True)
+        report_path = os.path.join(self.output_dir, f"memdiff-{datetime.now():%Y%m%d-%H%M%S}.txt")
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            report_file.write(report)
+        return report_path, report
+
+    @staticmethod
+    def _build_report(first_snapshot: tracemalloc.Snapshot, second_snapshot: tracemalloc.Snapshot, window: float,
+                      current_size: int, peak_size: int) -> str:
+        filters = (tracemalloc.Filter(False, tracemalloc.__file__),
+                   tracemalloc.Filter(False, "<frozen importlib._bootstrap>"))
+        statistics = second_snapshot.filter_traces(filters).compare_to(first_snapshot.filter_traces(filters), "lineno")
+        lines = [f"Allocations diff over {window:g} s, traced {current_size / 2 ** 20:.1f} MiB, "
+                 f"peak {peak_size / 2 ** 20:.1f} MiB", ""]
+        lines.extend(str(statistic) for statistic in statistics[:REPORT_LINES_NUM])
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,45 @@
+import time
+from http import HTTPStatus
+
+from telegram.request import BaseRequest, RequestData
+
+from src.monitoring.metrics import TELEGRAM_REQUESTS, TELEGRAM_LATENCY, TELEGRAM_RETRY_AFTER
+from src.monitoring.tracing import tracer
+
+
+class InstrumentedRequest(BaseRequest):
+    """Wraps the transport of the bot to record the Telegram Bot API calls."""
+
+    def __init__(self, request: BaseRequest) -> None:
+        self.request = request
+
+    @property
+    def read_timeout(self) -> float | None:
+        return self.request.read_timeout
+
+    async def initialize(self) -> None:
+        await self.request.initialize()
+
+    async def shutdown(self) -> None:
+        await self.request.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None,
+                         read_timeout=BaseRequest.DEFAULT_NONE, write_timeout=BaseRequest.DEFAULT_NONE,
+                         connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        started_at = time.perf_counter()
+        try:
+            with tracer.span(f"telegram {api_method}"):
+                status_code, payload = await self.request.do_request(
+                    url, method, request_data=request_data, read_timeout=read_timeout, write_timeout=write_timeout,
+                    connect_timeout=connect_timeout, pool_timeout=pool_timeout)
+        except Exception as e:
+            TELEGRAM_REQUESTS.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_LATENCY.observe(time.perf_counter() - started_at, api_method)
+        TELEGRAM_REQUESTS.inc(api_method, str(status_code))
+        if status_code == HTTPStatus.TOO_MANY_REQUESTS:
+            TELEGRAM_RETRY_AFTER.inc(api_method)
+        return status_code, payload
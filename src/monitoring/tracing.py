@@ -0,0 +1,309 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List
+
+from sqlalchemy import Engine, event
+
+logger = logging.getLogger(__name__)
+
+# Traces waiting for the export, the new ones are dropped when the exporter falls behind
+EXPORT_QUEUE_SIZE = 1000
+SERVICE_NAME = "volkaround"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: str | None, attributes: Dict) -> None:
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def get_duration(self) -> float:
+        """Returns the duration of the span in seconds."""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": self.get_duration() * 1000,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "is_sampled")
+
+    def __init__(self, is_sampled: bool) -> None:
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = list()
+        self.is_sampled = is_sampled
+
+    def get_root(self) -> Span:
+        return self.spans[0]
+
+    def to_dict(self) -> Dict:
+        root = self.get_root()
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "duration_ms": root.get_duration() * 1000,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+class JsonLinesExporter:
+    """Appends the traces to a local file, one JSON document per line."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def export(self, traces: List[Trace]) -> None:
+        with open(self.path, "a", encoding="utf-8") as traces_file:
+            for trace in traces:
+                traces_file.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+
+
+class OtlpHttpExporter:
+    """Sends the traces to an OpenTelemetry collector with the OTLP/HTTP JSON protocol."""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0) -> None:
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+
+    @staticmethod
+    def _to_otlp_attributes(attributes: Dict) -> List[Dict]:
+        return [{"key": key, "value": {"stringValue": str(value)}} for key, value in attributes.items()]
+
+    def _to_otlp_span(self, trace: Trace, span: Span) -> Dict:
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns or span.start_ns),
+            "attributes": self._to_otlp_attributes(span.attributes),
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        return otlp_span
+
+    def export(self, traces: List[Trace]) -> None:
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": self._to_otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{
+                "scope": {"name": SERVICE_NAME},
+                "spans": [self._to_otlp_span(trace, span) for trace in traces for span in trace.spans],
+            }],
+        }]}
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode(), method="POST",
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class Tracer:
+    """
+    Collects the timed spans of an update into a trace. The traces are sampled, the slow ones are always kept.
+    The finished traces are exported from a background thread, so the export never delays the handlers.
+    """
+
+    def __init__(self) -> None:
+        self.exporter = None
+        self.sample_rate = 0.0
+        self.slow_threshold = 0.0
+        self.export_queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self.export_thread = None
+
+    def configure(self, exporter, sample_rate: float, slow_threshold: float) -> None:
+        """Enables the tracing, traces are kept with the sample rate or if they take longer than the threshold."""
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        if self.export_thread is None:
+            self.export_thread = threading.Thread(target=self._export_forever, name="trace-exporter", daemon=True)
+            self.export_thread.start()
+
+    def get_is_enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def start_trace(self, name: str, **attributes) -> Iterator[Span | None]:
+        """Starts a new trace with the root span, does nothing if the tracing is disabled."""
+        if self.exporter is None:
+            yield None
+            return
+        trace = Trace(is_sampled=random.random() < self.sample_rate)
+        root = self._open_span(trace, name, None, attributes)
+        token = _current_span.set(root)
+        try:
+            yield root
+        except Exception as e:
+            root.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            root.end_ns = time.time_ns()
+            if trace.is_sampled or root.get_duration() >= self.slow_threshold:
+                try:
+                    self.export_queue.put_nowait(trace)
+                except queue.Full:
+                    logger.warning("Trace export queue is full, dropping the trace")
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span | None]:
+        """Times a nested span of the current trace, does nothing outside of a trace."""
+        span = self.start_span(name, **attributes)
+        if span is None:
+            yield None
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+
+    def start_span(self, name: str, **attributes) -> Span | None:
+        """Opens a span without making it current, for the callbacks that cannot wrap the traced code."""
+        parent = _current_span.get()
+        if parent is None:
+            return None
+        return self._open_span(parent.trace, name, parent.span_id, attributes)
+
+    @staticmethod
+    def end_span(span: Span | None, error: str | None = None) -> None:
+        if span is not None:
+            span.end_ns = time.time_ns()
+            span.error = error
+
+    @staticmethod
+    def _open_span(trace: Trace, name: str, parent_id: str | None, attributes: Dict) -> Span:
+        span = Span(trace, name, parent_id, attributes)
+        trace.spans.append(span)
+        return span
+
+    def _export_forever(self) -> None:
+        while True:
+            traces = [self.export_queue.get()]
+            while not self.export_queue.empty() and len(traces) < EXPORT_QUEUE_SIZE:
+                traces.append(self.export_queue.get_nowait())
+            try:
+                self.exporter.export(traces)
+            except Exception as e:
+                logger.error("Failed to export %s traces: %s", len(traces), e)
+
+
+tracer = Tracer()
+
+
+def configure_tracing(export_path: str, otlp_endpoint: str, sample_rate: float, slow_threshold: float) -> None:
+    """Enables the tracing with the OTLP collector if its endpoint is set, otherwise with the local file."""
+    if otlp_endpoint:
+        exporter = OtlpHttpExporter(otlp_endpoint)
+    elif export_path:
+        exporter = JsonLinesExporter(export_path)
+    else:
+        return
+    tracer.configure(exporter, sample_rate, slow_threshold)
+    logger.info("Tracing enabled, sample rate %s, slow threshold %s s", sample_rate, slow_threshold)
+
+
+def traced(name: str) -> Callable:
+    """Decorator timing the function as a span of the current trace."""
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def traced_function(*args, **kwargs):
+            with tracer.span(name):
+                return function(*args, **kwargs)
+
+        return traced_function
+
+    return decorator
+
+
+def trace_handler(callback: Callable) -> Callable:
+    """Wraps the handler callback to start a trace for every update it handles."""
+    handler_name = getattr(callback, "__name__", type(callback).__name__)
+
+    @functools.wraps(callback)
+    async def traced_callback(update, context):
+        attributes = {"handler": handler_name}
+        if getattr(update, "effective_user", None):
+            attributes["user_id"] = update.effective_user.id
+        if getattr(update, "callback_query", None):
+            attributes["callback_data"] = update.callback_query.data
+        with tracer.start_trace(f"handler {handler_name}", **attributes):
+            return await callback(update, context)
+
+    return traced_callback
+
+
+def trace_handlers(handlers: Iterable) -> None:
+    for handler in handlers:
+        handler.callback = trace_handler(handler.callback)
+
+
+def trace_s3_client(client) -> None:
+    """Times the calls of the boto3 S3 client as spans through the botocore events."""
+
+    def on_params(params, context, model, **kwargs):
+        context["trace_span"] = tracer.start_span(f"s3 {model.name}", key=params.get("Key"))
+
+    def on_response(http_response, context, **kwargs):
+        tracer.end_span(context.get("trace_span"),
+                        None if http_response.status_code < 300 else f"HTTP {http_response.status_code}")
+
+    def on_error(exception, context, **kwargs):
+        tracer.end_span(context.get("trace_span"), repr(exception))
+
+    client.meta.events.register("before-parameter-build.s3", on_params)
+    client.meta.events.register("after-call.s3", on_response)
+    client.meta.events.register("after-call-error.s3", on_error)
+
+
+def trace_engine(engine: Engine) -> None:
+    """Times the SQL statements executed by the engine as spans."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        statement_type = statement.lstrip().split(" ", 1)[0].upper()
+        connection.info.setdefault("trace_spans", []).append(
+            tracer.start_span(f"sql {statement_type}", statement=statement[:200]))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        tracer.end_span(connection.info["trace_spans"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        if exception_context.connection is not None and exception_context.connection.info.get("trace_spans"):
+            tracer.end_span(exception_context.connection.info["trace_spans"].pop(),
+                            repr(exception_context.original_exception))
@@ -2,24 +2,20 @@ import os
 from urllib.parse import urlparse
 from decouple import config
 from dotenv import load_dotenv
-import logging
+
+from src.monitoring.logs import configure_logging
 
 # Local environment
 load_dotenv()
 
-# Define log format
-LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
-
-# Create a logger
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-# Create a single StreamHandler for logging to the console
-info_logger = logging.StreamHandler()
-# Create a formatter and assign it to the handler
-formatter = logging.Formatter(LOG_FORMAT)
-info_logger.setFormatter(formatter)
-# Add the handler to the logger
-logger.addHandler(info_logger)
+# Logging, the records are written by a background thread
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+# Levels of the subsystems, e.g. "src.data=WARNING,src.components.messages=DEBUG"
+LOG_LEVELS = config('LOG_LEVELS', default='httpx=WARNING,botocore=WARNING,boto3=WARNING')
+LOG_JSON = config('LOG_JSON', default=True, cast=bool)
+# Share of the debug records of the hot paths that are written
+LOG_DEBUG_SAMPLE_RATE = config('LOG_DEBUG_SAMPLE_RATE', default=0.01, cast=float)
+configure_logging(LOG_LEVEL, LOG_LEVELS, LOG_JSON, LOG_DEBUG_SAMPLE_RATE)
 
 # Telegram TOKEN
 TOKEN = config("TELEGRAM_BOT_TOKEN")
@@ -60,3 +56,84 @@ if config('EDGE_ENDPOINT_URL', default='').strip():
 CUSTOM_ENDPOINT_URL = None
 if config('CUSTOM_ENDPOINT_URL', default='').strip():
     CUSTOM_ENDPOINT_URL = config('CUSTOM_ENDPOINT_URL')
+# Ordered S3 endpoints for the reads, by default the edge one, the primary ENDPOINT_URL is always the last resort
+READ_ENDPOINT_URLS = [url.strip() for url in config('READ_ENDPOINT_URLS', default='').split(',') if url.strip()]
+READ_ENDPOINT_COOLDOWN = config('READ_ENDPOINT_COOLDOWN', default=30, cast=float)  # Seconds an unhealthy endpoint is skipped
+# The reads block the handlers, so a stalled endpoint fails fast and the next one is tried
+READ_CONNECT_TIMEOUT = config('READ_CONNECT_TIMEOUT', default=2, cast=float)  # Seconds
+READ_TIMEOUT = config('READ_TIMEOUT', default=5, cast=float)  # Seconds
+READ_MAX_RETRIES = config('READ_MAX_RETRIES', default=1, cast=int)  # Retries of a read before the next endpoint
+# "upload" or "presigned", the presigned URLs are signed for CUSTOM_ENDPOINT_URL if it is set, otherwise ENDPOINT_URL
+MEDIA_DELIVERY_MODE = config('MEDIA_DELIVERY_MODE', default='upload')
+PRESIGNED_URL_TTL = config('PRESIGNED_URL_TTL', default=600, cast=int)  # Seconds
+
+# User states cache
+USER_STATES_CACHE_SIZE = config('USER_STATES_CACHE_SIZE', default=10000, cast=int)
+USER_STATE_IDLE_TIMEOUT = config('USER_STATE_IDLE_TIMEOUT', default=3600, cast=int)  # Seconds
+
+# Excursion progress
+PROGRESS_FLUSH_INTERVAL = config('PROGRESS_FLUSH_INTERVAL', default=30, cast=int)  # Seconds
+
+# Statistics rollups, flushed along with the excursion progress
+STATS_RETENTION_DAYS = config('STATS_RETENTION_DAYS', default=90, cast=int)  # Older days are compacted into months
+STATS_COMPACTION_INTERVAL = config('STATS_COMPACTION_INTERVAL', default=86400, cast=int)  # Seconds
+
+# Interaction events log
+EVENTS_FLUSH_INTERVAL = config('EVENTS_FLUSH_INTERVAL', default=5, cast=float)  # Seconds
+EVENTS_FLUSH_SIZE = config('EVENTS_FLUSH_SIZE', default=500, cast=int)  # Events
+EVENTS_MAX_BUFFERED = config('EVENTS_MAX_BUFFERED', default=50000, cast=int)  # Events kept while the writes fail
+EVENTS_PARTITIONS_AHEAD = config('EVENTS_PARTITIONS_AHEAD', default=2, cast=int)  # Months
+
+# Nearest points lookups by the shared locations
+NEARBY_POINTS_LIMIT = config('NEARBY_POINTS_LIMIT', default=5, cast=int)
+NEARBY_POINTS_MAX_DISTANCE = config('NEARBY_POINTS_MAX_DISTANCE', default=20000, cast=float)  # Meters
+POINTS_INDEX_CELL_SIZE = config('POINTS_INDEX_CELL_SIZE', default=0.05, cast=float)  # Degrees, about 5 km
+
+# Catalogue snapshot
+CATALOGUE_SNAPSHOT_PATH = config('CATALOGUE_SNAPSHOT_PATH', default='media/catalogue.snapshot')
+CATALOGUE_SNAPSHOT_S3_KEY = config('CATALOGUE_SNAPSHOT_S3_KEY', default='snapshots/catalogue.snapshot').strip() or None
+
+# Metrics
+METRICS_HOST = config('METRICS_HOST', default='127.0.0.1')
+METRICS_PORT = config('METRICS_PORT', default=9108, cast=int)  # 0 disables the metrics endpoint
+TELEGRAM_CONNECTION_POOL_SIZE = config('TELEGRAM_CONNECTION_POOL_SIZE', default=256, cast=int)
+
+# Uploaded images, downsized to the largest size Telegram shows
+IMAGE_MAX_SIDE = config('IMAGE_MAX_SIDE', default=1280, cast=int)  # Pixels
+IMAGE_THUMBNAIL_SIDE = config('IMAGE_THUMBNAIL_SIDE', default=320, cast=int)  # Pixels
+IMAGE_JPEG_QUALITY = config('IMAGE_JPEG_QUALITY', default=85, cast=int)
+IMAGE_WORKERS = config('IMAGE_WORKERS', default=2, cast=int)
+MAX_PHOTO_FILE_SIZE = config('MAX_PHOTO_FILE_SIZE', default=20 * 1024 * 1024, cast=int)  # Bot API download limit
+
+# Uploaded audio, transcoded with ffmpeg to mono AAC
+AUDIO_TRANSCODING = config('AUDIO_TRANSCODING', default=True, cast=bool)
+AUDIO_BITRATE = config('AUDIO_BITRATE', default='64k')
+AUDIO_WORKERS = config('AUDIO_WORKERS', default=2, cast=int)  # Concurrent ffmpeg processes
+AUDIO_KEEP_ORIGINAL = config('AUDIO_KEEP_ORIGINAL', default=False, cast=bool)
+FFMPEG_PATH = config('FFMPEG_PATH', default='ffmpeg')
+FFPROBE_PATH = config('FFPROBE_PATH', default='ffprobe')
+
+# Outbound Telegram rate limits, messages per second
+TELEGRAM_GLOBAL_RATE = config('TELEGRAM_GLOBAL_RATE', default=30, cast=float)
+TELEGRAM_CHAT_RATE = config('TELEGRAM_CHAT_RATE', default=1, cast=float)
+TELEGRAM_CHAT_BURST = config('TELEGRAM_CHAT_BURST', default=4, cast=float)  # Messages sent to a private chat at once
+TELEGRAM_GROUP_RATE = config('TELEGRAM_GROUP_RATE', default=20 / 60, cast=float)
+# Global tokens the broadcasts leave for the interactive replies
+TELEGRAM_BULK_RESERVE = config('TELEGRAM_BULK_RESERVE', default=10, cast=float)
+# Retries of the calls rejected by the flood control
+TELEGRAM_MAX_RETRIES = config('TELEGRAM_MAX_RETRIES', default=3, cast=int)
+
+# Tracing
+TRACE_EXPORT_PATH = config('TRACE_EXPORT_PATH', default='logs/traces.jsonl')
+TRACE_OTLP_ENDPOINT = config('TRACE_OTLP_ENDPOINT', default='')  # e.g. http://localhost:4318
+TRACE_SAMPLE_RATE = config('TRACE_SAMPLE_RATE', default=0.01, cast=float)
+TRACE_SLOW_THRESHOLD = config('TRACE_SLOW_THRESHOLD', default=2.0, cast=float)  # Seconds, slower traces are kept
+
+# On-demand profiling by the admins
+PROFILE_OUTPUT_DIR = config('PROFILE_OUTPUT_DIR', default='logs/profiles')
+PROFILE_DEFAULT_CALLS = config('PROFILE_DEFAULT_CALLS', default=20, cast=int)
+PROFILE_MAX_CALLS = config('PROFILE_MAX_CALLS', default=200, cast=int)
+PROFILE_MAX_TIME = config('PROFILE_MAX_TIME', default=10.0, cast=float)  # Seconds of profiled handlers per session
+PROFILE_TIMEOUT = config('PROFILE_TIMEOUT', default=600, cast=int)  # Seconds
+MEMDIFF_DEFAULT_WINDOW = config('MEMDIFF_DEFAULT_WINDOW', default=60, cast=int)  # Seconds
+MEMDIFF_MAX_WINDOW = config('MEMDIFF_MAX_WINDOW', default=600, cast=int)  # Seconds
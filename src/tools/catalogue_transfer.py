@@ -0,0 +1,340 @@
+"""
+Export and import of the whole catalogue: the excursions, points and information parts with their media.
+
+The export streams the rows of the three tables to NDJSON, every row followed by the media it references,
+so the memory use does not depend on the catalogue size:
+    python -m src.tools.catalogue_transfer export catalogue.ndjson
+
+The import gives the rows new ids, loads them with COPY in one transaction and copies the media missing
+from the target bucket concurrently, e.g. from the staging bucket:
+    python -m src.tools.catalogue_transfer import catalogue.ndjson --source-bucket volkaround-staging \\
+        --source-endpoint-url https://storage.example.com --workers 16
+"""
+import argparse
+import json
+import logging
+import sys
+import tempfile
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, TextIO, Tuple
+
+import psycopg2
+from botocore.client import BaseClient
+from botocore.exceptions import BotoCoreError, ClientError
+from sqlalchemy import select, text, Table
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.data.audio_pipeline import get_original_audio_url, DURATION_METADATA_KEY
+from src.data.id_allocator import IdAllocator
+from src.data.image_pipeline import get_thumbnail_url
+from src.data.postgres_data_loader import PostgresLoadManager
+from src.data.read_router import NOT_FOUND_CODES
+from src.data.s3bucket import get_s3_client, get_s3_key, get_s3_url
+from src.database.models import ExcursionModel, PointModel, InformationPartModel
+from src.settings import BUCKET_NAME, ENDPOINT_URL
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+HEADER_RECORD = "header"
+MEDIA_RECORD = "media"
+# Record types of the tables in the order of the export, the parents go first
+TABLES = {
+    "excursion": ExcursionModel.__table__,
+    "point": PointModel.__table__,
+    "information_part": InformationPartModel.__table__,
+}
+MEDIA_LIST_COLUMNS = ("photos", "audio")
+MEDIA_COLUMNS = ("location_photo",)
+STATS_COLUMNS = {"views_num": 0, "likes_num": 0, "dislikes_num": 0, "visitors": []}
+EXPORT_BATCH_SIZE = 1000
+# Rows of a table kept in memory before the COPY data is spilled to disk
+COPY_SPOOL_SIZE = 16 * 1024 * 1024
+
+
+def get_media_urls(row: Dict[str, Any]) -> List[str]:
+    """URLs of the media referenced by the catalogue row."""
+    urls = [url for column in MEDIA_LIST_COLUMNS for url in row.get(column) or () if url]
+    urls.extend(row[column] for column in MEDIA_COLUMNS if row.get(column))
+    return urls
+
+
+def get_companion_urls(url: str) -> List[str]:
+    """Thumbnails and kept audio originals stored along with the media, they are not referenced by the rows."""
+    return list(filter(None, (get_thumbnail_url(url), get_original_audio_url(url))))
+
+
+def iter_rows(session, table: Table) -> Iterator[Dict[str, Any]]:
+    """Streams the rows of the table with a server side cursor."""
+    result = session.execute(select(table).order_by(table.c.id).execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for row in result.mappings():
+        yield dict(row)
+
+
+def export_catalogue(session, output: TextIO) -> int:
+    """Writes the catalogue as NDJSON, returns the number of the exported rows."""
+    rows_num = 0
+    catalogue_version = PostgresLoadManager(session).get_catalogue_version()
+    output.write(json.dumps({"type": HEADER_RECORD, "format": FORMAT_VERSION, "catalogue_version": catalogue_version,
+                             "exported_at": datetime.now(timezone.utc).isoformat()}) + "\n")
+    for record_type, table in TABLES.items():
+        for row in iter_rows(session, table):
+            output.write(json.dumps({"type": record_type, **row}, ensure_ascii=False) + "\n")
+            # One media record per reference, the import counts them as the references of the media objects
+            for url in get_media_urls(row):
+                output.write(json.dumps({"type": MEDIA_RECORD, "key": get_s3_key(url),
+                                         "companions": [get_s3_key(companion_url)
+                                                        for companion_url in get_companion_urls(url)]}) + "\n")
+            rows_num += 1
+    return rows_num
+
+
+def to_copy_value(value: Any) -> str:
+    """Formats the value for the text format of COPY."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        value = "t" if value else "f"
+    elif isinstance(value, (list, dict)):
+        value = json.dumps(value, ensure_ascii=False)
+    else:
+        value = str(value)
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class MediaCopier:
+    """Copies the media missing from the target bucket from the source one in a pool of threads."""
+
+    def __init__(self, source_bucket: str, source_endpoint_url: str | None, workers_num: int) -> None:
+        self.source_bucket = source_bucket
+        self.is_same_endpoint = source_endpoint_url == ENDPOINT_URL
+        self.source_client = get_s3_client(source_endpoint_url)
+        self.target_client = get_s3_client()
+        self.executor = ThreadPoolExecutor(max_workers=workers_num)
+        self.copies: Dict[str, Future] = dict()
+
+    def copy(self, key: str, is_required: bool) -> None:
+        if key not in self.copies:
+            self.copies[key] = self.executor.submit(self._copy, key, is_required)
+
+    @staticmethod
+    def _get_object(client: BaseClient, bucket: str, key: str) -> Tuple[int, int | None] | None:
+        """Returns the size and the duration of an audio track of the object, None if it is missing."""
+        try:
+            response = client.head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in NOT_FOUND_CODES:
+                return None
+            raise
+        duration = response.get("Metadata", dict()).get(DURATION_METADATA_KEY)
+        return response["ContentLength"], int(duration) if duration else None
+
+    def _copy(self, key: str, is_required: bool) -> Tuple[int, int | None] | None:
+        """Returns the size and duration of the object in the target bucket, None if it is missing in both buckets."""
+        target_object = self._get_object(self.target_client, BUCKET_NAME, key)
+        if target_object is not None:
+            return target_object
+        if self.is_same_endpoint:
+            try:
+                # Copied by the storage, the data does not go through this host
+                self.target_client.copy({"Bucket": self.source_bucket, "Key": key}, BUCKET_NAME, key)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in NOT_FOUND_CODES:
+                    raise
+                return self._report_missing(key, is_required)
+        else:
+            try:
+                response = self.source_client.get_object(Bucket=self.source_bucket, Key=key)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in NOT_FOUND_CODES:
+                    raise
+                return self._report_missing(key, is_required)
+            self.target_client.upload_fileobj(response["Body"], BUCKET_NAME, key,
+                                              ExtraArgs={"Metadata": response.get("Metadata", dict()),
+                                                         "ContentType": response.get("ContentType",
+                                                                                     "binary/octet-stream")})
+        logger.debug("Copied %s", key)
+        return self._get_object(self.target_client, BUCKET_NAME, key)
+
+    @staticmethod
+    def _report_missing(key: str, is_required: bool) -> None:
+        if is_required:
+            logger.warning("Media %s is missing in the source bucket", key)
+        return None
+
+    def wait(self) -> Dict[str, Tuple[int, int | None] | None]:
+        """Waits for all the copies, returns the sizes and durations of the copied objects."""
+        try:
+            return {key: future.result() for key, future in self.copies.items()}
+        finally:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class CatalogueImporter:
+    """
+    Reads the exported catalogue, gives its rows new ids from IdAllocator and writes them to spooled COPY files,
+    while the media are copied in the background. The rows, the media references and the catalogue version
+    are written in one transaction.
+    """
+
+    def __init__(self, session, media_copier: MediaCopier | None, skip_stats: bool) -> None:
+        self.session = session
+        self.id_allocator = IdAllocator(session)
+        self.media_copier = media_copier
+        self.skip_stats = skip_stats
+        # Old id -> new id of the parents
+        self.excursion_ids: Dict[int, int] = dict()
+        self.point_ids: Dict[int, int] = dict()
+        self.media_references: Counter = Counter()
+        self.copy_files = {record_type: tempfile.SpooledTemporaryFile(max_size=COPY_SPOOL_SIZE, mode="w+")
+                           for record_type in TABLES}
+        # Columns of the COPY of every table, the ones of its first row in the export
+        self.copy_columns: Dict[str, List[str]] = dict()
+
+    def _remap(self, record_type: str, row: Dict[str, Any]) -> None:
+        if record_type == "excursion":
+            row["id"], old_id = self.id_allocator.next_excursion_id(), row["id"]
+            self.excursion_ids[old_id] = row["id"]
+        elif record_type == "point":
+            row["id"], old_id = self.id_allocator.next_point_id(), row["id"]
+            self.point_ids[old_id] = row["id"]
+            row["parent_id"] = self._get_parent_id(self.excursion_ids, row)
+        else:
+            row["id"] = self.id_allocator.next_information_part_id()
+            row["parent_id"] = self._get_parent_id(self.point_ids, row)
+
+    @staticmethod
+    def _get_parent_id(parent_ids: Dict[int, int], row: Dict[str, Any]) -> int | None:
+        parent_id = row.get("parent_id")
+        if parent_id is None:
+            return None
+        if parent_id not in parent_ids:
+            raise ValueError(f"Parent {parent_id} of {row['id']} is not in the export, the records are out of order")
+        return parent_ids[parent_id]
+
+    @staticmethod
+    def _rebase_media(row: Dict[str, Any]) -> None:
+        """Points the media URLs to the target bucket."""
+        for column in MEDIA_LIST_COLUMNS:
+            if row.get(column):
+                row[column] = [get_s3_url(get_s3_key(url)) if url else url for url in row[column]]
+        for column in MEDIA_COLUMNS:
+            if row.get(column):
+                row[column] = get_s3_url(get_s3_key(row[column]))
+
+    def read(self, source: TextIO) -> None:
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record_type = record.pop("type")
+            if record_type == HEADER_RECORD:
+                if record.get("format") != FORMAT_VERSION:
+                    raise ValueError(f"Unsupported export format {record.get('format')}")
+            elif record_type == MEDIA_RECORD:
+                self.media_references[record["key"]] += 1
+                if self.media_copier is not None:
+                    self.media_copier.copy(record["key"], is_required=True)
+                    for companion_key in record.get("companions", ()):
+                        self.media_copier.copy(companion_key, is_required=False)
+            elif record_type in TABLES:
+                self._remap(record_type, record)
+                self._rebase_media(record)
+                if self.skip_stats:
+                    record.update({column: value for column, value in STATS_COLUMNS.items() if column in record})
+                self._write_row(record_type, record)
+            else:
+                raise ValueError(f"Unknown record type {record_type} on line {line_number}")
+
+    def _write_row(self, record_type: str, row: Dict[str, Any]) -> None:
+        columns = self.copy_columns.get(record_type)
+        if columns is None:
+            # Columns of the export missing in the target schema are dropped, the missing ones get their defaults
+            columns = self.copy_columns[record_type] = [column.name for column in TABLES[record_type].columns
+                                                        if column.name in row]
+        self.copy_files[record_type].write("\t".join(to_copy_value(row.get(column)) for column in columns) + "\n")
+
+    def write(self, media_objects: Dict[str, Tuple[int, int | None] | None]) -> None:
+        """COPY of the rows and the media references in one transaction."""
+        try:
+            with self.session.connection().connection.cursor() as cursor:
+                for record_type, columns in self.copy_columns.items():
+                    table = TABLES[record_type]
+                    copy_file = self.copy_files[record_type]
+                    copy_file.seek(0)
+                    cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN", copy_file)
+                    logger.info("Copied %s rows to %s", cursor.rowcount, table.name)
+            if self.media_references:
+                media_rows = []
+                for key, refcount in self.media_references.items():
+                    size, duration = media_objects.get(key) or (0, None)
+                    media_rows.append({"key": key, "refcount": refcount, "size": size, "duration": duration})
+                self.session.execute(text(
+                    "INSERT INTO media_objects (key, refcount, size, is_uploaded, duration) "
+                    "VALUES (:key, :refcount, :size, true, :duration) "
+                    "ON CONFLICT (key) DO UPDATE SET refcount = media_objects.refcount + excluded.refcount, "
+                    "is_uploaded = true, duration = coalesce(media_objects.duration, excluded.duration)"
+                ), media_rows)
+            PostgresLoadManager(self.session).increase_catalogue_version()
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        finally:
+            for copy_file in self.copy_files.values():
+                copy_file.close()
+
+
+def import_catalogue(session, source: TextIO, media_copier: MediaCopier | None, skip_stats: bool) -> None:
+    importer = CatalogueImporter(session, media_copier, skip_stats)
+    try:
+        importer.read(source)
+    finally:
+        # The copies are waited for even if the reading failed, so no thread outlives the tool
+        media_objects = media_copier.wait() if media_copier is not None else dict()
+    importer.write(media_objects)
+    logger.info("Imported %s excursions, %s points and %s media references", len(importer.excursion_ids),
+                len(importer.point_ids), sum(importer.media_references.values()))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Export the catalogue to NDJSON")
+    export_parser.add_argument("path", help="Output file, - for stdout")
+    import_parser = subparsers.add_parser("import", help="Import the catalogue from NDJSON")
+    import_parser.add_argument("path", help="Input file, - for stdin")
+    import_parser.add_argument("--source-bucket", default=BUCKET_NAME,
+                               help="Bucket of the exported media, by default the target one")
+    import_parser.add_argument("--source-endpoint-url", default=ENDPOINT_URL, help="S3 endpoint of the source bucket")
+    import_parser.add_argument("--workers", type=int, default=8, help="Concurrent media copies")
+    import_parser.add_argument("--skip-media", action="store_true", help="Do not check nor copy the media")
+    import_parser.add_argument("--skip-stats", action="store_true",
+                               help="Reset the views, likes and visitors, e.g. when moving from staging")
+    args = parser.parse_args()
+
+    from src.database.session import create_session
+    session = create_session(check_schema=False)
+    try:
+        if args.command == "export":
+            with (open(args.path, "w", encoding="utf-8") if args.path != "-" else sys.stdout) as output:
+                rows_num = export_catalogue(session, output)
+            logger.info("Exported %s rows", rows_num)
+        else:
+            media_copier = None if args.skip_media else MediaCopier(args.source_bucket, args.source_endpoint_url,
+                                                                    args.workers)
+            with (open(args.path, encoding="utf-8") if args.path != "-" else sys.stdin) as source:
+                import_catalogue(session, source, media_copier, args.skip_stats)
+    # The errors of the raw DBAPI cursor of the COPY are not wrapped by SQLAlchemy
+    except (OSError, ValueError, SQLAlchemyError, psycopg2.Error, ClientError, BotoCoreError) as e:
+        logger.error("Catalogue %s failed: %s", args.command, e)
+        return 1
+    finally:
+        session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())